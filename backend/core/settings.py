@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'inventory',
@@ -45,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -90,6 +93,28 @@ DATABASES = {
 }
 
 
+# Caches
+# 'default' is the per-process tier; 'shared' is visible to every worker and
+# holds the catalog cache version stamps (see inventory/cache.py).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'inventory-local',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+        'TIMEOUT': 300,
+        # Culling deletes files at random, version stamps included, so keep
+        # it well above what the catalog needs.
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -136,3 +161,36 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
     "http://localhost:5173", # Vite default (just in case)
 ]
+
+# Files produced by background jobs (e.g. async exports), see inventory/jobs.py.
+# run_jobs deletes them JOB_FILES_MAX_AGE after they were written.
+JOB_FILES_DIR = BASE_DIR / 'job_files'
+JOB_FILES_MAX_AGE = timedelta(days=7)
+
+# Detached StockLedger partitions, see inventory/partitions.py.
+LEDGER_ARCHIVE_DIR = BASE_DIR / 'ledger_archive'
+
+# Requests slower than this are kept, with their SQL, in the last
+# SLOW_REQUEST_BUFFER entries of /api/slow-requests/ (see inventory/metrics.py).
+SLOW_REQUEST_MS = 500
+SLOW_REQUEST_BUFFER = 50
+
+# How often each process reads the ledger for postings made by other
+# processes, while /api/stock/events/ has listeners (see inventory/events.py).
+STOCK_EVENTS_POLL_SECONDS = 1
+
+# Token authentication cache (see inventory/authentication.py). Set
+# AUTH_TOKEN_EXPIRY to a timedelta to make tokens expire.
+AUTH_TOKEN_CACHE_SIZE = 1024
+AUTH_TOKEN_CACHE_TTL = 300
+AUTH_TOKEN_EXPIRY = None
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'inventory.authentication.CachedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    # Quantities are DecimalFields; keep them JSON numbers for the frontend.
+    'COERCE_DECIMAL_TO_STRING': False,
+}
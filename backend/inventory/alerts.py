@@ -0,0 +1,68 @@
+"""
+Low stock flags and the threshold-crossing outbox.
+
+Stock.is_low_stock mirrors `quantity < product.low_stock_threshold` and is
+re-derived only for the rows a write touched, in a single UPDATE ... RETURNING
+that hands back just the rows whose flag flipped. Each flip moves the
+low_stock_items KPI and is recorded as a LowStockEvent in the same
+transaction, so notification consumers read a small outbox instead of
+scanning Stock.
+"""
+from django.db import connection
+
+from .cache import bump_tables
+from .kpis import adjust_kpis
+from .models import LowStockEvent, Product, Stock
+
+
+def refresh_low_stock(keys=None, products=None):
+    """
+    Re-derives is_low_stock for the Stock rows of the given
+    (product_id, warehouse_id) `keys` and/or `products`, or for every row when
+    neither is given. Returns the LowStockEvents created for rows that crossed
+    their threshold.
+    """
+    stock = connection.ops.quote_name(Stock._meta.db_table)
+    product = connection.ops.quote_name(Product._meta.db_table)
+    conditions, params = [], []
+    if keys is not None:
+        keys = sorted(set(keys))
+        if not keys:
+            return []
+        conditions.append(f'({stock}.product_id, {stock}.warehouse_id) IN ({", ".join(["(%s, %s)"] * len(keys))})')
+        params.extend(value for key in keys for value in key)
+    if products is not None:
+        products = sorted(set(products))
+        if not products:
+            return []
+        conditions.append(f'{stock}.product_id IN ({", ".join(["%s"] * len(products))})')
+        params.extend(products)
+
+    sql = (
+        f'UPDATE {stock} SET is_low_stock = NOT {stock}.is_low_stock '
+        f'FROM {product} '
+        f'WHERE {product}.id = {stock}.product_id '
+        f'AND {stock}.is_low_stock <> ({stock}.quantity < {product}.low_stock_threshold) '
+        + ''.join(f'AND {condition} ' for condition in conditions) +
+        f'RETURNING {stock}.product_id, {stock}.warehouse_id, {stock}.quantity, '
+        f'{product}.low_stock_threshold, {stock}.is_low_stock'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        flipped = cursor.fetchall()
+    if not flipped:
+        return []
+
+    events = [
+        LowStockEvent(
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            kind=LowStockEvent.LOW if is_low else LowStockEvent.RECOVERED,
+            quantity=quantity,
+            threshold=threshold,
+        )
+        for product_id, warehouse_id, quantity, threshold, is_low in sorted(flipped)
+    ]
+    adjust_kpis(low_stock_items=sum(1 if event.kind == LowStockEvent.LOW else -1 for event in events))
+    bump_tables(Stock, LowStockEvent)
+    return LowStockEvent.objects.bulk_create(events)
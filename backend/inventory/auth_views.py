@@ -1,11 +1,12 @@
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
-from rest_framework.authtoken.models import Token
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 
+from .authentication import issue_token
+
 @api_view(['POST'])
 @permission_classes([AllowAny]) # Allow anyone to access this
 def signup(request):
@@ -20,7 +21,7 @@ def signup(request):
         return Response({'error': 'Username already taken'}, status=status.HTTP_400_BAD_REQUEST)
 
     user = User.objects.create_user(username=username, password=password, email=email)
-    token, _ = Token.objects.get_or_create(user=user)
+    token = issue_token(user)
 
     return Response({
         'token': token.key,
@@ -40,11 +41,20 @@ def login(request):
     if not user:
         return Response({'error': 'Invalid Credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
-    token, _ = Token.objects.get_or_create(user=user)
+    token = issue_token(user)
 
     return Response({
         'token': token.key,
         'user_id': user.id,
         'username': user.username,
         'role': 'Manager' # Hardcoded for hackathon demo
-    })
\ No newline at end of file
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout(request):
+    # Revokes the token the request was made with (and evicts it from every
+    # worker's token cache).
+    if request.auth is not None:
+        request.auth.delete()
+    return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,132 @@
+"""
+Token authentication without a database hit per request.
+
+DRF's TokenAuthentication joins Token and User on every request. Here the
+result is kept in a bounded per-process LRU for AUTH_TOKEN_CACHE_TTL
+seconds, so hot paths authenticate with no queries. Revoking tokens (logout,
+password change, deactivation or deletion of the user) deletes the Token
+rows, which evicts them locally and bumps the 'token' version stamp in the
+shared cache (see inventory/cache.py); entries cached under an older stamp
+are dropped by every process on their next use. With AUTH_TOKEN_EXPIRY set,
+tokens older than that are refused and replaced on the next login.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import bump_tables, get_version, table_namespace
+
+User = get_user_model()
+
+
+class TokenCache:
+    """A thread-safe LRU of token key -> (user, token, version, cached_at)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, token, cached_version, cached_at = entry
+            if cached_version != version or time.monotonic() - cached_at > settings.AUTH_TOKEN_CACHE_TTL:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user, token
+
+    def put(self, key, user, token, version):
+        with self._lock:
+            self._entries[key] = (user, token, version, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE)
+
+
+def token_expired(token):
+    expiry = settings.AUTH_TOKEN_EXPIRY
+    return expiry is not None and token.created < timezone.now() - expiry
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """`Authorization: Token <key>`, served from the token cache when possible."""
+
+    def authenticate_credentials(self, key):
+        version = get_version(table_namespace(Token))
+        cached = token_cache.get(key, version)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.put(key, user, token, version)
+        else:
+            user, token = cached
+        if token_expired(token):
+            raise exceptions.AuthenticationFailed("Token has expired.")
+        # Requests may annotate request.user; keep the cached instance clean.
+        return copy.copy(user), token
+
+
+def issue_token(user):
+    """The user's token, replacing an expired one. Also warms the token cache."""
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and token_expired(token):
+        token.delete()
+        token = Token.objects.create(user=user)
+    token_cache.put(token.key, user, token, get_version(table_namespace(Token)))
+    return token
+
+
+def revoke_tokens(user):
+    """Deletes the user's tokens; the post_delete handler evicts them everywhere."""
+    Token.objects.filter(user=user).delete()
+
+
+@receiver(post_delete, sender=Token, dispatch_uid='inventory.authentication.evict_token')
+def evict_token(sender, instance, **kwargs):
+    token_cache.evict(instance.key)
+    bump_tables(Token)
+
+
+CREDENTIAL_FIELDS = ('password', 'is_active')
+
+
+@receiver(post_init, sender=User, dispatch_uid='inventory.authentication.remember_credentials')
+def remember_credentials(sender, instance, **kwargs):
+    # Only loaded fields are compared, so deferring one never looks like a change.
+    instance._loaded_credentials = {
+        field: instance.__dict__[field] for field in CREDENTIAL_FIELDS if field in instance.__dict__
+    } if instance.pk else {}
+
+
+@receiver(post_save, sender=User, dispatch_uid='inventory.authentication.revoke_on_credentials_change')
+def revoke_on_credentials_change(sender, instance, created, **kwargs):
+    if not created and any(getattr(instance, field) != value for field, value in instance._loaded_credentials.items()):
+        revoke_tokens(instance)
+    instance._loaded_credentials = {field: getattr(instance, field) for field in CREDENTIAL_FIELDS}
@@ -0,0 +1,231 @@
+"""
+Synthetic data and timed scenarios for the hot API paths.
+
+generate() fills the database with a reproducible data set (seeded random
+counts of warehouses, products, stock rows, ledger rows and draft
+documents); run_scenarios() drives the API through the test client against
+it and reports latency percentiles and the largest query count per call.
+Each scenario has a query budget that must not depend on the data size, so
+a run also catches N+1 regressions. `manage.py benchmark` wraps both, rolls
+the data back afterwards and writes the results as JSON to compare runs
+across commits.
+"""
+import random
+import statistics
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .cache import bump_tables
+from .kpis import rebuild_kpis
+from .models import (
+    Warehouse, ProductCategory, Product,
+    Receipt, ReceiptItem, DeliveryOrder, DeliveryItem, InternalTransfer, TransferItem
+)
+from .posting import Movement, post_movements
+
+POSTING_CHUNK = 1000
+
+
+@dataclass
+class DataSet:
+    warehouses: list
+    products: list
+    pairs: list
+    receipts: list
+    deliveries: list
+    transfers: list
+
+
+def generate(warehouses=5, products=1000, stock=2000, ledger=10000, documents=50, lines=10, seed=0):
+    """
+    Creates the data set and returns the ids the scenarios need. Stock rows
+    and ledger rows come from posted adjustments, so quantities, balances and
+    KPIs stay consistent; documents are left in draft with `lines` lines each.
+    """
+    rng = random.Random(seed)
+    tag = f"BENCH{seed}-{rng.randrange(16 ** 6):06x}"
+
+    category_objects = ProductCategory.objects.bulk_create(
+        ProductCategory(name=f"{tag} category {n}") for n in range(10)
+    )
+    warehouse_objects = Warehouse.objects.bulk_create(
+        Warehouse(name=f"{tag} warehouse {n}", location=f"Aisle {n}") for n in range(warehouses)
+    )
+    product_objects = Product.objects.bulk_create(
+        Product(
+            name=f"{tag} product {n}",
+            sku=f"{tag}-{n:06d}",
+            unit='pcs',
+            category=rng.choice(category_objects),
+            low_stock_threshold=rng.randint(0, 20),
+        )
+        for n in range(products)
+    )
+    bump_tables(ProductCategory, Warehouse, Product)
+
+    warehouse_ids = [warehouse.pk for warehouse in warehouse_objects]
+    product_ids = [product.pk for product in product_objects]
+    stock = min(stock, len(product_ids) * len(warehouse_ids))
+    pairs = rng.sample([(p, w) for p in product_ids for w in warehouse_ids], stock)
+
+    # One opening balance per pair, then random adjustments until the ledger
+    # has the requested number of rows.
+    movements = [Movement(p, w, rng.randint(500, 1000), 'Adjustment', 0) for p, w in pairs]
+    movements += [
+        Movement(*rng.choice(pairs), rng.randint(1, 50), 'Adjustment', 0)
+        for _ in range(max(ledger - len(pairs), 0))
+    ]
+    for start in range(0, len(movements), POSTING_CHUNK):
+        post_movements(movements[start:start + POSTING_CHUNK])
+
+    # Outgoing lines only use products stocked in the warehouse they leave.
+    stocked = {}
+    for product_id, warehouse_id in pairs:
+        stocked.setdefault(warehouse_id, []).append(product_id)
+    source = max(stocked, key=lambda warehouse_id: len(stocked[warehouse_id]))
+    destination = next((w for w in warehouse_ids if w != source), source)
+
+    def drafts(model, item_model, parent, build, products):
+        headers = model.objects.bulk_create(build(n) for n in range(documents))
+        item_model.objects.bulk_create(
+            item_model(**{parent: header}, product_id=rng.choice(products), quantity=rng.randint(1, 5))
+            for header in headers for _ in range(lines)
+        )
+        return [header.pk for header in headers]
+
+    receipts = drafts(Receipt, ReceiptItem, 'receipt', lambda n: Receipt(
+        supplier=f"{tag} supplier {n}", warehouse_id=rng.choice(warehouse_ids)), product_ids)
+    deliveries = drafts(DeliveryOrder, DeliveryItem, 'delivery', lambda n: DeliveryOrder(
+        customer=f"{tag} customer {n}", warehouse_id=source), stocked[source])
+    transfers = drafts(InternalTransfer, TransferItem, 'transfer', lambda n: InternalTransfer(
+        from_warehouse_id=source, to_warehouse_id=destination), stocked[source])
+    bump_tables(Receipt, ReceiptItem, DeliveryOrder, DeliveryItem, InternalTransfer, TransferItem)
+
+    # bulk_create skipped the signals that keep the dashboard counters.
+    rebuild_kpis()
+    return DataSet(warehouse_ids, product_ids, pairs, receipts, deliveries, transfers)
+
+
+# --- Scenarios ---
+# A scenario takes (client, data) and returns the call to time; the call may
+# keep state between repeats and raises StopIteration when it runs out of work.
+
+SCENARIOS = {}
+
+
+def scenario(name, query_budget):
+    def register(function):
+        SCENARIOS[name] = (function, query_budget)
+        return function
+    return register
+
+
+def _validate_each(client, resource, ids):
+    remaining = iter(ids)
+    return lambda: client.post(f'/api/{resource}/{next(remaining)}/validate/')
+
+
+@scenario('validate_receipt', query_budget=16)
+def validate_receipt(client, data):
+    return _validate_each(client, 'receipts', data.receipts)
+
+
+@scenario('validate_delivery', query_budget=16)
+def validate_delivery(client, data):
+    return _validate_each(client, 'deliveries', data.deliveries)
+
+
+@scenario('validate_transfer', query_budget=16)
+def validate_transfer(client, data):
+    return _validate_each(client, 'transfers', data.transfers)
+
+
+@scenario('stock_list', query_budget=1)
+def stock_list(client, data):
+    return lambda: client.get('/api/stock/')
+
+
+@scenario('ledger_paging', query_budget=1)
+def ledger_paging(client, data):
+    """Walks the ledger a page at a time, starting over after the last page."""
+    first = '/api/ledger/?page_size=100'
+    state = {'url': first}
+
+    def page():
+        response = client.get(state['url'])
+        state['url'] = response.json().get('next') or first
+        return response
+    return page
+
+
+@scenario('dashboard', query_budget=1)
+def dashboard(client, data):
+    return lambda: client.get('/api/dashboard/')
+
+
+@scenario('operations_overview', query_budget=2)
+def operations_overview(client, data):
+    return lambda: client.get('/api/dashboard/operations-overview/')
+
+
+@scenario('inventory_composition', query_budget=1)
+def inventory_composition(client, data):
+    return lambda: client.get('/api/dashboard/inventory-composition/')
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenarios(data, names=None, repeat=20):
+    """
+    Runs each scenario `repeat` times and returns {name: result}, where a
+    result has latency percentiles in milliseconds, the largest query count
+    of any call and whether that stayed within the scenario's budget.
+    """
+    results = {}
+    client = Client()
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for name in names or SCENARIOS:
+            function, budget = SCENARIOS[name]
+            call = function(client, data)
+            timings, queries, errors = [], [], []
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    try:
+                        response = call()
+                    except StopIteration:
+                        break
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(len(captured))
+                if response.status_code >= 400:
+                    errors.append(f"{response.status_code}: {response.content[:200].decode(errors='replace')}")
+
+            results[name] = {
+                'calls': len(timings),
+                'errors': errors,
+                'min_ms': round(min(timings), 3) if timings else None,
+                'median_ms': round(statistics.median(timings), 3) if timings else None,
+                'p95_ms': round(_percentile(timings, 0.95), 3) if timings else None,
+                'max_ms': round(max(timings), 3) if timings else None,
+                'max_queries': max(queries, default=0),
+                'query_budget': budget,
+                'within_budget': max(queries, default=0) <= budget,
+            }
+    return results
+
+
+def compare(baseline, results):
+    """Yields (scenario, baseline median, new median, change in percent) for scenarios in both runs."""
+    for name, result in results.items():
+        before = baseline.get(name, {}).get('median_ms')
+        after = result['median_ms']
+        if before and after is not None:
+            yield name, before, after, round((after - before) / before * 100, 1)
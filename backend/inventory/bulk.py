@@ -0,0 +1,330 @@
+"""
+Streaming bulk import for the catalog and opening stock.
+
+Input is read row by row from CSV or JSONL and processed in fixed-size chunks,
+so memory use depends on the chunk size rather than the file size. Each chunk
+is validated in a handful of queries, upserted with bulk_create keyed on
+Product.sku, and any opening quantities are posted through the regular stock
+posting engine so Stock and StockLedger stay in step. An opening quantity is
+what the pair should hold, and only the difference is posted, so importing
+the same file again (or resuming after a failed chunk) changes nothing.
+"""
+import csv
+import io
+import json
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+
+from .cache import bump_tables
+from .alerts import refresh_low_stock
+from .kpis import adjust_kpis
+from .models import QUANTITY_PLACES, Product, ProductCategory, Warehouse
+from .posting import Movement, lock_stock, post_movements
+
+OPENING_SOURCE = 'Opening Stock'
+DEFAULT_THRESHOLD = Product._meta.get_field('low_stock_threshold').default
+MAX_LENGTHS = {
+    'sku': Product._meta.get_field('sku').max_length,
+    'name': Product._meta.get_field('name').max_length,
+    'unit': Product._meta.get_field('unit').max_length,
+    'category': ProductCategory._meta.get_field('name').max_length,
+}
+
+
+def read_rows(stream, file_format):
+    """
+    Yields (line_number, row_dict) from a binary or text stream in CSV or
+    JSONL format. Malformed JSONL lines are yielded as None so they can be
+    reported instead of aborting the import.
+    """
+    if isinstance(stream, (io.TextIOBase, io.StringIO)):
+        text = stream
+    else:
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'jsonl':
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"Unsupported format: {file_format}")
+
+
+def detect_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _text(row, field):
+    value = row.get(field)
+    return str(value).strip() if value is not None else ''
+
+
+def _number(row, field, errors, cast=Decimal):
+    value = _text(row, field)
+    if not value:
+        return None
+    try:
+        number = cast(value)
+    except (ValueError, ArithmeticError):
+        errors[field] = "Must be a number."
+        return None
+    if isinstance(number, Decimal):
+        if not number.is_finite():
+            errors[field] = "Must be a number."
+            return None
+        if number.as_tuple().exponent < -QUANTITY_PLACES:
+            errors[field] = f"Ensure there are no more than {QUANTITY_PLACES} decimal places."
+    if number < 0:
+        errors[field] = "Must not be negative."
+    return number
+
+
+class ImportReport:
+    """Counts for one import; errors are streamed to `on_error` as they happen."""
+
+    def __init__(self, on_error=None):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.opening_lines = 0
+        self.error_count = 0
+        self.on_error = on_error
+
+    def error(self, line, errors, sku=''):
+        self.error_count += 1
+        if self.on_error:
+            self.on_error({'row': line, 'sku': sku, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'opening_lines': self.opening_lines,
+            'errors': self.error_count,
+        }
+
+
+class _Lookups:
+    """Category and warehouse lookups cached across chunks of one import."""
+
+    def __init__(self):
+        self.categories = {}
+        self.warehouses = {}
+        self.opened = set()  # (sku, warehouse_id) pairs given opening stock
+
+    def resolve_warehouses(self, refs):
+        missing = {ref for ref in refs if ref not in self.warehouses}
+        if not missing:
+            return
+        ids = {ref for ref in missing if ref.isdigit()}
+        for pk in Warehouse.objects.filter(pk__in=ids).values_list('id', flat=True):
+            self.warehouses[str(pk)] = pk
+        names = missing - ids
+        for pk, name in Warehouse.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+            self.warehouses[name] = pk
+
+    def resolve_categories(self, names):
+        missing = {name for name in names if name not in self.categories}
+        if not missing:
+            return
+        for pk, name in ProductCategory.objects.filter(name__in=missing).order_by('-id').values_list('id', 'name'):
+            self.categories[name] = pk
+        new = [ProductCategory(name=name) for name in missing if name not in self.categories]
+        for category in ProductCategory.objects.bulk_create(new):
+            self.categories[category.name] = category.pk
+
+
+def _opening_stock(row, errors, lookups):
+    """Returns (warehouse_id, quantity) for a row's opening stock, or None."""
+    quantity = _number(row, 'quantity', errors)
+    warehouse = _text(row, 'warehouse')
+    if quantity is None and not warehouse:
+        return None
+    if quantity is None:
+        errors['quantity'] = "Required when a warehouse is given."
+    elif not warehouse:
+        errors['warehouse'] = "Required when a quantity is given."
+    elif warehouse not in lookups.warehouses:
+        errors['warehouse'] = f"Unknown warehouse '{warehouse}'."
+    if errors:
+        return None
+    return lookups.warehouses[warehouse], quantity
+
+
+def _post_opening(openings):
+    """
+    Brings each (product_id, warehouse_id) pair of `openings` to its quantity,
+    posting the difference like a stock count does. Returns the movements.
+    """
+    with transaction.atomic():
+        current = lock_stock(openings, create=True)
+        movements = [
+            Movement(key[0], key[1], quantity - current[key], OPENING_SOURCE, key[0])
+            for key, quantity in openings.items() if quantity != current[key]
+        ]
+        post_movements(movements, honour_reservations=False)
+    return movements
+
+
+def _claim_opening(sku, opening, lookups, errors):
+    """Records a row's opening stock; a second row for the same pair in one import is an error."""
+    key = (sku, opening[0])
+    if key in lookups.opened:
+        errors['warehouse'] = "Opening stock for this SKU and warehouse was already given."
+    else:
+        lookups.opened.add(key)
+
+
+def _import_product_chunk(chunk, report, lookups):
+    valid = {}
+    lookups.resolve_warehouses({_text(row, 'warehouse') for _, row in chunk if row and _text(row, 'warehouse')})
+    lookups.resolve_categories({_text(row, 'category') for _, row in chunk if row and _text(row, 'category')})
+
+    for line, row in chunk:
+        report.rows += 1
+        if row is None:
+            report.error(line, {'row': "Not a JSON object."})
+            continue
+        errors = {}
+        sku = _text(row, 'sku')
+        for field in ('sku', 'name', 'unit'):
+            if not _text(row, field):
+                errors[field] = "This field is required."
+        for field, limit in MAX_LENGTHS.items():
+            if len(_text(row, field)) > limit:
+                errors[field] = f"Ensure this field has no more than {limit} characters."
+        threshold = _number(row, 'low_stock_threshold', errors, cast=int)
+        opening = _opening_stock(row, errors, lookups)
+        if sku in valid:
+            errors['sku'] = "Duplicate SKU in the same batch."
+        if opening and not errors:
+            _claim_opening(sku, opening, lookups, errors)
+        if errors:
+            report.error(line, errors, sku)
+            continue
+        valid[sku] = (row, threshold, opening)
+
+    if not valid:
+        return
+
+    existing = {
+        sku: (pk, threshold) for sku, pk, threshold in
+        Product.objects.filter(sku__in=valid).values_list('sku', 'id', 'low_stock_threshold')
+    }
+    products = []
+    for sku, (row, threshold, _) in valid.items():
+        category = _text(row, 'category')
+        if threshold is None:
+            threshold = existing[sku][1] if sku in existing else DEFAULT_THRESHOLD
+        products.append(Product(
+            sku=sku,
+            name=_text(row, 'name'),
+            unit=_text(row, 'unit'),
+            category_id=lookups.categories.get(category) if category else None,
+            low_stock_threshold=threshold,
+        ))
+
+    with transaction.atomic():
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=['name', 'unit', 'category', 'low_stock_threshold', 'updated_at'],
+        )
+        ids = {product.sku: product.pk for product in products}
+
+        # bulk_create skips model signals, so keep the dashboard KPIs and the
+        # catalog cache current here.
+        bump_tables(Product, ProductCategory)
+        created = len(valid) - len(existing)
+        adjust_kpis(total_products=created)
+        refresh_low_stock(products=[
+            existing[product.sku][0] for product in products
+            if product.sku in existing and existing[product.sku][1] != product.low_stock_threshold
+        ])
+
+        movements = _post_opening({
+            (ids[sku], opening[0]): opening[1] for sku, (_, _, opening) in valid.items() if opening
+        })
+
+    report.created += created
+    report.updated += len(existing)
+    report.opening_lines += len(movements)
+
+
+def _import_stock_chunk(chunk, report, lookups):
+    lookups.resolve_warehouses({_text(row, 'warehouse') for _, row in chunk if row and _text(row, 'warehouse')})
+    skus = {_text(row, 'sku') for _, row in chunk if row}
+    products = dict(Product.objects.filter(sku__in=skus).values_list('sku', 'id'))
+
+    openings = {}
+    for line, row in chunk:
+        report.rows += 1
+        if row is None:
+            report.error(line, {'row': "Not a JSON object."})
+            continue
+        errors = {}
+        sku = _text(row, 'sku')
+        if sku not in products:
+            errors['sku'] = f"Unknown SKU '{sku}'." if sku else "This field is required."
+        opening = _opening_stock(row, errors, lookups)
+        if opening is None and not errors:
+            errors['quantity'] = "This field is required."
+        if not errors:
+            _claim_opening(sku, opening, lookups, errors)
+        if errors:
+            report.error(line, errors, sku)
+            continue
+        openings[(products[sku], opening[0])] = opening[1]
+
+    movements = _post_opening(openings)
+    report.opening_lines += len(movements)
+
+
+def import_products(rows, chunk_size=1000, on_error=None):
+    """
+    Upserts products from (line_number, row) pairs. Rows carry sku, name, unit
+    and optionally category (by name, created if missing), low_stock_threshold,
+    and warehouse (id or name) + quantity for opening stock.
+    """
+    report, lookups = ImportReport(on_error), _Lookups()
+    for chunk in chunked(rows, chunk_size):
+        _import_product_chunk(chunk, report, lookups)
+    return report
+
+
+def import_stock(rows, chunk_size=1000, on_error=None):
+    """
+    Sets opening stock from rows of sku, warehouse (id or name) and quantity,
+    at most one row per pair.
+    """
+    report, lookups = ImportReport(on_error), _Lookups()
+    for chunk in chunked(rows, chunk_size):
+        _import_stock_chunk(chunk, report, lookups)
+    return report
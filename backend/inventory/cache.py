@@ -0,0 +1,131 @@
+"""
+Per-table version stamps and the read-through cache built on them.
+
+Every table the API serves has a version stamp in the 'shared' cache that
+every worker can see (file based, so no external service is needed). Model
+signals bump a table's stamp whenever a row changes; code that writes with raw
+SQL, bulk_create() or update() bumps it explicitly. A bump stores a fresh
+random stamp in a single write: the file-based cache's incr() is a read then
+a write, so two concurrent increments could land on the same number and one
+change would go unnoticed. The stamps drive both the
+ETags of list/detail responses and the catalog cache, where the per-process
+'default' cache (local memory) sits in front of the shared one: entries are
+keyed by the stamps they were built from, so a bump makes every older entry
+unreachable in every process at once.
+"""
+import hashlib
+import threading
+import uuid
+from collections import defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+KEY_PREFIX = 'catalog'
+
+_stats = defaultdict(lambda: {'local_hits': 0, 'shared_hits': 0, 'misses': 0})
+_stats_lock = threading.Lock()
+
+
+def _local():
+    return caches['default']
+
+
+def _shared():
+    return caches['shared']
+
+
+def _version_key(namespace):
+    return f'{KEY_PREFIX}:version:{namespace}'
+
+
+def _new_version():
+    # Never reused, so neither a concurrent bump nor a wiped shared cache can
+    # hand out a version that older local entries were stored under.
+    return uuid.uuid4().hex
+
+
+def table_namespace(model):
+    """The version namespace of a model's table."""
+    return model._meta.model_name
+
+
+def get_version(name):
+    key = _version_key(name)
+    version = _shared().get(key)
+    if version is None:
+        _shared().add(key, _new_version(), timeout=None)
+        version = _shared().get(key)
+    return version
+
+
+def get_versions(namespaces):
+    """Returns {namespace: version} for several namespaces in one cache read."""
+    namespaces = list(namespaces)
+    found = _shared().get_many([_version_key(name) for name in namespaces])
+    return {
+        name: found[_version_key(name)] if _version_key(name) in found else get_version(name)
+        for name in namespaces
+    }
+
+
+def _bump(name):
+    _shared().set(_version_key(name), _new_version(), timeout=None)
+
+
+def bump_version(*namespaces):
+    """
+    Invalidates everything cached for `namespaces`. The stamp is bumped now
+    and again on commit, so a reader can't cache pre-commit data under the new
+    version while the writing transaction is still open.
+    """
+    for name in namespaces:
+        _bump(name)
+    transaction.on_commit(lambda: [_bump(name) for name in namespaces])
+
+
+def bump_tables(*models):
+    """bump_version() for the tables of `models`."""
+    bump_version(*[table_namespace(model) for model in models])
+
+
+def _record(name, outcome):
+    with _stats_lock:
+        _stats[name][outcome] += 1
+
+
+def get_or_compute(namespaces, key, compute, timeout=DEFAULT_TIMEOUT):
+    """
+    Returns the cached value for `key` under the current versions of
+    `namespaces`, computing and storing it in both tiers on a miss. Entries
+    expire after each cache's TIMEOUT unless `timeout` says otherwise, so
+    those orphaned by a bump don't linger until culled.
+    """
+    versions = '.'.join(f'{name}{version}' for name, version in get_versions(namespaces).items())
+    digest = hashlib.md5(f'{key}|{versions}'.encode()).hexdigest()
+    cache_key = f'{KEY_PREFIX}:{namespaces[0]}:{digest}'
+    stats_name = namespaces[0]
+
+    value = _local().get(cache_key)
+    if value is not None:
+        _record(stats_name, 'local_hits')
+        return value
+
+    value = _shared().get(cache_key)
+    if value is not None:
+        _record(stats_name, 'shared_hits')
+        _local().set(cache_key, value, timeout)
+        return value
+
+    _record(stats_name, 'misses')
+    value = compute()
+    _local().set(cache_key, value, timeout)
+    _shared().set(cache_key, value, timeout)
+    return value
+
+
+def cache_stats():
+    """Hit/miss counters of this process, per namespace."""
+    with _stats_lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
@@ -0,0 +1,117 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedTokenAuthentication
+from .events import broker, format_sse, ledger_event, ledger_tail, EVENT_FIELDS
+from .models import StockLedger
+
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+REPLAY_LIMIT = 1000
+RESYNC = "event: resync\ndata: {}\n\n"
+
+
+def parse_warehouses(request):
+    """?warehouse=1,2 or ?warehouse=1&warehouse=2 -> {1, 2}; None means all."""
+    values = [value for param in request.GET.getlist('warehouse') for value in param.split(',') if value.strip()]
+    if not values:
+        return None
+    return {int(value) for value in values}
+
+
+def authenticated_user(request):
+    """The user of the request's token, or of its session; None if neither."""
+    try:
+        credentials = CachedTokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    if credentials is not None:
+        return credentials[0]
+    return request.user if request.user.is_authenticated else None
+
+
+def _replay(last_id, warehouses):
+    """Ledger rows after `last_id`, or None if there are too many to replay."""
+    queryset = StockLedger.objects.filter(id__gt=last_id).order_by('id')
+    if warehouses is not None:
+        queryset = queryset.filter(warehouse_id__in=warehouses)
+    rows = list(queryset.values(*EVENT_FIELDS)[:REPLAY_LIMIT + 1])
+    if len(rows) > REPLAY_LIMIT:
+        return None
+    return [ledger_event(row) for row in rows]
+
+
+async def _event_stream(warehouses, last_id):
+    # Subscribe before replaying so nothing posted in between is missed;
+    # live events the replay already sent are skipped.
+    subscription = broker.subscribe(warehouses)
+    try:
+        await sync_to_async(ledger_tail.ensure_running)()
+        backlog = await sync_to_async(_replay)(last_id, warehouses) if last_id is not None else []
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        replayed = set()
+        if backlog is None:
+            yield RESYNC
+        else:
+            for event in backlog:
+                replayed.add(event['id'])
+                yield format_sse(event)
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if subscription.lagged:
+                # Events were dropped: tell the client to refetch, then start clean.
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.lagged = False
+                replayed.clear()
+                yield RESYNC
+                continue
+            if event is None or event['id'] in replayed:
+                continue
+            yield format_sse(event)
+    finally:
+        broker.unsubscribe(subscription)
+        ledger_tail.wake()
+
+
+async def stock_events(request):
+    """
+    Server-Sent Events stream of stock movements, one `stock` event per ledger
+    row, whichever process posted it. Filter with ?warehouse=<id>[,<id>...];
+    reconnecting clients send Last-Event-ID (or ?last_event_id=) to replay
+    what they missed. A `resync` event means the client fell too far behind
+    and should refetch.
+
+    It needs `Authorization: Token <key>` (or a logged-in session). The
+    stream is held open indefinitely, so it is only served under ASGI
+    (core.asgi:application).
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'The event stream needs an ASGI server (core.asgi:application).'}, status=501)
+    if await sync_to_async(authenticated_user)(request) is None:
+        response = JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+        response['WWW-Authenticate'] = 'Token'
+        return response
+
+    try:
+        warehouses = parse_warehouses(request)
+        last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return JsonResponse({'error': 'warehouse and Last-Event-ID must be integers.'}, status=400)
+
+    response = StreamingHttpResponse(_event_stream(warehouses, last_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,224 @@
+"""
+Live stock change feed.
+
+The posting engine publishes one event per StockLedger row once its
+transaction commits. Events go through an in-process broker to every open
+Server-Sent Events stream in the same process, so they arrive at once and the
+feed needs no external message broker. Postings made elsewhere (job workers,
+bulk imports, other server processes) never reach this broker, so while
+anyone is listening one LedgerTail thread per process polls the ledger for
+them and publishes them too; each row is published once either way.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import StockLedger
+from .replenishment import SAFETY_LAG
+
+logger = logging.getLogger(__name__)
+
+EVENT_FIELDS = ('id', 'product_id', 'warehouse_id', 'change', 'balance', 'source_type', 'source_id', 'created_at')
+
+
+def ledger_event(entry):
+    """The event payload for one StockLedger row (a model instance or a values() dict)."""
+    if not isinstance(entry, dict):
+        entry = {field: getattr(entry, field) for field in EVENT_FIELDS}
+    return {
+        'id': entry['id'],
+        'product': entry['product_id'],
+        'warehouse': entry['warehouse_id'],
+        'change': entry['change'],
+        'balance': entry['balance'],
+        'source_type': entry['source_type'],
+        'source_id': entry['source_id'],
+        'created_at': entry['created_at'],
+    }
+
+
+def format_sse(event, name='stock'):
+    data = json.dumps(event, cls=JSONEncoder)
+    return f"id: {event['id']}\nevent: {name}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """One listener's queue. `warehouses` is a set of ids, or None for all."""
+
+    def __init__(self, loop, warehouses, maxsize):
+        self.loop = loop
+        self.warehouses = warehouses
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.lagged = False
+
+    def wants(self, event):
+        return self.warehouses is None or event['warehouse'] in self.warehouses
+
+    def _deliver(self, event):
+        # Runs on the subscriber's loop. A listener that can't keep up is
+        # told to resync instead of holding an unbounded backlog.
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+    def _overflow(self):
+        self.lagged = True
+        if not self.queue.full():
+            self.queue.put_nowait(None)  # wakes the listener
+
+
+class Broker:
+    """
+    Fan-out of stock events to subscribers living on event loops.
+    publish() is thread-safe, so sync views running in worker threads can call
+    it directly.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, warehouses=None):
+        """Registers a listener on the running event loop."""
+        subscription = Subscription(asyncio.get_running_loop(), warehouses, self.maxsize)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            for event in events:
+                if subscription.wants(event):
+                    try:
+                        subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+                    except RuntimeError:
+                        # The loop has shut down under a dead connection.
+                        self.unsubscribe(subscription)
+                        break
+
+    def resync(self):
+        """Tells every subscriber to refetch, for changes too many to send one by one."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._overflow)
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+class LedgerTail:
+    """
+    Publishes ledger rows committed by other processes. One thread per
+    process polls every STOCK_EVENTS_POLL_SECONDS while the broker has
+    subscribers, however many streams are open, and stops when the last one
+    leaves.
+
+    Each poll reads the ids of the rows created since SAFETY_LAG before the
+    previous poll (a created_at range, so only the newest partition is
+    scanned) and fetches the ones not published yet. Ids are handed out at
+    insert, not at commit, so rows can commit below ids already published,
+    but like elsewhere no later than SAFETY_LAG after they were created.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._published = {}  # id -> created_at, for the rows still inside the window
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def ensure_running(self):
+        """Starts the thread if needed and waits until it knows what is already published."""
+        with self._lock:
+            if self._thread is None:
+                self._ready.clear()
+                self._thread = threading.Thread(target=self._run, name='ledger-tail', daemon=True)
+                self._thread.start()
+        self._ready.wait()
+
+    def wake(self):
+        """Polls now (and stops, if nobody is subscribed any more)."""
+        self._wake.set()
+
+    def claim(self, events):
+        """The events not published yet, which are from now on."""
+        with self._lock:
+            fresh = [event for event in events if event['id'] not in self._published]
+            for event in fresh:
+                self._published[event['id']] = event['created_at'] or timezone.now()
+        return fresh
+
+    def _window(self, since):
+        return StockLedger.objects.filter(created_at__gte=since - SAFETY_LAG)
+
+    def _run(self):
+        try:
+            last_poll = timezone.now()
+            try:
+                # Rows committed before anyone listened aren't news.
+                self.claim([{'id': pk, 'created_at': created_at}
+                            for pk, created_at in self._window(last_poll).values_list('id', 'created_at')])
+            finally:
+                self._ready.set()
+            while True:
+                self._wake.wait(settings.STOCK_EVENTS_POLL_SECONDS)
+                with self._lock:
+                    if not len(self.broker):
+                        self._thread = None
+                        return
+                    self._wake.clear()
+                try:
+                    last_poll = self._poll(last_poll)
+                except Exception:
+                    logger.exception("Polling the stock ledger failed")
+        finally:
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+            connection.close()
+
+    def _poll(self, last_poll):
+        started = timezone.now()
+        window = self._window(last_poll)
+        ids = set(window.values_list('id', flat=True))
+        with self._lock:
+            missing = ids - self._published.keys()
+            horizon = last_poll - SAFETY_LAG
+            self._published = {pk: created_at for pk, created_at in self._published.items() if created_at >= horizon}
+        if len(missing) > self.broker.maxsize:
+            # More than any listener could queue: fetching them would only end in a resync.
+            self.claim([{'id': pk, 'created_at': started} for pk in missing])
+            self.broker.resync()
+        elif missing:
+            rows = window.filter(id__in=missing).order_by('id').values(*EVENT_FIELDS)
+            self.broker.publish(self.claim([ledger_event(row) for row in rows]))
+        return started
+
+
+broker = Broker()
+ledger_tail = LedgerTail(broker)
+
+
+def publish_ledger(entries):
+    """Broadcasts freshly written StockLedger rows."""
+    if len(broker):
+        broker.publish(ledger_tail.claim([ledger_event(entry) for entry in entries]))
@@ -0,0 +1,243 @@
+"""
+Database-backed job queue.
+
+Slow requests (document validation, exports, replenishment refreshes) can be
+queued as Job rows and answered with 202 Accepted; `manage.py run_jobs`
+workers claim them with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+workers share the queue without an external broker and never run the same
+job twice. Failures that may be transient are retried with exponential
+backoff; business errors (ValidationError, missing rows) fail straight away.
+Files written by jobs are kept for JOB_FILES_MAX_AGE, then purge_files()
+(called by run_jobs) deletes them.
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+
+from .cache import bump_tables
+from .exports import iter_export
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+LEASE = timedelta(minutes=30)
+BACKOFF_BASE = timedelta(seconds=10)
+BACKOFF_MAX = timedelta(minutes=30)
+
+HANDLERS = {}
+
+
+class JobConflict(Exception):
+    """An idempotency key was reused for a different request."""
+
+
+class JobFailed(Exception):
+    """Raised by a handler to fail a job without retrying, keeping a result."""
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+def handler(kind):
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+def enqueue(kind, payload, idempotency_key=None, max_attempts=3, user=None):
+    """
+    Queues a job for `user` and returns it. With an idempotency key, the same
+    user repeating the same request gets the original job back instead of
+    queueing another; reusing the key for a different kind or payload raises
+    JobConflict. Keys are scoped per user (anonymous callers share one scope).
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    if idempotency_key is None:
+        job = Job.objects.create(kind=kind, payload=payload, max_attempts=max_attempts, created_by=user)
+        created = True
+    else:
+        job, created = Job.objects.get_or_create(
+            created_by=user,
+            idempotency_key=idempotency_key,
+            defaults={'kind': kind, 'payload': payload, 'max_attempts': max_attempts},
+        )
+        if not created and (job.kind, job.payload) != (kind, payload):
+            raise JobConflict("This Idempotency-Key was already used for a different request.")
+    if created:
+        bump_tables(Job)
+    return job
+
+
+def claim_next(worker):
+    """Locks the next due job (or one whose lease has expired) and marks it running."""
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            job = (
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(Q(status=Job.QUEUED, run_after__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now))
+                .order_by('run_after', 'id')
+                .first()
+            )
+            if job is None:
+                return None
+            if job.status == Job.RUNNING and job.attempts >= job.max_attempts:
+                # Its worker died on the last attempt.
+                _finish(job, Job.FAILED, error="Worker lease expired.", running_only=False)
+                continue
+            job.status = Job.RUNNING
+            job.attempts += 1
+            job.worker = worker
+            job.locked_until = now + LEASE
+            job.save(update_fields=['status', 'attempts', 'worker', 'locked_until', 'updated_at'])
+            bump_tables(Job)
+            return job
+
+
+def _finish(job, status, result=None, error='', run_after=None, running_only=True):
+    """Records the outcome, unless the job was reclaimed after its lease ran out."""
+    jobs = Job.objects.filter(pk=job.pk)
+    if running_only:
+        jobs = jobs.filter(status=Job.RUNNING, attempts=job.attempts)
+    now = timezone.now()
+    jobs.update(
+        status=status,
+        result=result,
+        error=error,
+        run_after=run_after or job.run_after,
+        locked_until=None,
+        finished_at=now if status in (Job.DONE, Job.FAILED) else None,
+        updated_at=now,
+    )
+    bump_tables(Job)
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def run_job(job):
+    function = HANDLERS.get(job.kind)
+    try:
+        if function is None:
+            raise JobFailed(f"Unknown job kind: {job.kind}")
+        result = function(job)
+    except JobFailed as e:
+        _finish(job, Job.FAILED, result=e.result, error=str(e))
+    except (ValidationError, ObjectDoesNotExist) as e:
+        _finish(job, Job.FAILED, error='; '.join(getattr(e, 'messages', [str(e)])))
+    except Exception as e:
+        logger.exception("Job %s (%s) failed on attempt %s", job.pk, job.kind, job.attempts)
+        if job.attempts < job.max_attempts:
+            _finish(job, Job.QUEUED, error=str(e), run_after=timezone.now() + backoff(job.attempts))
+        else:
+            _finish(job, Job.FAILED, error=str(e))
+    else:
+        _finish(job, Job.DONE, result=result)
+
+
+def purge_files(max_age=None):
+    """
+    Deletes the job files under JOB_FILES_DIR last written more than
+    `max_age` (default JOB_FILES_MAX_AGE) ago. Returns how many were deleted.
+    """
+    max_age = settings.JOB_FILES_MAX_AGE if max_age is None else max_age
+    cutoff = (timezone.now() - max_age).timestamp()
+    deleted = 0
+    try:
+        entries = list(os.scandir(settings.JOB_FILES_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue  # Another worker got there first.
+            deleted += 1
+    return deleted
+
+
+def run_pending(worker=None, limit=None, stop=None):
+    """Runs due jobs in this thread until the queue is empty, `limit` is hit or `stop` is set."""
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    done = 0
+    while (limit is None or done < limit) and not (stop and stop.is_set()):
+        job = claim_next(worker)
+        if job is None:
+            break
+        run_job(job)
+        done += 1
+    return done
+
+
+# --- Handlers ---
+
+@handler('validate')
+def validate_documents(job):
+    """Payload: {"receipts": [...], "deliveries": [...], "transfers": [...], "partial": false}."""
+    from .posting import validate_batch
+
+    payload = job.payload
+    validated, errors = validate_batch(
+        {kind: payload.get(kind) or [] for kind in ('receipts', 'deliveries', 'transfers')},
+        partial=payload.get('partial', False),
+    )
+    result = {'validated': validated, 'errors': errors}
+    if errors and not payload.get('partial', False):
+        raise JobFailed(errors[0]['error'], result)
+    return result
+
+
+@handler('export')
+def export_file(job):
+    """
+    Payload: {"resource": <router basename>, "file_format": "csv"|"ndjson",
+    "params": {query params}}. Writes the export under JOB_FILES_DIR.
+    """
+    from rest_framework.request import Request
+    from .urls import router
+
+    payload = job.payload
+    viewsets = {basename: viewset for _, viewset, basename in router.registry}
+    http_request = HttpRequest()
+    http_request.method = 'GET'
+    http_request.GET = QueryDict(mutable=True)
+    http_request.GET.update(payload.get('params') or {})
+    view = viewsets[payload['resource']](
+        request=Request(http_request), action='export', basename=payload['resource'], kwargs={}, format_kwarg=None,
+    )
+
+    directory = settings.JOB_FILES_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = f"job-{job.pk}-{payload['resource']}.{payload['file_format']}"
+    with open(os.path.join(directory, name), 'w', encoding='utf-8', newline='') as output:
+        for chunk in iter_export(view.get_export_queryset(), view.export_columns, payload['file_format']):
+            output.write(chunk)
+    return {'file': name}
+
+
+@handler('refresh_reorder_suggestions')
+def refresh_reorder_suggestions(job):
+    from .replenishment import refresh_suggestions
+
+    return {'recomputed': refresh_suggestions(full=job.payload.get('full', False))}
+
+
+@handler('roll_up_movements')
+def roll_up_movements(job):
+    from .rollups import roll_up
+
+    return {'chunks': roll_up()}
@@ -0,0 +1,67 @@
+"""
+Dashboard KPI store.
+
+The dashboard reads a single DashboardSummary row. Every code path that can
+move one of the counters (stock postings, status changes, product and stock
+edits) applies a delta to that row inside its own transaction, so the row is
+always as current as the data it summarizes. low_stock_items moves with the
+Stock.is_low_stock flags maintained by inventory/alerts.py.
+"""
+from django.db import models
+
+from .models import (
+    DashboardSummary, Product, Stock, Receipt, DeliveryOrder, InternalTransfer
+)
+
+SUMMARY_PK = 1
+
+KPI_FIELDS = (
+    'total_products',
+    'low_stock_items',
+    'pending_receipts',
+    'pending_deliveries',
+    'pending_transfers',
+)
+
+
+def compute_kpis():
+    """Counts every KPI from the live tables."""
+    return {
+        'total_products': Product.objects.count(),
+        'low_stock_items': Stock.objects.filter(
+            quantity__lt=models.F('product__low_stock_threshold')
+        ).count(),
+        'pending_receipts': Receipt.objects.filter(status=Receipt.DRAFT).count(),
+        'pending_deliveries': DeliveryOrder.objects.filter(status=DeliveryOrder.DRAFT).count(),
+        'pending_transfers': InternalTransfer.objects.filter(status=InternalTransfer.DRAFT).count(),
+    }
+
+
+def rebuild_kpis():
+    from .alerts import refresh_low_stock
+
+    # Re-derive any drifted low stock flags first so they agree with the counts.
+    refresh_low_stock()
+    counts = compute_kpis()
+    DashboardSummary.objects.update_or_create(pk=SUMMARY_PK, defaults=counts)
+    return counts
+
+
+def get_kpis():
+    """Returns the stored KPIs, rebuilding the row the first time it's needed."""
+    values = DashboardSummary.objects.filter(pk=SUMMARY_PK).values(*KPI_FIELDS).first()
+    if values is None:
+        return rebuild_kpis()
+    return values
+
+
+def adjust_kpis(**deltas):
+    """
+    Applies counter deltas in one UPDATE. A missing row is left alone; it will
+    be rebuilt from live counts on the next read.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        DashboardSummary.objects.filter(pk=SUMMARY_PK).update(
+            **{field: models.F(field) + delta for field, delta in deltas.items()}
+        )
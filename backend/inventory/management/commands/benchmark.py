@@ -0,0 +1,93 @@
+import json
+import platform
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from inventory import benchmark
+from inventory.cache import bump_tables
+from inventory.signals import VERSIONED_MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a synthetic data set, times the hot API paths against it and checks their query budgets. "
+        "The data is rolled back afterwards unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--warehouses', type=int, default=5)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--stock', type=int, default=2000, help="Stock rows (product/warehouse pairs).")
+        parser.add_argument('--ledger', type=int, default=10000, help="Ledger rows, at least one per stock row.")
+        parser.add_argument('--documents', type=int, default=50, help="Draft receipts, deliveries and transfers each.")
+        parser.add_argument('--lines', type=int, default=10, help="Lines per document.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=20, help="Calls per scenario.")
+        parser.add_argument(
+            '--scenario', action='append', choices=sorted(benchmark.SCENARIOS), dest='scenarios',
+            help="Run only this scenario (repeatable).",
+        )
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare', help="A previous --output file to compare medians against.")
+        parser.add_argument('--keep', action='store_true', help="Commit the generated data instead of rolling it back.")
+
+    def handle(self, *args, **options):
+        counts = {
+            name: options[name] for name in ('warehouses', 'products', 'stock', 'ledger', 'documents', 'lines')
+        }
+        try:
+            with transaction.atomic():
+                data = benchmark.generate(seed=options['seed'], **counts)
+                self.stdout.write(
+                    f"Generated {len(data.products)} products, {len(data.pairs)} stock rows "
+                    f"and {len(data.receipts) * 3} documents."
+                )
+                scenarios = benchmark.run_scenarios(data, options['scenarios'], options['repeat'])
+                if not options['keep']:
+                    transaction.set_rollback(True)
+        finally:
+            # Version stamps bumped inside a rolled back transaction would
+            # otherwise keep pointing at cache entries built from its data.
+            bump_tables(*VERSIONED_MODELS)
+
+        results = {
+            'started_at': timezone.now().isoformat(),
+            'commit': self.git_commit(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'counts': counts,
+            'repeat': options['repeat'],
+            'scenarios': scenarios,
+        }
+        for name, result in scenarios.items():
+            self.stdout.write(
+                f"{name:<24} median {result['median_ms']} ms  p95 {result['p95_ms']} ms  "
+                f"queries {result['max_queries']}/{result['query_budget']}  errors {len(result['errors'])}"
+            )
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as baseline:
+                previous = json.load(baseline)['scenarios']
+            for name, before, after, change in benchmark.compare(previous, scenarios):
+                self.stdout.write(f"{name:<24} {before} -> {after} ms ({change:+}%)")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}.")
+
+        failures = [name for name, result in scenarios.items() if result['errors'] or not result['within_budget']]
+        if failures:
+            raise CommandError(f"Over query budget or failing: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All scenarios within their query budgets."))
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,54 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.bulk import detect_format, import_products, import_stock, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk imports products (sku, name, unit, category, low_stock_threshold, warehouse, quantity) "
+        "or opening stock (sku, warehouse, quantity) from a CSV or JSONL file, streaming it in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['products', 'stock'])
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'jsonl'],
+                            help="Input format (default: from the file extension, else csv).")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--errors', help="Write rejected rows as JSONL to this file (default: stderr).")
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or detect_format(options['path'])
+        importer = import_products if options['kind'] == 'products' else import_stock
+
+        error_file = open(options['errors'], 'w') if options['errors'] else None
+        def report_error(error):
+            (error_file or self.stderr).write(json.dumps(error) + ('\n' if error_file else ''))
+
+        try:
+            if options['path'] == '-':
+                source = sys.stdin.buffer
+            else:
+                try:
+                    source = open(options['path'], 'rb')
+                except OSError as e:
+                    raise CommandError(str(e))
+            with source:
+                report = importer(
+                    read_rows(source, file_format),
+                    chunk_size=options['chunk_size'],
+                    on_error=report_error,
+                )
+        finally:
+            if error_file:
+                error_file.close()
+
+        summary = report.as_dict()
+        self.stdout.write(", ".join(f"{key}: {value}" for key, value in summary.items()))
+        if summary['errors']:
+            self.stdout.write(self.style.WARNING(f"{summary['errors']} rows were rejected."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Import finished without errors."))
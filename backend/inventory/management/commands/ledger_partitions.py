@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory import partitions, replenishment, rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the coming monthly StockLedger partitions and optionally archives old ones to gzipped CSV. "
+        "Schedule it (e.g. daily) so rows never have to fall back to the DEFAULT partition."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3, help="Partitions to keep ready past this month.")
+        parser.add_argument(
+            '--archive-keep-months', type=int, default=None,
+            help="Archive and drop partitions of months before the last N (including the current one).",
+        )
+        parser.add_argument('--archive-dir', default=None, help="Where archives go (default LEDGER_ARCHIVE_DIR).")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be archived.")
+
+    def handle(self, *args, **options):
+        created = [] if options['dry_run'] else partitions.ensure_partitions(options['months_ahead'])
+        for name in created:
+            self.stdout.write(f"Created {name}.")
+
+        keep = options['archive_keep_months']
+        if keep is None:
+            self.stdout.write(self.style.SUCCESS(f"{len(created)} partitions created."))
+            return
+        # Replenishment reads the last LOOKBACK_DAYS of consumption.
+        minimum = replenishment.LOOKBACK_DAYS // 30 + 2
+        if keep < minimum:
+            raise CommandError(f"--archive-keep-months must be at least {minimum}.")
+
+        if not options['dry_run']:
+            # Partitions are only archived once their rows are in DailyMovement.
+            chunks = rollups.roll_up()
+            self.stdout.write(f"Rolled up {chunks} ledger chunks.")
+
+        this_month = timezone.now().date().replace(day=1)
+        before = partitions.shift_month(this_month, -(keep - 1))
+        archived = partitions.archive_partitions(
+            before, options['archive_dir'] or settings.LEDGER_ARCHIVE_DIR, dry_run=options['dry_run'],
+        )
+        verb = "Would archive" if options['dry_run'] else "Archived"
+        for name, rows, path in archived:
+            self.stdout.write(f"{verb} {name} ({rows} rows) to {path}.")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(created)} partitions created, {len(archived)} {'to archive' if options['dry_run'] else 'archived'}."
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.kpis import compute_kpis, get_kpis, rebuild_kpis
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the dashboard KPI row from live counts, or checks it for drift with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Compare the stored KPIs with live counts without changing anything.",
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            counts = rebuild_kpis()
+            for field, value in counts.items():
+                self.stdout.write(f"{field}: {value}")
+            self.stdout.write(self.style.SUCCESS("Dashboard KPIs rebuilt."))
+            return
+
+        stored, live = get_kpis(), compute_kpis()
+        drift = {field: (stored[field], live[field]) for field in live if stored[field] != live[field]}
+        for field, (stored_value, live_value) in drift.items():
+            self.stdout.write(f"{field}: stored {stored_value}, live {live_value}")
+        if drift:
+            raise CommandError("Dashboard KPIs are out of sync; run rebuild_dashboard_kpis to fix them.")
+        self.stdout.write(self.style.SUCCESS("Dashboard KPIs match live counts."))
@@ -0,0 +1,32 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from inventory import replenishment
+
+
+class Command(BaseCommand):
+    help = (
+        "Refreshes reorder points and replenishment suggestions from ledger consumption. "
+        "Schedule it (e.g. every few minutes); only pairs with new ledger rows are recomputed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every pair, not just the changed ones.")
+        parser.add_argument('--lookback-days', type=int, default=replenishment.LOOKBACK_DAYS)
+        parser.add_argument('--lead-time-days', type=int, default=replenishment.LEAD_TIME_DAYS)
+        parser.add_argument('--review-days', type=int, default=replenishment.REVIEW_DAYS)
+        parser.add_argument(
+            '--service-factor', type=Decimal, default=replenishment.SERVICE_FACTOR,
+            help="Safety stock multiplier (z-score of the target service level).",
+        )
+
+    def handle(self, *args, **options):
+        count = replenishment.refresh_suggestions(
+            full=options['full'],
+            days=options['lookback_days'],
+            lead_time=options['lead_time_days'],
+            review=options['review_days'],
+            service_factor=options['service_factor'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Recomputed suggestions for {count} product/warehouse pairs."))
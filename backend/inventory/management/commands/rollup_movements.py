@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from inventory import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Folds new ledger rows into the daily movement rollup behind /api/movement-summary/. "
+        "Schedule it (e.g. every few minutes); --rebuild recomputes the rollup from the whole ledger."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=rollups.CHUNK_SIZE, help="Ledger rows per transaction.")
+        parser.add_argument('--max-chunks', type=int, default=None, help="Stop after this many chunks.")
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Empty the rollup first. Days in archived ledger partitions can't be rebuilt.",
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rollups.reset()
+            self.stdout.write("Rollup emptied; rebuilding from the ledger.")
+
+        def progress(last_id, high_water):
+            self.stdout.write(f"Rolled up through ledger #{last_id} of {high_water}.")
+
+        chunks = rollups.roll_up(options['chunk_size'], options['max_chunks'], progress)
+        self.stdout.write(self.style.SUCCESS(f"Processed {chunks} chunks."))
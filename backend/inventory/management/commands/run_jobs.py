@@ -0,0 +1,56 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from inventory.jobs import purge_files, run_pending
+
+PURGE_INTERVAL = 3600  # Seconds between sweeps of expired job files.
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs with a fixed number of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help="Jobs run at the same time (default 2).")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty instead of polling.")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+
+        def work():
+            try:
+                while not stop.is_set():
+                    if not run_pending(stop=stop) and options['burst']:
+                        break
+                    if options['burst']:
+                        continue
+                    stop.wait(options['poll_interval'])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, name=f"job-worker-{n}") for n in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Started {len(threads)} job workers.")
+        # Join with a timeout so the main thread stays responsive to signals,
+        # and sweeps expired job files every PURGE_INTERVAL while it waits.
+        last_purge = time.monotonic()
+        self.purge()
+        for thread in threads:
+            while thread.is_alive():
+                if time.monotonic() - last_purge >= PURGE_INTERVAL:
+                    last_purge = time.monotonic()
+                    self.purge()
+                thread.join(timeout=1)
+        self.stdout.write(self.style.SUCCESS("Job workers stopped."))
+
+    def purge(self):
+        purged = purge_files()
+        if purged:
+            self.stdout.write(f"Deleted {purged} expired job files.")
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from inventory.snapshots import prune_snapshots, take_snapshot
+
+
+class Command(BaseCommand):
+    help = "Checkpoints current Stock into a snapshot run. Schedule it (e.g. nightly) to keep /api/stock/as-of/ fast."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prune-days', type=int, default=None,
+            help="Also delete snapshot runs older than this many days (the latest run is always kept).",
+        )
+
+    def handle(self, *args, **options):
+        run = take_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"Snapshot #{run.id} taken at {run.taken_at:%Y-%m-%d %H:%M:%S}."))
+
+        if options['prune_days'] is not None:
+            deleted, _ = prune_snapshots(timezone.now() - timedelta(days=options['prune_days']))
+            self.stdout.write(f"Pruned {deleted} old snapshot rows.")
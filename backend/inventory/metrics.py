@@ -0,0 +1,227 @@
+"""
+Per-endpoint request instrumentation.
+
+RequestMetricsMiddleware times every request and, through an execute wrapper
+installed on every database connection, counts its queries and SQL time;
+serializers report their own time (see TimedSerializerMixin). The request's
+recorder travels in a context variable, so queries run from the threads that
+serve sync code under ASGI are counted too.
+
+Each response gets a Server-Timing header with the breakdown, the totals per
+view are served in the Prometheus text format at /metrics, and requests
+slower than SLOW_REQUEST_MS are kept with their SQL in a small ring buffer
+(/api/slow-requests/). Like the cache counters, the numbers are per worker
+process.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+MAX_RECORDED_QUERIES = 200
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestRecorder:
+    """Query counts and timings for one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.statements = []
+
+    def add_query(self, sql, elapsed):
+        self.queries += 1
+        self.sql_seconds += elapsed
+        if len(self.statements) < MAX_RECORDED_QUERIES:
+            self.statements.append((sql, elapsed))
+
+    def server_timing(self, total):
+        return (
+            f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.queries} queries", '
+            f'serialize;dur={self.serializer_seconds * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+
+
+class Registry:
+    """Totals per (view, method, status), plus a duration histogram per (view, method)."""
+
+    def __init__(self, slow_buffer=50):
+        self._lock = threading.Lock()
+        self._totals = defaultdict(lambda: {
+            'requests': 0, 'seconds': 0.0, 'queries': 0, 'sql_seconds': 0.0,
+            'serializer_seconds': 0.0, 'response_bytes': 0,
+        })
+        self._buckets = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))
+        self.slow = deque(maxlen=slow_buffer)
+
+    def record(self, view, method, status, recorder, seconds, size, path):
+        with self._lock:
+            totals = self._totals[(view, method, status)]
+            totals['requests'] += 1
+            totals['seconds'] += seconds
+            totals['queries'] += recorder.queries
+            totals['sql_seconds'] += recorder.sql_seconds
+            totals['serializer_seconds'] += recorder.serializer_seconds
+            totals['response_bytes'] += size
+            buckets = self._buckets[(view, method)]
+            buckets[next((i for i, bound in enumerate(DURATION_BUCKETS) if seconds <= bound), -1)] += 1
+
+        if seconds * 1000 >= settings.SLOW_REQUEST_MS:
+            self.slow.appendleft({
+                'at': time.time(),
+                'method': method,
+                'path': path,
+                'view': view,
+                'status': status,
+                'duration_ms': round(seconds * 1000, 1),
+                'queries': recorder.queries,
+                'sql_ms': round(recorder.sql_seconds * 1000, 1),
+                'serializer_ms': round(recorder.serializer_seconds * 1000, 1),
+                'sql': [
+                    {'sql': sql, 'ms': round(elapsed * 1000, 2)}
+                    for sql, elapsed in sorted(recorder.statements, key=lambda s: -s[1])
+                ],
+            })
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+            self._buckets.clear()
+            self.slow.clear()
+
+    def prometheus(self):
+        """The registry in the Prometheus text exposition format."""
+        with self._lock:
+            totals = {key: dict(value) for key, value in self._totals.items()}
+            buckets = {key: list(value) for key, value in self._buckets.items()}
+
+        lines = []
+        counters = [
+            ('requests', 'inventory_http_requests_total', 'Requests served.'),
+            ('queries', 'inventory_http_db_queries_total', 'Database queries run by requests.'),
+            ('sql_seconds', 'inventory_http_db_seconds_total', 'Time spent in SQL.'),
+            ('serializer_seconds', 'inventory_http_serializer_seconds_total', 'Time spent in serializers.'),
+            ('response_bytes', 'inventory_http_response_bytes_total', 'Response body bytes (non-streaming).'),
+        ]
+        for field, name, text in counters:
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} counter']
+            for (view, method, status), value in sorted(totals.items()):
+                lines.append(f'{name}{{view="{view}",method="{method}",status="{status}"}} {value[field]}')
+
+        name = 'inventory_http_request_duration_seconds'
+        lines += [f'# HELP {name} Request latency.', f'# TYPE {name} histogram']
+        seconds = defaultdict(float)
+        for (view, method, _), value in totals.items():
+            seconds[(view, method)] += value['seconds']
+        for (view, method), counts in sorted(buckets.items()):
+            labels = f'view="{view}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {seconds[(view, method)]}')
+            lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry(settings.SLOW_REQUEST_BUFFER)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add_query(sql, time.perf_counter() - started)
+
+
+@receiver(connection_created, dispatch_uid='inventory.metrics.record_query')
+def install_query_recorder(sender, connection, **kwargs):
+    # Fires again on every reconnect of the same wrapper object.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match.route) if match else 'unmatched'
+
+
+def _finish(request, response, recorder):
+    seconds = time.perf_counter() - recorder.started
+    size = 0 if response.streaming else len(response.content)
+    response['Server-Timing'] = recorder.server_timing(seconds)
+    registry.record(_view_name(request), request.method, response.status_code, recorder, seconds, size,
+                    request.get_full_path())
+
+
+@sync_and_async_middleware
+def RequestMetricsMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            recorder = RequestRecorder()
+            token = _current.set(recorder)
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            _finish(request, response, recorder)
+            return response
+    else:
+        def middleware(request):
+            recorder = RequestRecorder()
+            token = _current.set(recorder)
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            _finish(request, response, recorder)
+            return response
+    return middleware
+
+
+class TimedSerializerMixin:
+    """Adds the time a viewset's serializers spend producing data to the request's metrics."""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        recorder = _current.get()
+        if recorder is not None:
+            represent = serializer.to_representation
+
+            def timed(instance):
+                started = time.perf_counter()
+                try:
+                    return represent(instance)
+                finally:
+                    recorder.serializer_seconds += time.perf_counter() - started
+
+            serializer.to_representation = timed
+        return serializer
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """Prometheus scrape endpoint, for staff tokens (`authorization` in the scrape config)."""
+    return HttpResponse(registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
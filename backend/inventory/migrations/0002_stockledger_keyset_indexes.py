@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockledger',
+            index=models.Index(fields=['created_at', 'id'], name='ledger_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockledger',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='ledger_product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockledger',
+            index=models.Index(fields=['warehouse', 'created_at', 'id'], name='ledger_warehouse_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockledger',
+            index=models.Index(fields=['source_type', 'created_at', 'id'], name='ledger_source_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_dashboardsummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deliveryorder',
+            index=models.Index(fields=['status', 'created_at'], name='delivery_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['status', 'created_at'], name='receipt_status_created_idx'),
+        ),
+    ]
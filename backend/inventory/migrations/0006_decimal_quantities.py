@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:08
+
+from django.db import migrations, models
+
+
+def reconcile_ledger(apps, schema_editor):
+    """
+    After the cast to numeric, rewrites every ledger balance as the exact
+    running sum of its pair's changes (keeping the pair's opening balance),
+    snaps Stock onto the last balance where the two differ only by float
+    noise, and drops the KPI row so it is recounted on the next read.
+    """
+    StockLedger = apps.get_model('inventory', 'StockLedger')
+    Stock = apps.get_model('inventory', 'Stock')
+    DashboardSummary = apps.get_model('inventory', 'DashboardSummary')
+    ledger = schema_editor.quote_name(StockLedger._meta.db_table)
+    stock = schema_editor.quote_name(Stock._meta.db_table)
+
+    schema_editor.execute(f"""
+        UPDATE {ledger} SET balance = exact.balance
+        FROM (
+            SELECT id, FIRST_VALUE(balance - change) OVER pair + SUM(change) OVER pair AS balance
+            FROM {ledger}
+            WINDOW pair AS (PARTITION BY product_id, warehouse_id ORDER BY created_at, id)
+        ) AS exact
+        WHERE {ledger}.id = exact.id AND {ledger}.balance <> exact.balance
+    """)
+    schema_editor.execute(f"""
+        UPDATE {stock} SET quantity = latest.balance
+        FROM (
+            SELECT DISTINCT ON (product_id, warehouse_id) product_id, warehouse_id, balance
+            FROM {ledger}
+            ORDER BY product_id, warehouse_id, created_at DESC, id DESC
+        ) AS latest
+        WHERE {stock}.product_id = latest.product_id AND {stock}.warehouse_id = latest.warehouse_id
+          AND {stock}.quantity <> latest.balance AND ABS({stock}.quantity - latest.balance) <= 0.001
+    """)
+    DashboardSummary.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_stock_snapshots'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deliveryitem',
+            name='quantity',
+            field=models.DecimalField(decimal_places=3, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='receiptitem',
+            name='quantity',
+            field=models.DecimalField(decimal_places=3, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='stock',
+            name='quantity',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='stockadjustment',
+            name='counted_quantity',
+            field=models.DecimalField(decimal_places=3, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='stockledger',
+            name='balance',
+            field=models.DecimalField(decimal_places=3, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='stockledger',
+            name='change',
+            field=models.DecimalField(decimal_places=3, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='stocksnapshot',
+            name='quantity',
+            field=models.DecimalField(decimal_places=3, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='transferitem',
+            name='quantity',
+            field=models.DecimalField(decimal_places=3, max_digits=14),
+        ),
+        migrations.RunPython(reconcile_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def flag_low_stock(apps, schema_editor):
+    Stock = apps.get_model('inventory', 'Stock')
+    Stock.objects.filter(quantity__lt=models.F('product__low_stock_threshold')).update(is_low_stock=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_decimal_quantities'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LowStockEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('kind', models.CharField(choices=[('LOW', 'Fell below threshold'), ('RECOVERED', 'Back at or above threshold')], max_length=10)),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('threshold', models.IntegerField()),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='is_low_stock',
+            field=models.BooleanField(db_default=False, default=False),
+        ),
+        migrations.RunPython(flag_low_stock, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(condition=models.Q(('is_low_stock', True)), fields=['warehouse', 'product'], name='stock_low_idx'),
+        ),
+        migrations.AddField(
+            model_name='lowstockevent',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.product'),
+        ),
+        migrations.AddField(
+            model_name='lowstockevent',
+            name='warehouse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse'),
+        ),
+        migrations.AddIndex(
+            model_name='lowstockevent',
+            index=models.Index(fields=['created_at', 'id'], name='lowstock_event_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lowstockevent',
+            index=models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['created_at', 'id'], name='lowstock_event_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_low_stock_flags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplenishmentState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_ledger_id', models.BigIntegerField(default=0)),
+                ('computed_for', models.DateField(null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('avg_daily_usage', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('usage_stddev', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('reorder_point', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('on_hand', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('suggested_quantity', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('suggested_quantity__gt', 0)), fields=['warehouse', 'product'], name='reorder_due_idx')],
+                'unique_together': {('product', 'warehouse')},
+            },
+        ),
+    ]
@@ -0,0 +1,123 @@
+"""
+Moves StockLedger into a table partitioned by month of created_at.
+
+The rows are copied into a new partitioned table (one partition per month
+that has data, the current month and three ahead, plus a DEFAULT partition),
+the old table is dropped and the new one takes its name, foreign keys and
+indexes. PostgreSQL needs the partition key in the primary key, so it
+becomes (id, created_at); ids still come from a single sequence and Django
+keeps treating `id` as the primary key. Identity columns aren't supported on
+partitioned tables before PostgreSQL 17, so `id` defaults to nextval() of a
+sequence owned by the column instead.
+
+Everything happens in SQL against the catalog, so the model state doesn't
+change.
+"""
+from datetime import date, datetime, timezone
+
+from django.db import migrations
+
+TABLE = 'inventory_stockledger'
+MONTHS_AHEAD = 3
+
+
+def shift_month(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def fetch(cursor, sql, params=None):
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+def rebuild(schema_editor, partitioned):
+    """Copies the ledger into a new (partitioned or plain) table that then replaces it."""
+    quote = schema_editor.quote_name
+    new = f'{TABLE}_new'
+    with schema_editor.connection.cursor() as cursor:
+        foreign_keys = fetch(
+            cursor,
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        indexes = fetch(
+            cursor,
+            'SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s',
+            [TABLE, f'{TABLE}_pkey'],
+        )
+        months = [row[0] for row in fetch(
+            cursor, f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date FROM {quote(TABLE)}",
+        )]
+        last_id = fetch(cursor, f'SELECT COALESCE(MAX(id), 0) FROM {quote(TABLE)}')[0][0]
+
+    partition_by = ' PARTITION BY RANGE (created_at)' if partitioned else ''
+    schema_editor.execute(
+        f'CREATE TABLE {quote(new)} (LIKE {quote(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS){partition_by}'
+    )
+    if partitioned:
+        current = datetime.now(timezone.utc).date().replace(day=1)
+        months = sorted(set(months) | {shift_month(current, n) for n in range(MONTHS_AHEAD + 1)})
+        for month in months:
+            start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+            end = datetime.combine(shift_month(month, 1), datetime.min.time(), tzinfo=timezone.utc)
+            schema_editor.execute(
+                f'CREATE TABLE {quote(f"{TABLE}_p{month:%Y_%m}")} PARTITION OF {quote(new)} '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [start, end],
+            )
+        schema_editor.execute(f'CREATE TABLE {quote(f"{TABLE}_default")} PARTITION OF {quote(new)} DEFAULT')
+    else:
+        # The copied default points at the sequence that is dropped with the old table.
+        schema_editor.execute(f'ALTER TABLE {quote(new)} ALTER COLUMN id DROP DEFAULT')
+
+    schema_editor.execute(f'INSERT INTO {quote(new)} SELECT * FROM {quote(TABLE)}')
+    if partitioned:
+        # The identity (and its sequence) goes with the old table.
+        schema_editor.execute(f'CREATE SEQUENCE {quote(f"{new}_id_seq")}')
+        schema_editor.execute(f'SELECT setval(%s, %s, %s)', [f'{new}_id_seq', max(last_id, 1), last_id > 0])
+    schema_editor.execute(f'DROP TABLE {quote(TABLE)}')
+    schema_editor.execute(f'ALTER TABLE {quote(new)} RENAME TO {quote(TABLE)}')
+
+    if partitioned:
+        schema_editor.execute(f'ALTER SEQUENCE {quote(f"{new}_id_seq")} RENAME TO {quote(f"{TABLE}_id_seq")}')
+        schema_editor.execute(f'ALTER SEQUENCE {quote(f"{TABLE}_id_seq")} OWNED BY {quote(TABLE)}.id')
+        schema_editor.execute(
+            f'ALTER TABLE {quote(TABLE)} ALTER COLUMN id SET DEFAULT nextval(%s::regclass)', [f'{TABLE}_id_seq']
+        )
+        schema_editor.execute(f'ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(f"{TABLE}_pkey")} PRIMARY KEY (id, created_at)')
+    else:
+        schema_editor.execute(f'ALTER TABLE {quote(TABLE)} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        schema_editor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, %s)", [TABLE, max(last_id, 1), last_id > 0]
+        )
+        schema_editor.execute(f'ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(f"{TABLE}_pkey")} PRIMARY KEY (id)')
+
+    for name, definition in foreign_keys:
+        schema_editor.execute(f'ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(name)} {definition}')
+    for name, definition in indexes:
+        schema_editor.execute(definition)
+
+
+def partition_ledger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        rebuild(schema_editor, partitioned=True)
+
+
+def unpartition_ledger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        with schema_editor.connection.cursor() as cursor:
+            partitioned = fetch(cursor, 'SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [TABLE])
+        if partitioned:
+            rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_ledger, unpartition_ledger),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_partition_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovementRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_ledger_id', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('source_type', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+                ('quantity_in', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('quantity_out', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('entries', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='movement_day_idx'), models.Index(fields=['warehouse', 'day'], name='movement_warehouse_day_idx')],
+                'unique_together': {('product', 'warehouse', 'source_type', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_daily_movements'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='reserved_quantity',
+            field=models.DecimalField(db_default=0, decimal_places=3, default=0, max_digits=14),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('source_type', models.CharField(max_length=50)),
+                ('source_id', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.warehouse')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['source_type', 'source_id'], name='reservation_source_idx')],
+            },
+        ),
+    ]
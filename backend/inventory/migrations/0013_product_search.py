@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:39
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import DatabaseError, migrations, models, transaction
+
+TRIGRAM_INDEXES = {
+    'product_name_trgm_idx': 'name',
+    'product_sku_trgm_idx': 'UPPER(sku)',
+}
+
+
+def add_trigram_indexes(apps, schema_editor):
+    """
+    Installs pg_trgm and indexes the name and SKU for similarity matching.
+    Skipped where the extension isn't available or can't be created; search
+    then works without typo tolerance (see inventory/search.py).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        return
+    for name, expression in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {schema_editor.quote_name(name)} '
+            f'ON inventory_product USING gin (({expression}) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name in TRIGRAM_INDEXES:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {schema_editor.quote_name(name)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('name', config='simple'), name='product_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.comparison.Collate(django.db.models.functions.text.Upper('sku'), 'C'), name='product_sku_prefix_idx'),
+        ),
+        migrations.RunPython(add_trigram_indexes, drop_trigram_indexes),
+    ]
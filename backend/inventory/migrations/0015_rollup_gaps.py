@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_ledger_archive_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movementrollupstate',
+            name='gaps',
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -1,7 +1,16 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db.models.functions import Collate, Upper
 from django.db import transaction
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+# Quantities are exact decimals: binary floats drift over repeated postings,
+# which made sums and low stock comparisons unreliable.
+QUANTITY_DIGITS = 14
+QUANTITY_PLACES = 3
 
 # 1. Common Base Model
 class BaseModel(models.Model):
@@ -11,6 +20,15 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
+    def refresh_for_update(self, *fields):
+        """
+        Locks this row (SELECT ... FOR UPDATE) until the surrounding transaction
+        ends and reloads `fields` from the locked row.
+        """
+        values = type(self).objects.select_for_update().filter(pk=self.pk).values(*fields).get()
+        for field, value in values.items():
+            setattr(self, field, value)
+
 # 2. Warehouse & Product Models
 class Warehouse(BaseModel):
     name = models.CharField(max_length=100)
@@ -35,6 +53,15 @@ class Product(BaseModel):
     low_stock_threshold = models.IntegerField(default=10) 
     # ----------------------------
 
+    class Meta:
+        # Product search (inventory/search.py). The SKU index is in the C
+        # collation so one btree serves both LIKE 'prefix%' and the ordering.
+        # Trigram indexes are added by migration 0013 where pg_trgm exists.
+        indexes = [
+            GinIndex(SearchVector('name', config='simple'), name='product_search_idx'),
+            models.Index(Collate(Upper('sku'), 'C'), name='product_sku_prefix_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.sku})"
 
@@ -42,10 +69,28 @@ class Product(BaseModel):
 class Stock(BaseModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
-    quantity = models.FloatField(default=0)
+    quantity = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES, default=0)
+    # quantity < product.low_stock_threshold, kept current by inventory/alerts.py.
+    # db_default covers the raw INSERTs in posting.py.
+    is_low_stock = models.BooleanField(default=False, db_default=False)
+    # Sum of the open StockReservation rows of this pair, kept by inventory/reservations.py.
+    reserved_quantity = models.DecimalField(
+        max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES, default=0, db_default=0
+    )
 
     class Meta:
         unique_together = ('product', 'warehouse')
+        indexes = [
+            # Only low rows are indexed, so the low stock list never scans Stock.
+            models.Index(
+                fields=['warehouse', 'product'], condition=models.Q(is_low_stock=True), name='stock_low_idx'
+            ),
+        ]
+
+    @property
+    def available(self):
+        """Available to promise: on hand minus what ready deliveries and waiting transfers hold."""
+        return self.quantity - self.reserved_quantity
 
     def __str__(self):
         return f"{self.product.name} - {self.warehouse.name}: {self.quantity}"
@@ -69,30 +114,38 @@ class Receipt(BaseModel):
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='receipt_status_created_idx'),
+        ]
+
+    def stock_movements(self, lines):
+        """Movements for (product_id, quantity) lines of this receipt."""
+        from .posting import Movement
+        return [Movement(product_id, self.warehouse_id, quantity, 'Receipt', self.id) for product_id, quantity in lines]
+
     def validate_receipt(self):
-        if self.status != self.DRAFT:
-            raise ValidationError("Only draft receipts can be validated.")
+        from .posting import post_movements
 
         with transaction.atomic():
-            for item in self.items.all():
-                stock, created = Stock.objects.get_or_create(
-                    product=item.product, 
-                    warehouse=self.warehouse
-                )
-                stock.quantity += item.quantity
-                stock.save()
-
-                StockLedger.objects.create(
-                    product=item.product,
-                    warehouse=self.warehouse,
-                    change=item.quantity,
-                    balance=stock.quantity,
-                    source_type='Receipt',
-                    source_id=self.id
-                )
+            # Lock the document first so the same one can't be posted twice.
+            self.refresh_for_update('status')
+            if self.status != self.DRAFT:
+                raise ValidationError("Only draft receipts can be validated.")
+
+            post_movements(self.stock_movements(self.items.values_list('product_id', 'quantity')))
 
             self.status = self.DONE
-            self.save()
+            self.save(update_fields=['status', 'updated_at'])
+
+    def cancel(self):
+        with transaction.atomic():
+            self.refresh_for_update('status')
+            if self.status not in (self.DRAFT, self.WAITING):
+                raise ValidationError("Only draft or waiting receipts can be cancelled.")
+
+            self.status = self.CANCELLED
+            self.save(update_fields=['status', 'updated_at'])
 
     def __str__(self):
         return f"Receipt #{self.id} - {self.supplier}"
@@ -100,7 +153,7 @@ class Receipt(BaseModel):
 class ReceiptItem(BaseModel):
     receipt = models.ForeignKey(Receipt, related_name="items", on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    quantity = models.FloatField()
+    quantity = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity}"
@@ -119,37 +172,83 @@ class DeliveryOrder(BaseModel):
         (CANCELLED, 'Cancelled'),
     ]
 
+    # The status whose documents hold StockReservations.
+    RESERVED = READY
+
     customer = models.CharField(max_length=150)
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=DRAFT)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
-    def validate_delivery(self):
-        if self.status != self.DRAFT:
-            raise ValidationError("Only draft deliveries can be validated.")
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='delivery_status_created_idx'),
+        ]
+
+    def stock_movements(self, lines):
+        """Movements for (product_id, quantity) lines of this delivery."""
+        from .posting import Movement
+        return [Movement(product_id, self.warehouse_id, -quantity, 'Delivery', self.id) for product_id, quantity in lines]
+
+    def reserve(self):
+        """Marks a draft delivery ready, reserving its lines (inventory/reservations.py)."""
+        from .reservations import hold
 
         with transaction.atomic():
-            for item in self.items.all():
-                stock = Stock.objects.filter(product=item.product, warehouse=self.warehouse).first()
-                if not stock or stock.quantity < item.quantity:
-                    raise ValidationError(f"Insufficient stock for {item.product.name}")
+            self.refresh_for_update('status')
+            if self.status != self.DRAFT:
+                raise ValidationError("Only draft deliveries can be reserved.")
 
-            self.status = self.DONE
-            self.save()
+            hold(self)
+
+            self.status = self.READY
+            self.save(update_fields=['status', 'updated_at'])
+
+    def unreserve(self):
+        """Moves a ready delivery back to draft and releases its reservations."""
+        from .reservations import release
+
+        with transaction.atomic():
+            self.refresh_for_update('status')
+            if self.status != self.READY:
+                raise ValidationError("Only ready deliveries can be released.")
+
+            release([self])
 
-            for item in self.items.all():
-                stock = Stock.objects.get(product=item.product, warehouse=self.warehouse)
-                stock.quantity -= item.quantity
-                stock.save()
+            self.status = self.DRAFT
+            self.save(update_fields=['status', 'updated_at'])
 
-                StockLedger.objects.create(
-                    product=item.product,
-                    warehouse=self.warehouse,
-                    change=-item.quantity,
-                    balance=stock.quantity,
-                    source_type='Delivery',
-                    source_id=self.id
-                )
+    def cancel(self):
+        from .reservations import release
+
+        with transaction.atomic():
+            self.refresh_for_update('status')
+            if self.status not in (self.DRAFT, self.READY):
+                raise ValidationError("Only draft or ready deliveries can be cancelled.")
+
+            if self.status == self.READY:
+                release([self])
+
+            self.status = self.CANCELLED
+            self.save(update_fields=['status', 'updated_at'])
+
+    def validate_delivery(self):
+        from .posting import post_movements
+        from .reservations import release
+
+        with transaction.atomic():
+            # Lock the document first so the same one can't be posted twice.
+            self.refresh_for_update('status')
+            if self.status not in (self.DRAFT, self.READY):
+                raise ValidationError("Only draft or ready deliveries can be validated.")
+
+            # The reserved stock is what gets posted now.
+            if self.status == self.READY:
+                release([self])
+            post_movements(self.stock_movements(self.items.values_list('product_id', 'quantity')))
+
+            self.status = self.DONE
+            self.save(update_fields=['status', 'updated_at'])
 
     def __str__(self):
         return f"Delivery #{self.id} - {self.customer}"
@@ -157,7 +256,7 @@ class DeliveryOrder(BaseModel):
 class DeliveryItem(BaseModel):
     delivery = models.ForeignKey(DeliveryOrder, related_name="items", on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    quantity = models.FloatField()
+    quantity = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity}"
@@ -174,18 +273,76 @@ class InternalTransfer(BaseModel):
         (DONE, 'Done'),
     ]
 
+    # The status whose documents hold StockReservations.
+    RESERVED = WAITING
+
     from_warehouse = models.ForeignKey(Warehouse, related_name="source_transfers", on_delete=models.CASCADE)
     to_warehouse = models.ForeignKey(Warehouse, related_name="destination_transfers", on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=DRAFT)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
+    def stock_movements(self, lines):
+        """Movements for (product_id, quantity) lines of this transfer: out of the source, into the destination."""
+        from .posting import Movement
+        movements = []
+        for product_id, quantity in lines:
+            movements.append(Movement(product_id, self.from_warehouse_id, -quantity, 'Transfer Out', self.id))
+            movements.append(Movement(product_id, self.to_warehouse_id, quantity, 'Transfer In', self.id))
+        return movements
+
+    def reserve(self):
+        """Marks a draft transfer waiting, reserving its lines at the source warehouse."""
+        from .reservations import hold
+
+        with transaction.atomic():
+            self.refresh_for_update('status')
+            if self.status != self.DRAFT:
+                raise ValidationError("Only draft transfers can be reserved.")
+
+            hold(self)
+
+            self.status = self.WAITING
+            self.save(update_fields=['status', 'updated_at'])
+
+    def unreserve(self):
+        """Moves a waiting transfer back to draft and releases its reservations."""
+        from .reservations import release
+
+        with transaction.atomic():
+            self.refresh_for_update('status')
+            if self.status != self.WAITING:
+                raise ValidationError("Only waiting transfers can be released.")
+
+            release([self])
+
+            self.status = self.DRAFT
+            self.save(update_fields=['status', 'updated_at'])
+
+    def validate_transfer(self):
+        from .posting import post_movements
+        from .reservations import release
+
+        with transaction.atomic():
+            # Lock the document first so the same one can't be posted twice.
+            self.refresh_for_update('status')
+            if self.status not in (self.DRAFT, self.WAITING):
+                raise ValidationError("Only draft or waiting transfers can be validated.")
+
+            # The reserved stock is what gets posted now.
+            if self.status == self.WAITING:
+                release([self])
+            post_movements(self.stock_movements(self.items.values_list('product_id', 'quantity')))
+
+            self.status = self.DONE
+            self.save(update_fields=['status', 'updated_at'])
+
     def __str__(self):
         return f"Transfer #{self.id}"
 
 class TransferItem(BaseModel):
     transfer = models.ForeignKey(InternalTransfer, related_name="items", on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    quantity = models.FloatField()
+    quantity = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity}"
@@ -194,7 +351,7 @@ class TransferItem(BaseModel):
 class StockAdjustment(BaseModel):
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    counted_quantity = models.FloatField()
+    counted_quantity = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
     reason = models.TextField(blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
@@ -206,11 +363,207 @@ class StockLedger(BaseModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
 
-    change = models.FloatField() 
-    balance = models.FloatField() 
+    change = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
+    balance = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
+
+    source_type = models.CharField(max_length=50)
+    source_id = models.IntegerField()
+
+    class Meta:
+        # The table is partitioned by month of created_at (migration 0010,
+        # inventory/partitions.py); filter on created_at to prune partitions.
+        # Keyset pagination walks (created_at, id); the filtered variants keep
+        # per-product/warehouse/type pages on an index as well.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='ledger_created_id_idx'),
+            models.Index(fields=['product', 'created_at', 'id'], name='ledger_product_created_idx'),
+            models.Index(fields=['warehouse', 'created_at', 'id'], name='ledger_warehouse_created_idx'),
+            models.Index(fields=['source_type', 'created_at', 'id'], name='ledger_source_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} ({self.change})"
+
+class LedgerArchiveState(BaseModel):
+    # Single row: ledger rows created before this moment have been archived
+    # out of the table (inventory/partitions.py).
+    archived_before = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"Ledger archived before {self.archived_before:%Y-%m-%d}" if self.archived_before else "Ledger complete"
+
+# 9. Stock Snapshots (checkpoints for historical balance queries)
+class StockSnapshotRun(BaseModel):
+    taken_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Snapshot #{self.id} @ {self.taken_at:%Y-%m-%d %H:%M}"
+
+class StockSnapshot(BaseModel):
+    run = models.ForeignKey(StockSnapshotRun, related_name="rows", on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    quantity = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
+
+    class Meta:
+        unique_together = ('run', 'product', 'warehouse')
+
+    def __str__(self):
+        return f"{self.product_id}@{self.warehouse_id}: {self.quantity}"
+
+# 10. Dashboard KPIs (single row, maintained incrementally by inventory/kpis.py)
+class DashboardSummary(BaseModel):
+    total_products = models.IntegerField(default=0)
+    low_stock_items = models.IntegerField(default=0)
+    pending_receipts = models.IntegerField(default=0)
+    pending_deliveries = models.IntegerField(default=0)
+    pending_transfers = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "Dashboard KPIs"
+
+
+# 11. Low Stock Alerts (outbox of threshold crossings, see inventory/alerts.py)
+class LowStockEvent(BaseModel):
+    LOW = 'LOW'
+    RECOVERED = 'RECOVERED'
+    KIND_CHOICES = [(LOW, 'Fell below threshold'), (RECOVERED, 'Back at or above threshold')]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quantity = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
+    threshold = models.IntegerField()
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='lowstock_event_created_idx'),
+            models.Index(
+                fields=['created_at', 'id'], condition=models.Q(processed_at__isnull=True),
+                name='lowstock_event_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.product_id}@{self.warehouse_id} ({self.quantity} < {self.threshold})"
+
+# 12. Replenishment (reorder suggestions, refreshed by inventory/replenishment.py)
+class ReorderSuggestion(BaseModel):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    avg_daily_usage = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
+    usage_stddev = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
+    reorder_point = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
+    on_hand = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
+    suggested_quantity = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
 
+    class Meta:
+        unique_together = ('product', 'warehouse')
+        indexes = [
+            models.Index(
+                fields=['warehouse', 'product'], condition=models.Q(suggested_quantity__gt=0),
+                name='reorder_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Reorder {self.suggested_quantity} of {self.product_id}@{self.warehouse_id}"
+
+class ReplenishmentState(BaseModel):
+    # Single row: how far into the ledger the suggestions have been refreshed.
+    last_ledger_id = models.BigIntegerField(default=0)
+    computed_for = models.DateField(null=True)
+
+    def __str__(self):
+        return f"Replenishment through ledger #{self.last_ledger_id}"
+
+# 13. Background Jobs (database-backed queue, see inventory/jobs.py)
+class Job(BaseModel):
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    # Unique per user, so one caller's key can't replay or block another's.
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    # A RUNNING job whose lease has expired is assumed orphaned and re-queued.
+    locked_until = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_after', 'id'], condition=models.Q(status='QUEUED'), name='job_queued_idx'),
+            models.Index(fields=['locked_until'], condition=models.Q(status='RUNNING'), name='job_running_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['created_by', 'idempotency_key'], nulls_distinct=False,
+                condition=models.Q(idempotency_key__isnull=False), name='job_idempotency_key_per_user',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.id} {self.kind} ({self.status})"
+
+# 14. Daily movement rollups (ledger compaction for reports, see inventory/rollups.py)
+class DailyMovement(BaseModel):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    source_type = models.CharField(max_length=50)
+    day = models.DateField()
+    quantity_in = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES, default=0)
+    quantity_out = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES, default=0)
+    entries = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'warehouse', 'source_type', 'day')
+        indexes = [
+            models.Index(fields=['day'], name='movement_day_idx'),
+            models.Index(fields=['warehouse', 'day'], name='movement_warehouse_day_idx'),
+        ]
+
+    @property
+    def net(self):
+        return self.quantity_in - self.quantity_out
+
+    def __str__(self):
+        return f"{self.day} {self.product_id}@{self.warehouse_id} {self.source_type}: {self.net}"
+
+class MovementRollupState(BaseModel):
+    # Single row: ledger rows up to this id are summed into DailyMovement,
+    # except ids in `gaps` ([first, last, noticed at] ranges that were
+    # missing when folded), whose rows may still commit late.
+    last_ledger_id = models.BigIntegerField(default=0)
+    gaps = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"Movements rolled up through ledger #{self.last_ledger_id}"
+
+# 15. Stock reservations (ready deliveries and waiting transfers, see inventory/reservations.py)
+class StockReservation(BaseModel):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    quantity = models.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES)
+    # Same source_type / source_id as the ledger rows that will consume it.
     source_type = models.CharField(max_length=50)
     source_id = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['source_type', 'source_id'], name='reservation_source_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.product.name} ({self.change})"
\ No newline at end of file
+        return f"{self.source_type} #{self.source_id}: {self.product_id}@{self.warehouse_id} x {self.quantity}"
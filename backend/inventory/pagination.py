@@ -0,0 +1,96 @@
+import base64
+from datetime import datetime
+
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Cursor pagination over (created_at, id), newest first.
+
+    Each page is fetched with a row comparison against the last row of the
+    previous page, so it is served straight from the (created_at, id) index no
+    matter how deep into the table it is. The redundant plain bound on
+    created_at lets PostgreSQL prune the partitions of a partitioned table
+    (the ledger) that the page can't reach.
+    """
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, row, reverse):
+        raw = f"{int(reverse)}|{row.created_at.isoformat()}|{row.pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            reverse, created_at, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split('|')
+            created_at = parse_datetime(created_at)
+            if not isinstance(created_at, datetime):
+                raise ValueError
+            return created_at, int(pk), reverse == '1'
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        reverse = bool(cursor and cursor[2])
+
+        if cursor is None:
+            queryset = queryset.order_by('-created_at', '-id')
+        elif reverse:
+            queryset = queryset.extra(
+                where=[f'({table}.created_at, {table}.id) > (%s, %s)'], params=cursor[:2]
+            ).filter(created_at__gte=cursor[0]).order_by('created_at', 'id')
+        else:
+            queryset = queryset.extra(
+                where=[f'({table}.created_at, {table}.id) < (%s, %s)'], params=cursor[:2]
+            ).filter(created_at__lte=cursor[0]).order_by('-created_at', '-id')
+
+        rows = list(queryset[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            rows.reverse()
+
+        # Walking forward there is always a way back (and vice versa) once a
+        # cursor has been used.
+        self.next_cursor = self.previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                self.next_cursor = self.encode_cursor(rows[-1], reverse=False)
+            if cursor is not None and (has_more or not reverse):
+                self.previous_cursor = self.encode_cursor(rows[0], reverse=True)
+        return rows
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.next_cursor),
+            'previous': self.get_link(self.previous_cursor),
+            'results': data,
+        })
@@ -0,0 +1,173 @@
+"""
+Monthly partitions of StockLedger.
+
+Since migration 0010 the ledger is a PostgreSQL table partitioned by range
+of created_at, one partition per calendar month (UTC) named
+inventory_stockledger_pYYYY_MM, plus a DEFAULT partition that catches rows
+for months without one. Queries that bound created_at (date filters, keyset
+pages, replenishment windows) only touch the partitions they need, and whole
+months can be archived by detaching their partition instead of deleting
+rows.
+
+ensure_partitions() creates the coming months ahead of time (moving any rows
+that already landed in the DEFAULT partition), and archive_partitions()
+writes old months to gzipped CSV, then detaches and drops them. Both run
+from `manage.py ledger_partitions`. The start of the oldest month still in
+the table is kept in LedgerArchiveState, so historical queries can refuse
+moments whose ledger rows are gone (see snapshots.stock_as_of).
+"""
+import gzip
+import logging
+import os
+import re
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import rollups
+from .models import LedgerArchiveState, MovementRollupState, StockLedger
+
+PARENT = StockLedger._meta.db_table
+DEFAULT_PARTITION = f'{PARENT}_default'
+_MONTHLY = re.compile(rf'^{PARENT}_p(\d{{4}})_(\d{{2}})$')
+STATE_PK = 1
+
+logger = logging.getLogger(__name__)
+
+
+def shift_month(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{PARENT}_p{month:%Y_%m}'
+
+
+def month_bounds(month):
+    start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    end = datetime.combine(shift_month(month, 1), datetime.min.time(), tzinfo=dt_timezone.utc)
+    return start, end
+
+
+def monthly_partitions():
+    """{first day of month: partition name} for the attached monthly partitions."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass',
+            [PARENT],
+        )
+        names = [name for name, in cursor.fetchall()]
+    months = {}
+    for name in names:
+        match = _MONTHLY.match(name)
+        if match:
+            months[date(int(match[1]), int(match[2]), 1)] = name
+    return months
+
+
+def create_partition(month):
+    """
+    Adds the partition for `month`. Rows of that month already in the
+    DEFAULT partition are moved into it first, since attaching a range the
+    DEFAULT partition still holds rows for would fail.
+    """
+    name = connection.ops.quote_name(partition_name(month))
+    parent = connection.ops.quote_name(PARENT)
+    default = connection.ops.quote_name(DEFAULT_PARTITION)
+    start, end = month_bounds(month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {default} WHERE created_at >= %s AND created_at < %s RETURNING *) '
+            f'INSERT INTO {name} SELECT * FROM moved',
+            [start, end],
+        )
+        cursor.execute(f'ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', [start, end])
+    return partition_name(month)
+
+
+def ensure_partitions(months_ahead=3, today=None):
+    """Creates any missing partitions from the current month to `months_ahead` months out."""
+    current = (today or timezone.now().astimezone(dt_timezone.utc).date()).replace(day=1)
+    existing = monthly_partitions()
+    return [
+        create_partition(month)
+        for month in (shift_month(current, n) for n in range(months_ahead + 1))
+        if month not in existing
+    ]
+
+
+def archived_before():
+    """The moment before which ledger rows have been archived, or None."""
+    return LedgerArchiveState.objects.filter(pk=STATE_PK).values_list('archived_before', flat=True).first()
+
+
+def _write_archive(cursor, table, path):
+    """COPYs `table` to a gzipped CSV at `path`, durably, via a temporary file."""
+    partial = f'{path}.partial'
+    with open(partial, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as output:
+            cursor.copy_expert(f'COPY {table} TO STDOUT WITH (FORMAT csv, HEADER)', output)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(partial, path)
+    directory = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def archive_partitions(before, directory, dry_run=False):
+    """
+    Archives every monthly partition that ends on or before the first day of
+    month `before` to <directory>/<partition>.csv.gz, then detaches and drops
+    it. Returns [(partition, row count, path)].
+
+    The export reads the partition alone, so postings and ledger reads carry
+    on meanwhile (closed months get no new rows). Only once the file is
+    written and fsynced is the partition detached, in a transaction of its
+    own: DETACH locks the parent table, so that lock is held for a catalog
+    update rather than for the export. (DETACH ... CONCURRENTLY isn't allowed
+    while the ledger has a DEFAULT partition.) The end of the month is
+    recorded in LedgerArchiveState in that same transaction.
+
+    A month is only archived once DailyMovement has rolled up all its rows
+    (inventory/rollups.py); archiving stops at the first one that hasn't.
+    """
+    parent = connection.ops.quote_name(PARENT)
+    rolled_up = MovementRollupState.objects.filter(
+        pk=rollups.STATE_PK
+    ).values_list('last_ledger_id', flat=True).first() or 0
+    archived = []
+    for month, name in sorted(monthly_partitions().items()):
+        if shift_month(month, 1) > before:
+            continue
+        path = os.path.join(directory, f'{name}.csv.gz')
+        quoted = connection.ops.quote_name(name)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*), MAX(id) FROM {quoted}')
+            rows, last_id = cursor.fetchone()
+            if last_id is not None and last_id > rolled_up:
+                logger.warning(
+                    "Not archiving %s: ledger rows past #%s are not rolled up yet.", name, rolled_up,
+                )
+                break
+            if not dry_run:
+                os.makedirs(directory, exist_ok=True)
+                _write_archive(cursor, quoted, path)
+                with transaction.atomic():
+                    # Give up rather than queue every posting behind a long transaction.
+                    cursor.execute("SET LOCAL lock_timeout = '5s'")
+                    cursor.execute(f'ALTER TABLE {parent} DETACH PARTITION {quoted}')
+                    state, _ = LedgerArchiveState.objects.select_for_update().get_or_create(pk=STATE_PK)
+                    end = month_bounds(month)[1]
+                    if state.archived_before is None or state.archived_before < end:
+                        state.archived_before = end
+                        state.save(update_fields=['archived_before', 'updated_at'])
+                cursor.execute(f'DROP TABLE {quoted}')
+        archived.append((name, rows, path))
+    return archived
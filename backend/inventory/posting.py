@@ -0,0 +1,266 @@
+"""
+Stock posting engine.
+
+Every operation that moves stock (receipts, deliveries, transfers) funnels its
+lines through ``post_movements`` so the cost of validating a document is a
+fixed number of queries no matter how many lines it has.
+"""
+from collections import OrderedDict, defaultdict, namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import bump_tables
+from .events import publish_ledger
+from .alerts import refresh_low_stock
+from .kpis import adjust_kpis
+from .models import (
+    Product, Stock, StockLedger, Receipt, ReceiptItem, DeliveryOrder, DeliveryItem,
+    InternalTransfer, TransferItem
+)
+
+# One line of a stock operation: `change` is positive for incoming stock and
+# negative for outgoing stock.
+Movement = namedtuple('Movement', ['product_id', 'warehouse_id', 'change', 'source_type', 'source_id'])
+
+
+def _upsert_stock(totals):
+    """
+    Adds the net change of every (product, warehouse) pair to Stock in a single
+    INSERT ... ON CONFLICT statement and returns the new quantities and the
+    quantities reserved on each pair.
+    """
+    table = connection.ops.quote_name(Stock._meta.db_table)
+    now = timezone.now()
+
+    rows = []
+    params = []
+    for (product_id, warehouse_id), change in totals.items():
+        rows.append('(%s, %s, %s, %s, %s)')
+        params.extend([now, now, product_id, warehouse_id, change])
+
+    sql = (
+        f'INSERT INTO {table} (created_at, updated_at, product_id, warehouse_id, quantity) '
+        f'VALUES {", ".join(rows)} '
+        f'ON CONFLICT (product_id, warehouse_id) DO UPDATE '
+        f'SET quantity = {table}.quantity + EXCLUDED.quantity, updated_at = EXCLUDED.updated_at '
+        f'RETURNING product_id, warehouse_id, quantity, reserved_quantity'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    balances = {(product_id, warehouse_id): quantity for product_id, warehouse_id, quantity, _ in rows}
+    reserved = {(product_id, warehouse_id): quantity for product_id, warehouse_id, _, quantity in rows}
+    return balances, reserved
+
+
+def lock_stock(keys, create=False):
+    """
+    Takes row locks on the Stock rows for the given (product_id, warehouse_id)
+    pairs and returns their current quantities.
+
+    Locks are always acquired in (product_id, warehouse_id) order so two
+    postings touching overlapping rows queue up instead of deadlocking. With
+    `create=True`, missing rows are inserted at zero first so they get locked
+    as well; their low stock flags are set by the posting that follows.
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return {}
+
+    table = connection.ops.quote_name(Stock._meta.db_table)
+    pairs = ', '.join(['(%s, %s)'] * len(keys))
+    params = [value for key in keys for value in key]
+
+    with connection.cursor() as cursor:
+        if create:
+            now = timezone.now()
+            cursor.execute(
+                f'INSERT INTO {table} (created_at, updated_at, product_id, warehouse_id, quantity) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s, 0)"] * len(keys))} '
+                f'ON CONFLICT (product_id, warehouse_id) DO NOTHING',
+                [value for key in keys for value in (now, now) + key],
+            )
+        cursor.execute(
+            f'SELECT product_id, warehouse_id, quantity FROM {table} '
+            f'WHERE (product_id, warehouse_id) IN ({pairs}) '
+            f'ORDER BY product_id, warehouse_id FOR UPDATE',
+            params,
+        )
+        return {(product_id, warehouse_id): quantity for product_id, warehouse_id, quantity in cursor.fetchall()}
+
+
+def post_movements(movements, honour_reservations=True):
+    """
+    Applies a batch of movements to Stock and writes one StockLedger row per
+    movement.
+
+    Lines are aggregated by (product, warehouse) so each pair is touched once,
+    all Stock rows are upserted in one statement and the ledger is written with
+    a single bulk insert. Existing rows are locked in key order before the
+    arithmetic runs in the database, so concurrent postings never lose updates.
+    Raises ValidationError (rolling the batch back) if any outgoing pair would
+    end up below zero, or below what other documents have reserved on it
+    (inventory/reservations.py) unless `honour_reservations` is off. The
+    ledger rows are broadcast to the live feed
+    (inventory/events.py) once the transaction commits.
+    """
+    movements = list(movements)
+    if not movements:
+        return []
+
+    # Sorted keys give every posting the same row order inside the upsert.
+    totals = OrderedDict()
+    for move in sorted(movements, key=lambda m: (m.product_id, m.warehouse_id)):
+        key = (move.product_id, move.warehouse_id)
+        totals[key] = totals.get(key, 0) + move.change
+
+    with transaction.atomic():
+        lock_stock(totals)
+        balances, reserved = _upsert_stock(totals)
+
+        floor = reserved if honour_reservations else {}
+        short = [key for key, change in totals.items() if change < 0 and balances[key] < floor.get(key, 0)]
+        if short:
+            product = Product.objects.get(pk=short[0][0])
+            raise ValidationError(f"Insufficient stock for {product.name}")
+
+        refresh_low_stock(totals)
+        # Raw SQL and bulk_create() skip model signals.
+        bump_tables(Stock, StockLedger)
+
+        # Rebuild the running balance per pair so each ledger row shows the
+        # quantity right after its own line was applied.
+        running = {key: balances[key] - change for key, change in totals.items()}
+        entries = []
+        for move in movements:
+            key = (move.product_id, move.warehouse_id)
+            running[key] += move.change
+            entries.append(StockLedger(
+                product_id=move.product_id,
+                warehouse_id=move.warehouse_id,
+                change=move.change,
+                balance=running[key],
+                source_type=move.source_type,
+                source_id=move.source_id,
+            ))
+
+        entries = StockLedger.objects.bulk_create(entries)
+        transaction.on_commit(lambda: publish_ledger(entries))
+        return entries
+
+
+def post_adjustment(product_id, warehouse_id, counted_quantity, source_id):
+    """
+    Sets the stock of one pair to a counted quantity and logs the difference.
+    A count is a fact, so it may leave the pair short of its reservations.
+    """
+    key = (product_id, warehouse_id)
+    with transaction.atomic():
+        current = lock_stock([key], create=True)[key]
+        return post_movements([
+            Movement(product_id, warehouse_id, counted_quantity - current, 'Adjustment', source_id)
+        ], honour_reservations=False)
+
+
+# kind -> (document model, line model, line FK to the document, dashboard KPI).
+# Receipts go first so stock they bring in can be used by the rest of a batch.
+BATCH_KINDS = OrderedDict([
+    ('receipts', (Receipt, ReceiptItem, 'receipt', 'pending_receipts')),
+    ('transfers', (InternalTransfer, TransferItem, 'transfer', 'pending_transfers')),
+    ('deliveries', (DeliveryOrder, DeliveryItem, 'delivery', 'pending_deliveries')),
+])
+
+
+def _post_documents(documents):
+    """
+    Posts the lines of several locked draft or reserved documents as one
+    aggregated batch and marks them done with one UPDATE per kind.
+    """
+    from .reservations import release
+
+    # Reserved documents give their reservations back to post the same stock.
+    release([
+        doc for kind, docs in documents.items() for doc in docs.values()
+        if doc.status == getattr(doc, 'RESERVED', None)
+    ])
+
+    movements = []
+    for kind, docs in documents.items():
+        if not docs:
+            continue
+        model, line_model, fk, kpi = BATCH_KINDS[kind]
+        lines = defaultdict(list)
+        for doc_id, product_id, quantity in line_model.objects.filter(
+            **{f'{fk}_id__in': docs}
+        ).order_by('id').values_list(f'{fk}_id', 'product_id', 'quantity'):
+            lines[doc_id].append((product_id, quantity))
+        for doc_id, doc in docs.items():
+            movements.extend(doc.stock_movements(lines[doc_id]))
+
+    post_movements(movements)
+
+    for kind, docs in documents.items():
+        if docs:
+            model, _, _, kpi = BATCH_KINDS[kind]
+            # update() skips signals, so the pending counter and version are adjusted here.
+            model.objects.filter(pk__in=docs).update(status=model.DONE, updated_at=timezone.now())
+            adjust_kpis(**{kpi: -sum(doc.status == model.DRAFT for doc in docs.values())})
+            bump_tables(model)
+
+
+def validate_batch(ids_by_kind, partial=False):
+    """
+    Validates many receipts, transfers and deliveries in one transaction.
+
+    `ids_by_kind` maps 'receipts' / 'transfers' / 'deliveries' to document
+    ids; drafts, ready deliveries and waiting transfers can be validated. All
+    documents are locked in id order and posted with a single
+    aggregated post_movements call. By default the batch is all-or-nothing;
+    with `partial=True`, a failing aggregate falls back to one savepoint per
+    document so the valid ones still go through.
+
+    Returns ({kind: [validated ids]}, [error dicts]).
+    """
+    errors = []
+    documents = OrderedDict()
+
+    with transaction.atomic():
+        for kind, (model, _, _, _) in BATCH_KINDS.items():
+            ids = sorted(set(ids_by_kind.get(kind) or []))
+            locked = {doc.id: doc for doc in model.objects.select_for_update().filter(pk__in=ids).order_by('pk')}
+            documents[kind] = OrderedDict()
+            for doc_id in ids:
+                doc = locked.get(doc_id)
+                if doc is None:
+                    errors.append({'kind': kind, 'id': doc_id, 'error': "Not found."})
+                elif doc.status not in (model.DRAFT, getattr(model, 'RESERVED', model.DRAFT)):
+                    errors.append({'kind': kind, 'id': doc_id, 'error': "Only draft or reserved documents can be validated."})
+                else:
+                    documents[kind][doc_id] = doc
+
+        if errors and not partial:
+            transaction.set_rollback(True)
+            return {}, errors
+
+        try:
+            with transaction.atomic():
+                _post_documents(documents)
+            return {kind: list(docs) for kind, docs in documents.items()}, errors
+        except ValidationError as e:
+            if not partial:
+                transaction.set_rollback(True)
+                return {}, errors + [{'kind': None, 'id': None, 'error': e.messages[0]}]
+
+        # The aggregate failed: retry document by document to find the culprits.
+        validated = {kind: [] for kind in documents}
+        for kind, docs in documents.items():
+            for doc_id, doc in docs.items():
+                try:
+                    with transaction.atomic():
+                        _post_documents({kind: {doc_id: doc}})
+                    validated[kind].append(doc_id)
+                except ValidationError as e:
+                    errors.append({'kind': kind, 'id': doc_id, 'error': e.messages[0]})
+        return validated, errors
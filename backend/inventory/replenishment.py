@@ -0,0 +1,155 @@
+"""
+Reorder points and replenishment suggestions from ledger consumption.
+
+Consumption is the outgoing quantity (deliveries and transfers out) per
+(product, warehouse) per day over a trailing window of whole days. The
+per-day series and its sum / sum of squares are aggregated in one SQL
+statement over the whole ledger window, so the database does the grouping
+and Python only turns the two sums per pair into mean, deviation and
+suggestion:
+
+    reorder point = mean * lead time + z * stddev * sqrt(lead time)
+    suggestion    = reorder point + mean * review period - on hand,
+                    once on hand has dropped to the reorder point
+
+Suggestions are stored in ReorderSuggestion. A refresh only recomputes the
+pairs with ledger rows past ReplenishmentState.last_ledger_id, except on the
+first refresh of a day, when the window has moved and every pair is redone.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .cache import bump_tables
+from .models import QUANTITY_PLACES, ReorderSuggestion, ReplenishmentState, Stock, StockLedger
+
+STATE_PK = 1
+CONSUMPTION_SOURCES = ('Delivery', 'Transfer Out')
+LOOKBACK_DAYS = 90
+LEAD_TIME_DAYS = 7
+REVIEW_DAYS = 14
+SERVICE_FACTOR = Decimal('1.65')  # z for a ~95% cycle service level
+# Ledger rows younger than this may belong to transactions that haven't
+# committed yet, so the high-water mark stays behind them.
+SAFETY_LAG = timedelta(minutes=1)
+
+_STEP = Decimal(1).scaleb(-QUANTITY_PLACES)
+
+
+def _quantize(value):
+    return value.quantize(_STEP)
+
+
+def consumption_stats(start, end, pairs=None):
+    """
+    Returns {(product_id, warehouse_id): (total, sum_of_squares)} of daily
+    consumption between `start` and `end`, optionally limited to `pairs`.
+    """
+    ledger = connection.ops.quote_name(StockLedger._meta.db_table)
+    sources = ', '.join(['%s'] * len(CONSUMPTION_SOURCES))
+    params = [start, end, *CONSUMPTION_SOURCES]
+    pair_filter = ''
+    if pairs is not None:
+        pairs = sorted(pairs)
+        if not pairs:
+            return {}
+        pair_filter = f'AND (product_id, warehouse_id) IN ({", ".join(["(%s, %s)"] * len(pairs))}) '
+        params.extend(value for pair in pairs for value in pair)
+
+    sql = (
+        f'SELECT product_id, warehouse_id, SUM(used), SUM(used * used) FROM ('
+        f'SELECT product_id, warehouse_id, date_trunc(\'day\', created_at), -SUM(change) AS used '
+        f'FROM {ledger} WHERE created_at >= %s AND created_at < %s AND change < 0 '
+        f'AND source_type IN ({sources}) {pair_filter}'
+        f'GROUP BY 1, 2, 3) AS daily GROUP BY 1, 2'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {(product_id, warehouse_id): (total, squares) for product_id, warehouse_id, total, squares in cursor.fetchall()}
+
+
+def suggest(total, squares, on_hand, days=LOOKBACK_DAYS, lead_time=LEAD_TIME_DAYS,
+            review=REVIEW_DAYS, service_factor=SERVICE_FACTOR):
+    """Returns (mean, stddev, reorder_point, suggested_quantity) for one pair."""
+    mean = total / days
+    variance = max((squares - days * mean * mean) / (days - 1), Decimal(0)) if days > 1 else Decimal(0)
+    stddev = variance.sqrt()
+    reorder_point = mean * lead_time + service_factor * stddev * Decimal(lead_time).sqrt()
+    suggested = reorder_point + mean * review - on_hand if on_hand <= reorder_point else Decimal(0)
+    return _quantize(mean), _quantize(stddev), _quantize(reorder_point), _quantize(max(suggested, Decimal(0)))
+
+
+def refresh_suggestions(full=False, today=None, **parameters):
+    """
+    Brings ReorderSuggestion up to date and returns the number of pairs
+    recomputed. `parameters` override days / lead_time / review /
+    service_factor of suggest().
+    """
+    today = today or timezone.localdate()
+    days = parameters.get('days', LOOKBACK_DAYS)
+    end = timezone.make_aware(datetime.combine(today, time.min))
+    start = end - timedelta(days=days)
+
+    with transaction.atomic():
+        # Locking the state row serializes concurrent refreshes.
+        state, _ = ReplenishmentState.objects.select_for_update().get_or_create(pk=STATE_PK)
+        high_water = StockLedger.objects.filter(
+            created_at__lt=timezone.now() - SAFETY_LAG
+        ).aggregate(high=Max('id'))['high'] or state.last_ledger_id
+
+        pairs = None
+        if not full and state.computed_for == today:
+            pairs = set(
+                StockLedger.objects.filter(id__gt=state.last_ledger_id, id__lte=high_water)
+                .values_list('product_id', 'warehouse_id').distinct()
+            )
+            if not pairs:
+                return 0
+
+        stats = consumption_stats(start, end, pairs)
+        on_hand = {
+            (product_id, warehouse_id): quantity for product_id, warehouse_id, quantity in
+            Stock.objects.filter(product_id__in={pair[0] for pair in stats})
+            .values_list('product_id', 'warehouse_id', 'quantity')
+        }
+
+        suggestions = []
+        for (product_id, warehouse_id), (total, squares) in stats.items():
+            quantity = on_hand.get((product_id, warehouse_id), Decimal(0))
+            mean, stddev, reorder_point, suggested = suggest(total, squares, quantity, **parameters)
+            suggestions.append(ReorderSuggestion(
+                product_id=product_id,
+                warehouse_id=warehouse_id,
+                avg_daily_usage=mean,
+                usage_stddev=stddev,
+                reorder_point=reorder_point,
+                on_hand=quantity,
+                suggested_quantity=suggested,
+            ))
+        ReorderSuggestion.objects.bulk_create(
+            suggestions,
+            update_conflicts=True,
+            unique_fields=['product', 'warehouse'],
+            update_fields=[
+                'avg_daily_usage', 'usage_stddev', 'reorder_point', 'on_hand', 'suggested_quantity', 'updated_at',
+            ],
+        )
+
+        # Recomputed pairs that no longer consume anything in the window drop out.
+        existing = ReorderSuggestion.objects.all()
+        if pairs is not None:
+            existing = existing.filter(product_id__in={pair[0] for pair in pairs})
+        stale_ids = [
+            pk for pk, product_id, warehouse_id in existing.values_list('id', 'product_id', 'warehouse_id')
+            if (product_id, warehouse_id) not in stats and (pairs is None or (product_id, warehouse_id) in pairs)
+        ]
+        ReorderSuggestion.objects.filter(pk__in=stale_ids).delete()
+
+        state.last_ledger_id = high_water
+        state.computed_for = today
+        state.save()
+        bump_tables(ReorderSuggestion)
+    return len(pairs) if pairs is not None else len(stats)
@@ -0,0 +1,138 @@
+"""
+Stock reservations.
+
+Moving a delivery to ready (or a transfer to waiting) reserves its outgoing
+lines: one StockReservation row per line, and their sum kept in
+Stock.reserved_quantity, so available-to-promise (quantity -
+reserved_quantity) is a single read of the (product, warehouse) row. A
+reservation is refused if it would take a pair below zero available, and
+postings refuse to consume stock reserved by other documents (see
+post_movements). Validating, cancelling or deleting the document releases
+exactly the rows it reserved, whatever happened to its lines meanwhile.
+"""
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import FilteredRelation, Q
+
+from .cache import bump_tables
+from .models import DeliveryOrder, InternalTransfer, Product, Stock, StockReservation
+from .posting import lock_stock
+
+# The ledger source type of the outgoing movements each document reserves.
+SOURCE_TYPES = {
+    DeliveryOrder: 'Delivery',
+    InternalTransfer: 'Transfer Out',
+}
+
+
+def _add_reserved(totals):
+    """
+    Adds {(product_id, warehouse_id): quantity} to Stock.reserved_quantity in
+    one UPDATE and returns the new available quantity of every pair.
+    """
+    table = connection.ops.quote_name(Stock._meta.db_table)
+    rows = ', '.join(['(%s, %s, %s)'] * len(totals))
+    params = [value for key, quantity in totals.items() for value in key + (quantity,)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} AS s SET reserved_quantity = s.reserved_quantity + v.quantity '
+            f'FROM (VALUES {rows}) AS v (product_id, warehouse_id, quantity) '
+            f'WHERE s.product_id = v.product_id AND s.warehouse_id = v.warehouse_id '
+            f'RETURNING s.product_id, s.warehouse_id, s.quantity - s.reserved_quantity',
+            params,
+        )
+        return {(product_id, warehouse_id): available for product_id, warehouse_id, available in cursor.fetchall()}
+
+
+def hold(document):
+    """
+    Reserves the outgoing lines of a delivery or transfer. Raises
+    ValidationError (reserving nothing) if a pair lacks available stock.
+    """
+    lines = document.items.order_by('id').values_list('product_id', 'quantity')
+    movements = [move for move in document.stock_movements(lines) if move.change < 0]
+    if not movements:
+        return []
+
+    totals = OrderedDict()
+    for move in sorted(movements, key=lambda m: (m.product_id, m.warehouse_id)):
+        key = (move.product_id, move.warehouse_id)
+        totals[key] = totals.get(key, 0) - move.change
+
+    with transaction.atomic():
+        lock_stock(totals, create=True)
+        available = _add_reserved(totals)
+        short = [key for key in totals if available[key] < 0]
+        if short:
+            product = Product.objects.get(pk=short[0][0])
+            raise ValidationError(f"Insufficient stock for {product.name}")
+
+        reservations = StockReservation.objects.bulk_create([
+            StockReservation(
+                product_id=move.product_id,
+                warehouse_id=move.warehouse_id,
+                quantity=-move.change,
+                source_type=move.source_type,
+                source_id=move.source_id,
+            )
+            for move in movements
+        ])
+        bump_tables(Stock)
+        return reservations
+
+
+def release(documents):
+    """
+    Drops the reservations of several documents and gives their quantities
+    back to Stock.reserved_quantity. Returns the number of rows released.
+    """
+    sources = [(SOURCE_TYPES[type(document)], document.pk) for document in documents]
+    if not sources:
+        return 0
+
+    table = connection.ops.quote_name(StockReservation._meta.db_table)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE (source_type, source_id) IN ({", ".join(["(%s, %s)"] * len(sources))}) '
+                f'RETURNING product_id, warehouse_id, quantity',
+                [value for source in sources for value in source],
+            )
+            released = cursor.fetchall()
+
+        totals = OrderedDict()
+        for product_id, warehouse_id, quantity in sorted(released):
+            key = (product_id, warehouse_id)
+            totals[key] = totals.get(key, 0) - quantity
+        if totals:
+            lock_stock(totals)
+            _add_reserved(totals)
+            bump_tables(Stock)
+        return len(released)
+
+
+def available_to_promise(skus=(), product_ids=(), warehouse=None):
+    """
+    Stock figures for many products in one query, read off the (product,
+    warehouse) unique index of Stock. Returns {product_id: (sku, name,
+    [(warehouse_id, quantity, reserved_quantity)])} for the products that
+    exist, with an empty list for those without stock rows.
+    """
+    condition = Q(stock__warehouse=warehouse) if warehouse is not None else Q()
+    rows = Product.objects.filter(
+        Q(sku__in=list(skus)) | Q(pk__in=list(product_ids))
+    ).annotate(
+        # A filtered LEFT JOIN, so products without stock (there) still come back.
+        pairs=FilteredRelation('stock', condition=condition)
+    ).values_list(
+        'id', 'sku', 'name', 'pairs__warehouse_id', 'pairs__quantity', 'pairs__reserved_quantity'
+    ).order_by('id', 'pairs__warehouse_id')
+
+    result = OrderedDict()
+    for product_id, sku, name, warehouse_id, quantity, reserved in rows:
+        pairs = result.setdefault(product_id, (sku, name, []))[2]
+        if warehouse_id is not None:
+            pairs.append((warehouse_id, quantity, reserved))
+    return result
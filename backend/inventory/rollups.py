@@ -0,0 +1,159 @@
+"""
+Daily movement rollups.
+
+DailyMovement holds, per (product, warehouse, source_type, day), the stock
+that came in, went out and the number of ledger rows, so movement reports
+over months or years read a few thousand summary rows instead of the raw
+ledger (and keep working after old ledger partitions are archived: a
+partition is only archived once all its rows are rolled up).
+
+roll_up() folds ledger rows past MovementRollupState.last_ledger_id into the
+table in id-range chunks, one INSERT ... SELECT ... ON CONFLICT per chunk.
+Like the replenishment refresh it stays SAFETY_LAG behind the newest rows.
+Ids are handed out when a row is inserted, not when it commits, so a
+transaction still open past SAFETY_LAG can commit ids below the high-water
+mark after it has moved on. Each chunk therefore records the id ranges it
+found missing next to recent rows, and later runs fold just the rows that
+have since turned up in those ranges, for RESCAN_WINDOW after they were
+noticed. Ranges left over from rolled back transactions are then dropped.
+"""
+from datetime import datetime, timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .cache import bump_tables
+from .models import DailyMovement, MovementRollupState, StockLedger
+from .replenishment import SAFETY_LAG
+
+STATE_PK = 1
+CHUNK_SIZE = 50000
+RESCAN_WINDOW = timedelta(hours=1)
+
+
+def _fold(cursor, where, params):
+    """Adds the ledger rows matching the SQL condition `where` into DailyMovement."""
+    rollup = connection.ops.quote_name(DailyMovement._meta.db_table)
+    ledger = connection.ops.quote_name(StockLedger._meta.db_table)
+    now = timezone.now()
+    cursor.execute(
+        f'INSERT INTO {rollup} (created_at, updated_at, product_id, warehouse_id, source_type, day, '
+        f'quantity_in, quantity_out, entries) '
+        f'SELECT %s, %s, product_id, warehouse_id, source_type, (created_at AT TIME ZONE %s)::date, '
+        f'SUM(GREATEST(change, 0)), SUM(GREATEST(-change, 0)), COUNT(*) '
+        f'FROM {ledger} WHERE {where} '
+        f'GROUP BY 3, 4, 5, 6 '
+        f'ON CONFLICT (product_id, warehouse_id, source_type, day) DO UPDATE SET '
+        f'quantity_in = {rollup}.quantity_in + EXCLUDED.quantity_in, '
+        f'quantity_out = {rollup}.quantity_out + EXCLUDED.quantity_out, '
+        f'entries = {rollup}.entries + EXCLUDED.entries, '
+        f'updated_at = EXCLUDED.updated_at',
+        [now, now, timezone.get_current_timezone_name(), *params],
+    )
+    return cursor.rowcount
+
+
+def _gaps(cursor, first_id, last_id):
+    """
+    Returns the id ranges in (first_id, last_id] with no ledger row, as
+    [lo, hi] pairs, skipping those before rows older than RESCAN_WINDOW
+    (a transaction that old has long committed or rolled back).
+    """
+    ledger = connection.ops.quote_name(StockLedger._meta.db_table)
+    cursor.execute(
+        f'SELECT previous + 1, id - 1 FROM ('
+        f'SELECT id, created_at, LAG(id, 1, %s::bigint) OVER (ORDER BY id) AS previous '
+        f'FROM {ledger} WHERE id > %s AND id <= %s) ids '
+        f'WHERE id > previous + 1 AND created_at >= %s',
+        [first_id, first_id, last_id, timezone.now() - RESCAN_WINDOW],
+    )
+    return [list(row) for row in cursor.fetchall()]
+
+
+def _fold_late(state):
+    """
+    Folds the rows that have committed into `state.gaps` since those were
+    recorded and narrows the gaps to the ids still missing; gaps older than
+    RESCAN_WINDOW are forgotten. Returns True if any row was folded.
+    """
+    if not state.gaps:
+        return False
+    now = timezone.now()
+    oldest = min(datetime.fromisoformat(noticed) for _, _, noticed in state.gaps)
+    in_gaps = reduce(or_, (Q(id__range=(lo, hi)) for lo, hi, _ in state.gaps))
+    late = sorted(StockLedger.objects.filter(
+        in_gaps, created_at__gte=oldest - RESCAN_WINDOW
+    ).values_list('id', flat=True))
+    if late:
+        with connection.cursor() as cursor:
+            _fold(cursor, 'id = ANY(%s)', [late])
+
+    gaps = []
+    for lo, hi, noticed in state.gaps:
+        if datetime.fromisoformat(noticed) < now - RESCAN_WINDOW:
+            continue
+        for found in (i for i in late if lo <= i <= hi):
+            if lo < found:
+                gaps.append([lo, found - 1, noticed])
+            lo = found + 1
+        if lo <= hi:
+            gaps.append([lo, hi, noticed])
+    state.gaps = gaps
+    return bool(late)
+
+
+def roll_up(chunk_size=CHUNK_SIZE, max_chunks=None, progress=None):
+    """
+    Folds new ledger rows into DailyMovement, one committed chunk of at most
+    `chunk_size` ids at a time, after the rows that committed late into
+    earlier chunks (see the module docstring). Returns the number of chunks processed.
+    `progress(last_ledger_id, high_water)` is called after each chunk.
+    """
+    high_water = StockLedger.objects.filter(
+        created_at__lt=timezone.now() - SAFETY_LAG
+    ).aggregate(high=Max('id'))['high'] or 0
+    with transaction.atomic():
+        # Locking the state row serializes concurrent runs.
+        state, _ = MovementRollupState.objects.select_for_update().get_or_create(pk=STATE_PK)
+        folded = _fold_late(state)
+        state.save(update_fields=['gaps', 'updated_at'])
+        if folded:
+            bump_tables(DailyMovement)
+
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        with transaction.atomic():
+            state, _ = MovementRollupState.objects.select_for_update().get_or_create(pk=STATE_PK)
+            if state.last_ledger_id >= high_water:
+                break
+            # The chunk ends at the chunk_size-th next row, however sparse the ids are.
+            last_id = StockLedger.objects.filter(
+                id__gt=state.last_ledger_id, id__lte=high_water
+            ).order_by('id').values_list('id', flat=True)[chunk_size - 1:chunk_size].first() or high_water
+            with connection.cursor() as cursor:
+                _fold(cursor, 'id > %s AND id <= %s', [state.last_ledger_id, last_id])
+                noticed = timezone.now().isoformat()
+                state.gaps += [[lo, hi, noticed] for lo, hi in _gaps(cursor, state.last_ledger_id, last_id)]
+            state.last_ledger_id = last_id
+            state.save(update_fields=['last_ledger_id', 'gaps', 'updated_at'])
+            bump_tables(DailyMovement)
+        chunks += 1
+        if progress:
+            progress(last_id, high_water)
+
+    return chunks
+
+
+def reset():
+    """
+    Empties the rollup so the next roll_up() rebuilds it from the ledger.
+    Days whose ledger partitions were archived can't be rebuilt.
+    """
+    with transaction.atomic():
+        MovementRollupState.objects.select_for_update().get_or_create(pk=STATE_PK)
+        DailyMovement.objects.all().delete()
+        MovementRollupState.objects.filter(pk=STATE_PK).update(last_ledger_id=0, gaps=[], updated_at=timezone.now())
+        bump_tables(DailyMovement)
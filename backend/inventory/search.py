@@ -0,0 +1,102 @@
+"""
+Indexed product search for typeahead and the admin.
+
+A term matches a product by
+- SKU prefix, case-insensitive, on the C-collation btree over UPPER(sku)
+  (product_sku_prefix_idx), which also returns prefixes in SKU order,
+- full-text prefix match of every word of the name, on the GIN index over
+  its 'simple' tsvector (product_search_idx),
+- trigram similarity of the name (for typos) and SKU substrings, on
+  gin_trgm_ops indexes when the pg_trgm extension is installed (migration
+  0013 adds them where it can),
+- or its category's name.
+
+Ranking every match of a common word would read a good part of the catalog,
+so each kind of match contributes at most MAX_CANDIDATES rows (SKU prefixes
+in SKU order, so an exact SKU always makes it) and only those are ranked:
+exact SKU first, then SKU prefixes, then by text rank and similarity. Terms
+shorter than MIN_TERM_LENGTH only match SKU prefixes, straight off the index
+in SKU order.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.functions import Collate, Upper
+
+from .models import Product, ProductCategory
+
+MIN_TERM_LENGTH = 3
+MAX_CANDIDATES = 500
+MAX_CATEGORIES = 50
+_WORD = re.compile(r'\w+')
+
+# Both must stay identical to the expressions of the Product indexes.
+SEARCH_VECTOR = SearchVector('name', config='simple')
+SKU_KEY = Collate(Upper('sku'), 'C')
+
+_trigram = {}
+
+
+def trigram_available():
+    """Whether pg_trgm is installed in this database (checked once per process)."""
+    if connection.alias not in _trigram:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram[connection.alias] = cursor.fetchone() is not None
+    return _trigram[connection.alias]
+
+
+def prefix_query(term):
+    """A tsquery matching every word of `term` as a prefix ('wid:* & blu:*')."""
+    words = _WORD.findall(term.lower())
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config='simple')
+
+
+def search_products(term, queryset=None):
+    """Products matching `term`, best match first."""
+    queryset = queryset if queryset is not None else Product.objects.all()
+    term = term.strip()
+    if not term:
+        return queryset.none()
+    upper = term.upper()
+
+    by_sku = Product.objects.annotate(sku_key=SKU_KEY).filter(sku_key__startswith=upper).order_by('sku_key')
+    if len(term) < MIN_TERM_LENGTH:
+        return queryset.annotate(sku_key=SKU_KEY).filter(sku_key__startswith=upper).order_by('sku_key', 'id')
+
+    candidates = [by_sku.values('pk')[:MAX_CANDIDATES]]
+    rank = Case(
+        When(sku__iexact=term, then=Value(4.0)),
+        When(sku__istartswith=term, then=Value(2.0)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+    query = prefix_query(term)
+    if query is not None:
+        candidates.append(
+            Product.objects.annotate(search=SEARCH_VECTOR).filter(search=query).values('pk')[:MAX_CANDIDATES]
+        )
+        rank = rank + SearchRank(SEARCH_VECTOR, query)
+
+    if trigram_available():
+        candidates.append(Product.objects.filter(name__trigram_similar=term).values('pk')[:MAX_CANDIDATES])
+        candidates.append(
+            Product.objects.annotate(sku_upper=Upper('sku')).filter(sku_upper__contains=upper)
+            .values('pk')[:MAX_CANDIDATES]
+        )
+        rank = rank + TrigramSimilarity('name', term)
+
+    # A handful of ids keeps the category match on the category_id index.
+    categories = list(
+        ProductCategory.objects.filter(name__icontains=term).values_list('id', flat=True)[:MAX_CATEGORIES]
+    )
+    if categories:
+        candidates.append(Product.objects.filter(category_id__in=categories).values('pk')[:MAX_CANDIDATES])
+
+    ids = candidates[0].union(*candidates[1:]) if len(candidates) > 1 else candidates[0]
+    return queryset.filter(pk__in=ids).annotate(rank=rank).order_by('-rank', 'name', 'id')
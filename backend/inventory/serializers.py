@@ -1,9 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db import transaction
+from .cache import bump_tables
 from .models import (
     Warehouse, ProductCategory, Product, Stock,
     Receipt, ReceiptItem, DeliveryOrder, DeliveryItem,
-    InternalTransfer, TransferItem, StockAdjustment, StockLedger
+    InternalTransfer, TransferItem, StockAdjustment, StockLedger, LowStockEvent,
+    ReorderSuggestion, Job, QUANTITY_DIGITS, QUANTITY_PLACES
 )
 
 # User Serializer
@@ -34,15 +37,14 @@ class StockSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     warehouse_name = serializers.CharField(source='warehouse.name', read_only=True)
     sku = serializers.CharField(source='product.sku', read_only=True)
-
-    is_low_stock = serializers.SerializerMethodField()
+    available = serializers.DecimalField(max_digits=QUANTITY_DIGITS, decimal_places=QUANTITY_PLACES, read_only=True)
 
     class Meta:
         model = Stock
         fields = '__all__'
-
-    def get_is_low_stock(self, obj):
-        return obj.quantity < obj.product.low_stock_threshold
+        # Maintained by the posting engine (inventory/alerts.py) and by
+        # reservations (inventory/reservations.py).
+        read_only_fields = ['is_low_stock', 'reserved_quantity']
 
 # --- Nested Serializers for Operations ---
 # We use these to show items INSIDE the receipt/delivery JSON
@@ -53,42 +55,117 @@ class ReceiptItemSerializer(serializers.ModelSerializer):
         model = ReceiptItem
         fields = '__all__'
 
-class ReceiptSerializer(serializers.ModelSerializer):
-    items = ReceiptItemSerializer(many=True, read_only=True)
-    warehouse_name = serializers.CharField(source='warehouse.name', read_only=True)
-
+class DeliveryItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
     class Meta:
-        model = Receipt
+        model = DeliveryItem
         fields = '__all__'
 
-class DeliveryItemSerializer(serializers.ModelSerializer):
+class TransferItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     class Meta:
-        model = DeliveryItem
+        model = TransferItem
         fields = '__all__'
 
-class DeliveryOrderSerializer(serializers.ModelSerializer):
-    items = DeliveryItemSerializer(many=True, read_only=True)
+# Lines written through their document. `product` is a plain id so the
+# document serializer can check every product in one query instead of one
+# lookup per line; the document FK (`parent_field`) is filled in on save.
+
+class ReceiptLineSerializer(ReceiptItemSerializer):
+    parent_field = 'receipt'
+    product = serializers.IntegerField(source='product_id')
+    class Meta(ReceiptItemSerializer.Meta):
+        read_only_fields = ['receipt']
+
+class DeliveryLineSerializer(DeliveryItemSerializer):
+    parent_field = 'delivery'
+    product = serializers.IntegerField(source='product_id')
+    class Meta(DeliveryItemSerializer.Meta):
+        read_only_fields = ['delivery']
+
+class TransferLineSerializer(TransferItemSerializer):
+    parent_field = 'transfer'
+    product = serializers.IntegerField(source='product_id')
+    class Meta(TransferItemSerializer.Meta):
+        read_only_fields = ['transfer']
+
+class DocumentLinesMixin:
+    """
+    Writable `items` for a document serializer: the header and all its lines
+    come in one payload. Product ids are checked with one query and the lines
+    are inserted with one bulk_create, in the same transaction as the header.
+    Sending `items` on update replaces the lines of a draft document.
+    """
+    max_lines = 1000
+
+    def validate_items(self, items):
+        if len(items) > self.max_lines:
+            raise serializers.ValidationError(f"At most {self.max_lines} lines per document.")
+        if any(item['quantity'] <= 0 for item in items):
+            raise serializers.ValidationError("Quantities must be positive.")
+        ids = {item['product_id'] for item in items}
+        missing = sorted(ids - set(Product.objects.filter(pk__in=ids).values_list('id', flat=True)))
+        if missing:
+            raise serializers.ValidationError(f"Unknown product ids: {', '.join(map(str, missing))}.")
+        return items
+
+    def write_lines(self, document, items):
+        line_serializer = self.fields['items'].child
+        model = line_serializer.Meta.model
+        model.objects.bulk_create(model(**{line_serializer.parent_field: document}, **item) for item in items)
+        # bulk_create() skips the signals that bump the table version.
+        bump_tables(model)
+
+    def create(self, validated_data):
+        items = validated_data.pop('items', [])
+        with transaction.atomic():
+            document = super().create(validated_data)
+            self.write_lines(document, items)
+        return document
+
+    def update(self, instance, validated_data):
+        items = validated_data.pop('items', None)
+        with transaction.atomic():
+            if items is not None:
+                instance.refresh_for_update('status')
+                if instance.status != instance.DRAFT:
+                    raise serializers.ValidationError({"items": "Only the lines of a draft document can be replaced."})
+                instance.items.all().delete()
+                self.write_lines(instance, items)
+            return super().update(instance, validated_data)
+
+class ReceiptSerializer(DocumentLinesMixin, serializers.ModelSerializer):
+    items = ReceiptLineSerializer(many=True, required=False)
     warehouse_name = serializers.CharField(source='warehouse.name', read_only=True)
 
     class Meta:
-        model = DeliveryOrder
+        model = Receipt
         fields = '__all__'
+        # Changed by the validate/cancel actions; validating posts the stock.
+        read_only_fields = ['status']
+
+class DeliveryOrderSerializer(DocumentLinesMixin, serializers.ModelSerializer):
+    items = DeliveryLineSerializer(many=True, required=False)
+    warehouse_name = serializers.CharField(source='warehouse.name', read_only=True)
 
-class TransferItemSerializer(serializers.ModelSerializer):
-    product_name = serializers.CharField(source='product.name', read_only=True)
     class Meta:
-        model = TransferItem
+        model = DeliveryOrder
         fields = '__all__'
+        # Changed by the reserve/release/cancel/validate actions, which keep
+        # the reservations in step.
+        read_only_fields = ['status']
 
-class InternalTransferSerializer(serializers.ModelSerializer):
-    items = TransferItemSerializer(many=True, read_only=True)
+class InternalTransferSerializer(DocumentLinesMixin, serializers.ModelSerializer):
+    items = TransferLineSerializer(many=True, required=False)
     from_warehouse_name = serializers.CharField(source='from_warehouse.name', read_only=True)
     to_warehouse_name = serializers.CharField(source='to_warehouse.name', read_only=True)
 
     class Meta:
         model = InternalTransfer
         fields = '__all__'
+        # Changed by the reserve/release/validate actions, which keep the
+        # reservations in step.
+        read_only_fields = ['status']
 
 class StockAdjustmentSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
@@ -104,4 +181,47 @@ class StockLedgerSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = StockLedger
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class LowStockEventSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    warehouse_name = serializers.CharField(source='warehouse.name', read_only=True)
+
+    class Meta:
+        model = LowStockEvent
+        fields = '__all__'
+
+class ReorderSuggestionSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    sku = serializers.CharField(source='product.sku', read_only=True)
+    warehouse_name = serializers.CharField(source='warehouse.name', read_only=True)
+
+    class Meta:
+        model = ReorderSuggestion
+        fields = '__all__'
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        exclude = ['idempotency_key', 'locked_until', 'worker']
+
+class BatchValidationSerializer(serializers.Serializer):
+    receipts = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=1000)
+    deliveries = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=1000)
+    transfers = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=1000)
+    partial = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if not (data['receipts'] or data['deliveries'] or data['transfers']):
+            raise serializers.ValidationError("Provide at least one receipt, delivery or transfer id.")
+        return data
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    skus = serializers.ListField(child=serializers.CharField(max_length=100), required=False, default=list, max_length=1000)
+    products = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=1000)
+    warehouse = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if not (data['skus'] or data['products']):
+            raise serializers.ValidationError("Provide at least one sku or product id.")
+        return data
@@ -0,0 +1,114 @@
+"""
+Model signal handlers that keep the dashboard KPI row and the table version
+stamps in step with ORM writes.
+
+Stock postings go through raw SQL in posting.py and report their own changes;
+these handlers cover everything else (API/admin edits, deletes, status
+changes). Loaded values are read from ``__dict__`` so a deferred field never
+triggers an extra query.
+"""
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump_tables
+from .alerts import refresh_low_stock
+from .kpis import adjust_kpis
+from .reservations import release
+from .models import (
+    DeliveryItem, DeliveryOrder, InternalTransfer, Product, ProductCategory, Receipt, ReceiptItem,
+    Stock, StockAdjustment, TransferItem, Warehouse
+)
+
+PENDING_KPIS = {
+    Receipt: 'pending_receipts',
+    DeliveryOrder: 'pending_deliveries',
+    InternalTransfer: 'pending_transfers',
+}
+
+
+# --- Operations: pending counters ---
+
+@receiver(post_init, sender=Receipt)
+@receiver(post_init, sender=DeliveryOrder)
+@receiver(post_init, sender=InternalTransfer)
+def remember_status(sender, instance, **kwargs):
+    instance._loaded_status = instance.__dict__.get('status') if instance.pk else None
+
+
+@receiver(post_save, sender=Receipt)
+@receiver(post_save, sender=DeliveryOrder)
+@receiver(post_save, sender=InternalTransfer)
+def count_status_change(sender, instance, created, **kwargs):
+    before = None if created else instance._loaded_status
+    after = instance.status
+    adjust_kpis(**{PENDING_KPIS[sender]: (after == sender.DRAFT) - (before == sender.DRAFT)})
+    instance._loaded_status = after
+
+
+@receiver(post_delete, sender=Receipt)
+@receiver(post_delete, sender=DeliveryOrder)
+@receiver(post_delete, sender=InternalTransfer)
+def count_deleted_operation(sender, instance, **kwargs):
+    adjust_kpis(**{PENDING_KPIS[sender]: -(instance.status == sender.DRAFT)})
+
+
+@receiver(pre_delete, sender=DeliveryOrder)
+@receiver(pre_delete, sender=InternalTransfer)
+def release_deleted_operation(sender, instance, **kwargs):
+    # Reservations aren't tied to the document by a foreign key, so they
+    # would otherwise outlive it.
+    if instance.status == sender.RESERVED:
+        release([instance])
+
+
+# --- Products: total count and threshold changes ---
+
+@receiver(post_init, sender=Product)
+def remember_threshold(sender, instance, **kwargs):
+    instance._loaded_threshold = instance.__dict__.get('low_stock_threshold') if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+def count_product_change(sender, instance, created, **kwargs):
+    if created:
+        adjust_kpis(total_products=1)
+    elif instance._loaded_threshold not in (None, instance.low_stock_threshold):
+        refresh_low_stock(products=[instance.pk])
+    instance._loaded_threshold = instance.low_stock_threshold
+
+
+@receiver(post_delete, sender=Product)
+def count_deleted_product(sender, instance, **kwargs):
+    adjust_kpis(total_products=-1)
+
+
+# --- Stock rows edited through the ORM ---
+
+@receiver(post_save, sender=Stock)
+def flag_saved_stock(sender, instance, **kwargs):
+    refresh_low_stock([(instance.product_id, instance.warehouse_id)])
+
+
+@receiver(post_delete, sender=Stock)
+def count_deleted_stock(sender, instance, **kwargs):
+    adjust_kpis(low_stock_items=-instance.is_low_stock)
+
+
+# --- Table version stamps (ETags and the catalog cache) ---
+
+# StockLedger is append-only and only written by the posting engine, which
+# bumps its stamp itself; leaving it out keeps cascading deletes fast.
+VERSIONED_MODELS = (
+    Warehouse, ProductCategory, Product, Stock,
+    Receipt, ReceiptItem, DeliveryOrder, DeliveryItem,
+    InternalTransfer, TransferItem, StockAdjustment,
+)
+
+
+def bump_table_version(sender, **kwargs):
+    bump_tables(sender)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_table_version, sender=model, dispatch_uid=f'version-save-{model._meta.label}')
+    post_delete.connect(bump_table_version, sender=model, dispatch_uid=f'version-delete-{model._meta.label}')
@@ -0,0 +1,109 @@
+"""
+Point-in-time stock snapshots.
+
+A snapshot run copies every Stock row into StockSnapshot in one INSERT ...
+SELECT. Historical balances are then answered from whichever checkpoint is
+closest to the requested time (a snapshot run, or the live Stock table) plus
+the ledger rows between the two, so only a bounded slice of StockLedger is
+ever read. Once old months of the ledger are archived, moments before them
+can no longer be answered and snapshots taken before them are not used.
+"""
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Stock, StockLedger, StockSnapshot, StockSnapshotRun
+from .partitions import archived_before
+
+
+def take_snapshot():
+    """
+    Checkpoints all Stock rows and returns the new StockSnapshotRun.
+
+    On PostgreSQL the Stock table is held in SHARE mode while it is copied:
+    postings already in flight finish first and new ones wait for the copy, so
+    the snapshot reflects exactly the ledger rows created before `taken_at`.
+    """
+    stock_table = connection.ops.quote_name(Stock._meta.db_table)
+    snapshot_table = connection.ops.quote_name(StockSnapshot._meta.db_table)
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {stock_table} IN SHARE MODE')
+
+        now = timezone.now()
+        run = StockSnapshotRun.objects.create(taken_at=now)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {snapshot_table} (created_at, updated_at, run_id, product_id, warehouse_id, quantity) '
+                f'SELECT %s, %s, %s, product_id, warehouse_id, quantity FROM {stock_table}',
+                [now, now, run.id],
+            )
+    return run
+
+
+def prune_snapshots(before):
+    """Deletes snapshot runs taken before `before`, always keeping the latest one."""
+    latest = StockSnapshotRun.objects.order_by('-taken_at').values_list('id', flat=True).first()
+    return StockSnapshotRun.objects.filter(taken_at__lt=before).exclude(id=latest).delete()
+
+
+def _ledger_delta(start, end, filters):
+    rows = (
+        StockLedger.objects.filter(created_at__gte=start, created_at__lt=end, **filters)
+        .values('product_id', 'warehouse_id')
+        .annotate(total=Sum('change'))
+    )
+    return {(row['product_id'], row['warehouse_id']): row['total'] for row in rows}
+
+
+def stock_as_of(moment, product=None, warehouse=None):
+    """
+    Returns ({(product_id, warehouse_id): quantity}, checkpoint) for the stock
+    position just before `moment`. `checkpoint` is the StockSnapshotRun used,
+    or None when the live Stock table was closer. Raises ValidationError for
+    moments before the archived part of the ledger.
+    """
+    floor = archived_before()
+    if floor is not None and moment < floor:
+        raise ValidationError(f"Stock history before {floor:%Y-%m-%d} has been archived.")
+    runs = StockSnapshotRun.objects.all()
+    if floor is not None:
+        # Rolling from an older run would need the archived rows.
+        runs = runs.filter(taken_at__gte=floor)
+
+    filters = {}
+    if product:
+        filters['product_id'] = product
+    if warehouse:
+        filters['warehouse_id'] = warehouse
+
+    now = timezone.now()
+    candidates = [(abs((now - moment).total_seconds()), None, now)]
+    before = runs.filter(taken_at__lte=moment).order_by('-taken_at').first()
+    after = runs.filter(taken_at__gt=moment).order_by('taken_at').first()
+    for run in (before, after):
+        if run is not None:
+            candidates.append((abs((run.taken_at - moment).total_seconds()), run, run.taken_at))
+    _, checkpoint, taken_at = min(candidates, key=lambda candidate: candidate[0])
+
+    if checkpoint is None:
+        base = Stock.objects.filter(**filters)
+    else:
+        base = checkpoint.rows.filter(**filters)
+    quantities = {
+        (product_id, warehouse_id): quantity
+        for product_id, warehouse_id, quantity in base.values_list('product_id', 'warehouse_id', 'quantity')
+    }
+
+    # Roll forward from an older checkpoint, or back from a newer one.
+    if taken_at <= moment:
+        sign, delta = 1, _ledger_delta(taken_at, moment, filters)
+    else:
+        sign, delta = -1, _ledger_delta(moment, taken_at, filters)
+    for key, change in delta.items():
+        quantities[key] = quantities.get(key, 0) + sign * change
+
+    return quantities, checkpoint
@@ -1,3 +1,1364 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import random
+import gzip
+import tempfile
+import threading
+from pathlib import Path
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your tests here.
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, Client, AsyncClient, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db import models
+from django.db.models import Sum
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import caches
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from .models import (
+    Warehouse, ProductCategory, Product, Stock, StockLedger,
+    Receipt, ReceiptItem, DeliveryOrder, DeliveryItem,
+    InternalTransfer, TransferItem, StockAdjustment, StockSnapshotRun, LowStockEvent,
+    ReorderSuggestion, Job, DailyMovement, StockReservation, LedgerArchiveState,
+    MovementRollupState
+)
+from .kpis import compute_kpis, get_kpis
+from .posting import Movement, post_movements
+from .snapshots import take_snapshot
+from .bulk import import_products, import_stock, read_rows
+from .events import broker
+from .replenishment import refresh_suggestions
+from . import jobs
+from .metrics import registry as metrics_registry
+from . import benchmark, partitions, rollups
+from .authentication import issue_token, token_cache
+from .cache import bump_version, get_version
+from .search import search_products
+
+
+_cache_dir = tempfile.TemporaryDirectory()
+# The shared tier is file based; keep the tests out of the real cache directory.
+_test_caches = override_settings(CACHES={
+    **settings.CACHES, 'shared': {**settings.CACHES['shared'], 'LOCATION': _cache_dir.name},
+})
+
+
+def setUpModule():
+    _test_caches.enable()
+
+
+def tearDownModule():
+    _test_caches.disable()
+    _cache_dir.cleanup()
+
+
+class StockPostingTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.backup = Warehouse.objects.create(name="Backup")
+        self.products = [
+            Product.objects.create(name=f"Product {i}", sku=f"SKU-{i}", unit="pcs")
+            for i in range(5)
+        ]
+
+    def make_receipt(self, lines):
+        receipt = Receipt.objects.create(supplier="Acme", warehouse=self.main)
+        ReceiptItem.objects.bulk_create(
+            ReceiptItem(receipt=receipt, product=product, quantity=qty) for product, qty in lines
+        )
+        return receipt
+
+    def test_receipt_creates_stock_and_ledger(self):
+        receipt = self.make_receipt([(self.products[0], 5), (self.products[0], 3), (self.products[1], 2)])
+        receipt.validate_receipt()
+
+        self.assertEqual(Stock.objects.get(product=self.products[0], warehouse=self.main).quantity, 8)
+        self.assertEqual(Stock.objects.get(product=self.products[1], warehouse=self.main).quantity, 2)
+        balances = list(
+            StockLedger.objects.filter(product=self.products[0]).order_by('id').values_list('balance', flat=True)
+        )
+        self.assertEqual(balances, [5, 8])
+        self.assertEqual(Receipt.objects.get(pk=receipt.pk).status, Receipt.DONE)
+
+    def test_validation_query_count_does_not_grow_with_lines(self):
+        small = self.make_receipt([(self.products[0], 1)])
+        large = self.make_receipt([(product, 1) for product in self.products] * 20)
+
+        for receipt in (small, large):
+            with CaptureQueriesContext(connection) as queries:
+                receipt.validate_receipt()
+            self.assertLessEqual(len(queries), 14)
+
+    def test_fractional_quantities_do_not_drift(self):
+        for _ in range(10):
+            self.make_receipt([(self.products[0], Decimal('0.1'))]).validate_receipt()
+        delivery = DeliveryOrder.objects.create(customer="Bob", warehouse=self.main)
+        DeliveryItem.objects.create(delivery=delivery, product=self.products[0], quantity=Decimal('1'))
+        delivery.validate_delivery()
+
+        self.assertEqual(Stock.objects.get(product=self.products[0], warehouse=self.main).quantity, 0)
+        self.assertEqual(StockLedger.objects.order_by('-id').values_list('balance', flat=True).first(), 0)
+
+    def test_insufficient_delivery_rolls_back(self):
+        self.make_receipt([(self.products[0], 4)]).validate_receipt()
+        delivery = DeliveryOrder.objects.create(customer="Bob", warehouse=self.main)
+        DeliveryItem.objects.create(delivery=delivery, product=self.products[0], quantity=3)
+        DeliveryItem.objects.create(delivery=delivery, product=self.products[1], quantity=1)
+
+        with self.assertRaises(ValidationError):
+            delivery.validate_delivery()
+
+        self.assertEqual(Stock.objects.get(product=self.products[0], warehouse=self.main).quantity, 4)
+        self.assertFalse(Stock.objects.filter(product=self.products[1]).exists())
+        self.assertEqual(DeliveryOrder.objects.get(pk=delivery.pk).status, DeliveryOrder.DRAFT)
+
+    def test_transfer_moves_stock_between_warehouses(self):
+        self.make_receipt([(self.products[0], 10)]).validate_receipt()
+        transfer = InternalTransfer.objects.create(from_warehouse=self.main, to_warehouse=self.backup)
+        TransferItem.objects.create(transfer=transfer, product=self.products[0], quantity=4)
+
+        response = self.client.post(f'/api/transfers/{transfer.id}/validate/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Stock.objects.get(product=self.products[0], warehouse=self.main).quantity, 6)
+        self.assertEqual(Stock.objects.get(product=self.products[0], warehouse=self.backup).quantity, 4)
+        self.assertEqual(StockLedger.objects.filter(source_type__startswith='Transfer').count(), 2)
+
+
+class ConcurrentValidationStressTests(TransactionTestCase):
+    """
+    Fires a few hundred simultaneous /deliveries/{id}/validate/ calls from
+    separate connections and checks that nothing was lost or oversold.
+    """
+    workers = 16
+    deliveries = 120
+
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name="Main")
+        self.products = [
+            Product.objects.create(name=f"Product {i}", sku=f"SKU-{i}", unit="pcs")
+            for i in range(4)
+        ]
+        receipt = Receipt.objects.create(supplier="Acme", warehouse=self.warehouse)
+        for product in self.products:
+            ReceiptItem.objects.create(receipt=receipt, product=product, quantity=150)
+        receipt.validate_receipt()
+
+        # Every delivery touches all products in a random line order, and the
+        # total demand exceeds what is on hand so some of them must fail.
+        rng = random.Random(7)
+        self.delivery_ids = []
+        for _ in range(self.deliveries):
+            delivery = DeliveryOrder.objects.create(customer="Bob", warehouse=self.warehouse)
+            for product in rng.sample(self.products, len(self.products)):
+                DeliveryItem.objects.create(delivery=delivery, product=product, quantity=rng.randint(1, 3))
+            self.delivery_ids.append(delivery.id)
+
+    def validate(self, delivery_id):
+        try:
+            return Client().post(f'/api/deliveries/{delivery_id}/validate/').status_code
+        finally:
+            connection.close()
+
+    def test_parallel_validations_keep_stock_consistent(self):
+        # Each delivery is submitted twice to also race duplicate validations.
+        calls = self.delivery_ids * 2
+        random.Random(11).shuffle(calls)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            codes = list(pool.map(self.validate, calls))
+
+        self.assertEqual(set(codes) - {200, 400}, set())
+        done = DeliveryOrder.objects.filter(status=DeliveryOrder.DONE)
+        self.assertEqual(codes.count(200), done.count())
+        self.assertEqual(
+            StockLedger.objects.filter(source_type='Delivery').values('source_id').distinct().count(),
+            done.count(),
+        )
+
+        for stock in Stock.objects.all():
+            ledger_total = StockLedger.objects.filter(
+                product=stock.product, warehouse=stock.warehouse
+            ).aggregate(total=Sum('change'))['total']
+            self.assertAlmostEqual(stock.quantity, ledger_total)
+            self.assertGreaterEqual(stock.quantity, 0)
+
+
+class LedgerPaginationTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.backup = Warehouse.objects.create(name="Backup")
+        self.product = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+        StockLedger.objects.bulk_create(
+            StockLedger(
+                product=self.product, warehouse=self.main if i % 2 else self.backup,
+                change=1, balance=i, source_type='Receipt', source_id=i,
+            )
+            for i in range(25)
+        )
+
+    def test_pages_cover_ledger_once_in_both_directions(self):
+        seen = []
+        url = '/api/ledger/?page_size=10'
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data)
+            seen.extend(row['id'] for row in data['results'])
+            url = data['next']
+
+        expected = list(StockLedger.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual([len(page['results']) for page in pages], [10, 10, 5])
+
+        back = self.client.get(pages[-1]['previous']).json()
+        self.assertEqual(back['results'], pages[1]['results'])
+
+    def test_filters(self):
+        data = self.client.get(f'/api/ledger/?warehouse={self.main.id}&source_type=Receipt').json()
+        self.assertEqual(len(data['results']), 12)
+        self.assertEqual(self.client.get('/api/ledger/?start=2000-01-01&end=2000-01-31').json()['results'], [])
+        self.assertEqual(self.client.get('/api/ledger/?start=yesterday').status_code, 400)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every list endpoint has a fixed query budget. Doubling the data must not
+    change the count, which is what catches a missing select/prefetch.
+    """
+    budgets = {
+        '/api/products/': 1,
+        '/api/stock/': 1,
+        '/api/receipts/': 2,
+        '/api/receipt-items/': 1,
+        '/api/deliveries/': 2,
+        '/api/delivery-items/': 1,
+        '/api/transfers/': 2,
+        '/api/transfer-items/': 1,
+        '/api/adjustments/': 1,
+        '/api/ledger/': 1,
+    }
+
+    def setUp(self):
+        self.category = ProductCategory.objects.create(name="Tools")
+        self.main = Warehouse.objects.create(name="Main")
+        self.backup = Warehouse.objects.create(name="Backup")
+        self.batch = 0
+
+    def add_data(self):
+        self.batch += 1
+        products = [
+            Product.objects.create(name=f"P{self.batch}-{i}", sku=f"P{self.batch}-{i}", unit="pcs", category=self.category)
+            for i in range(3)
+        ]
+        for product in products:
+            Stock.objects.create(product=product, warehouse=self.main, quantity=100)
+            StockAdjustment.objects.create(product=product, warehouse=self.main, counted_quantity=5)
+            StockLedger.objects.create(
+                product=product, warehouse=self.main, change=1, balance=1, source_type='Receipt', source_id=1
+            )
+        for _ in range(2):
+            receipt = Receipt.objects.create(supplier="Acme", warehouse=self.main)
+            delivery = DeliveryOrder.objects.create(customer="Bob", warehouse=self.main)
+            transfer = InternalTransfer.objects.create(from_warehouse=self.main, to_warehouse=self.backup)
+            for product in products:
+                ReceiptItem.objects.create(receipt=receipt, product=product, quantity=1)
+                DeliveryItem.objects.create(delivery=delivery, product=product, quantity=1)
+                TransferItem.objects.create(transfer=transfer, product=product, quantity=1)
+
+    def test_list_endpoints_stay_within_budget(self):
+        for _ in range(2):
+            self.add_data()
+            for url, budget in self.budgets.items():
+                with self.subTest(url=url, batch=self.batch):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertLessEqual(len(queries), budget, '\n'.join(q['sql'] for q in queries))
+
+
+class DashboardKpiTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.widget = Product.objects.create(name="Widget", sku="W-1", unit="pcs", low_stock_threshold=10)
+        self.gadget = Product.objects.create(name="Gadget", sku="G-1", unit="pcs", low_stock_threshold=5)
+        self.client.get('/api/dashboard/')  # materializes the summary row
+
+    def assertKpisInSync(self):
+        self.assertEqual(get_kpis(), compute_kpis())
+
+    def test_counters_follow_operations(self):
+        receipt = Receipt.objects.create(supplier="Acme", warehouse=self.main)
+        ReceiptItem.objects.create(receipt=receipt, product=self.widget, quantity=20)
+        ReceiptItem.objects.create(receipt=receipt, product=self.gadget, quantity=3)
+        self.assertEqual(get_kpis()['pending_receipts'], 1)
+        receipt.validate_receipt()
+        self.assertKpisInSync()
+
+        delivery = DeliveryOrder.objects.create(customer="Bob", warehouse=self.main)
+        DeliveryItem.objects.create(delivery=delivery, product=self.widget, quantity=15)
+        self.client.post(f'/api/deliveries/{delivery.id}/validate/')
+        self.assertKpisInSync()
+        self.assertEqual(get_kpis()['low_stock_items'], 2)
+
+        self.client.post('/api/adjustments/', {
+            'product': self.widget.id, 'warehouse': self.main.id, 'counted_quantity': 50,
+        })
+        self.gadget.low_stock_threshold = 2
+        self.gadget.save()
+        self.assertKpisInSync()
+        self.assertEqual(get_kpis()['low_stock_items'], 0)
+
+        InternalTransfer.objects.create(from_warehouse=self.main, to_warehouse=self.main)
+        self.widget.delete()
+        Stock.objects.create(product=self.gadget, warehouse=Warehouse.objects.create(name="Backup"))
+        self.assertKpisInSync()
+
+    def test_dashboard_is_one_query(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/dashboard/').json()
+        self.assertEqual(data['total_products'], 2)
+
+
+class OperationsOverviewTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.backup = Warehouse.objects.create(name="Backup")
+        for created, warehouse in [
+            ('2026-01-05', self.main), ('2026-01-20', self.main), ('2026-03-02', self.backup),
+        ]:
+            receipt = Receipt.objects.create(supplier="Acme", warehouse=warehouse, status=Receipt.DONE)
+            Receipt.objects.filter(pk=receipt.pk).update(created_at=f'{created}T10:00:00Z')
+        delivery = DeliveryOrder.objects.create(customer="Bob", warehouse=self.main, status=DeliveryOrder.DONE)
+        DeliveryOrder.objects.filter(pk=delivery.pk).update(created_at='2026-02-14T10:00:00Z')
+        Receipt.objects.create(supplier="Acme", warehouse=self.main)  # draft, not counted
+
+    def test_monthly_buckets_in_two_queries(self):
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/dashboard/operations-overview/?start=2026-01-01&end=2026-03-31').json()
+        self.assertEqual(
+            [(row['period'], row['receipts'], row['deliveries']) for row in data],
+            [('Jan 2026', 2, 0), ('Feb 2026', 0, 1), ('Mar 2026', 1, 0)],
+        )
+
+    def test_weekly_buckets_filtered_by_warehouse(self):
+        data = self.client.get(
+            f'/api/dashboard/operations-overview/?granularity=week&start=2026-01-01&end=2026-01-31&warehouse={self.main.id}'
+        ).json()
+        self.assertEqual(data[0]['start'], '2025-12-29')
+        self.assertEqual(sum(row['receipts'] for row in data), 2)
+
+    def test_defaults_to_last_six_calendar_months(self):
+        data = self.client.get('/api/dashboard/operations-overview/').json()
+        self.assertEqual(len(data), 6)
+        self.assertTrue(all(row['start'].endswith('-01') for row in data))
+
+    def test_rejects_bad_granularity(self):
+        response = self.client.get('/api/dashboard/operations-overview/?granularity=year')
+        self.assertEqual(response.status_code, 400)
+
+
+class StockAsOfTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.product = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+
+    def post(self, change, when):
+        entry = post_movements([Movement(self.product.id, self.main.id, change, 'Receipt', 1)])[0]
+        StockLedger.objects.filter(pk=entry.pk).update(created_at=when)
+
+    def quantity_at(self, date):
+        data = self.client.get(f'/api/stock/as-of/?date={date}').json()
+        return {row['product']: row['quantity'] for row in data['results']}.get(self.product.id, 0), data['snapshot']
+
+    def test_answers_from_snapshots_and_live_stock(self):
+        self.post(10, '2026-01-10T12:00:00Z')
+        run = take_snapshot()
+        StockSnapshotRun.objects.filter(pk=run.pk).update(taken_at='2026-01-31T00:00:00Z')
+        self.post(5, '2026-02-10T12:00:00Z')
+        self.post(-3, '2026-03-10T12:00:00Z')
+
+        self.assertEqual(self.quantity_at('2026-01-05'), (0, run.id))
+        self.assertEqual(self.quantity_at('2026-01-31'), (10, run.id))
+        self.assertEqual(self.quantity_at('2026-02-20'), (15, run.id))
+        self.assertEqual(self.quantity_at(timezone.localdate().isoformat()), (12, None))
+
+    def test_requires_date(self):
+        self.assertEqual(self.client.get('/api/stock/as-of/').status_code, 400)
+
+    def test_refuses_archived_history(self):
+        self.post(10, '2026-01-10T12:00:00Z')
+        old = take_snapshot()
+        StockSnapshotRun.objects.filter(pk=old.pk).update(taken_at='2026-01-20T00:00:00Z')
+        LedgerArchiveState.objects.create(pk=partitions.STATE_PK, archived_before='2026-02-01T00:00:00Z')
+
+        response = self.client.get('/api/stock/as-of/?date=2026-01-15')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('archived', response.json()['date'])
+        # The January snapshot would need archived rows to roll forward.
+        self.assertEqual(self.quantity_at('2026-02-05'), (10, None))
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.client.get('/api/dashboard/')
+
+    def upload(self, url, name, content):
+        return self.client.post(url, {'file': SimpleUploadedFile(name, content.encode())}).json()
+
+    def test_product_csv_upserts_and_posts_opening_stock(self):
+        csv_data = (
+            "sku,name,unit,category,low_stock_threshold,warehouse,quantity\n"
+            "A-1,Alpha,pcs,Tools,5,Main,12\n"
+            "B-1,Beta,kg,Tools,,,\n"
+            ",Nameless,pcs,,,,\n"
+            "C-1,Gamma,pcs,,,Nowhere,3\n"
+        )
+        report = self.upload('/api/products/bulk-import/', 'catalog.csv', csv_data)
+
+        self.assertEqual((report['rows'], report['created'], report['errors']), (4, 2, 2))
+        self.assertEqual([row['row'] for row in report['error_rows']], [4, 5])
+        self.assertEqual(Stock.objects.get(product__sku='A-1', warehouse=self.main).quantity, 12)
+        self.assertEqual(StockLedger.objects.get(product__sku='A-1').source_type, 'Opening Stock')
+        self.assertEqual(Product.objects.get(sku='B-1').category.name, 'Tools')
+
+        report = self.upload(
+            '/api/products/bulk-import/', 'catalog.jsonl',
+            '{"sku": "A-1", "name": "Alpha v2", "unit": "pcs", "low_stock_threshold": 20}\nnot json\n',
+        )
+        self.assertEqual((report['created'], report['updated'], report['errors']), (0, 1, 1))
+        self.assertEqual(Product.objects.get(sku='A-1').name, 'Alpha v2')
+        self.assertEqual(get_kpis(), compute_kpis())
+
+    def test_stock_import_in_small_chunks(self):
+        for n in range(5):
+            Product.objects.create(name=f"Alpha {n}", sku=f"A-{n}", unit="pcs")
+        rows = "".join(f'{{"sku": "A-{n}", "warehouse": {self.main.id}, "quantity": 2}}\n' for n in range(5))
+        rows += f'{{"sku": "A-0", "warehouse": {self.main.id}, "quantity": 3}}\n{{"sku": "Z-9", "quantity": 1}}\n'
+        report = import_stock(read_rows(io.StringIO(rows), 'jsonl'), chunk_size=2)
+
+        self.assertEqual((report.rows, report.opening_lines, report.error_count), (7, 5, 2))
+        self.assertEqual(Stock.objects.aggregate(total=Sum('quantity'))['total'], 10)
+
+    def test_importing_the_same_file_again_changes_nothing(self):
+        csv_data = "sku,name,unit,warehouse,quantity\nA-1,Alpha,pcs,Main,12\nB-1,Beta,pcs,Main,4\n"
+        self.upload('/api/products/bulk-import/', 'catalog.csv', csv_data)
+        post_movements([Movement(Product.objects.get(sku='B-1').pk, self.main.pk, -1, 'Delivery', 1)])
+
+        report = self.upload('/api/products/bulk-import/', 'catalog.csv', csv_data)
+        self.assertEqual((report['updated'], report['opening_lines'], report['errors']), (2, 1, 0))
+        self.assertEqual(
+            dict(Stock.objects.values_list('product__sku', 'quantity')), {'A-1': 12, 'B-1': 4},
+        )
+        self.assertEqual(StockLedger.objects.filter(product__sku='A-1').count(), 1)
+        self.assertEqual(self.upload('/api/stock/bulk-import/', 'stock.csv', "sku,warehouse,quantity\nA-1,Main,12\n")['opening_lines'], 0)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.product = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+        receipt = Receipt.objects.create(supplier="Acme", warehouse=self.main)
+        ReceiptItem.objects.create(receipt=receipt, product=self.product, quantity=4)
+        ReceiptItem.objects.create(receipt=receipt, product=self.product, quantity=6)
+        receipt.validate_receipt()
+
+    def read(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ledger_csv(self):
+        lines = self.read('/api/ledger/export/').splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['id', 'created_at', 'product', 'sku'])
+        self.assertEqual([line.split(',')[7:9] for line in lines[1:]], [['4.000', '4.000'], ['6.000', '10.000']])
+
+    def test_stock_ndjson(self):
+        rows = [json.loads(line) for line in self.read('/api/stock/export/?file_format=ndjson').splitlines()]
+        self.assertEqual(rows[0]['sku'], 'W-1')
+        self.assertEqual(rows[0]['quantity'], 10)
+
+    def test_receipt_lines_filtered_by_status(self):
+        self.assertEqual(len(self.read('/api/receipts/export/?status=done').splitlines()), 3)
+        self.assertEqual(len(self.read('/api/receipts/export/?status=draft').splitlines()), 1)
+        self.assertEqual(self.client.get('/api/receipts/export/?file_format=xml').status_code, 400)
+
+
+class BatchValidationTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.product = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+        self.client.get('/api/dashboard/')
+
+    def receipt(self, quantity):
+        receipt = Receipt.objects.create(supplier="Acme", warehouse=self.main)
+        ReceiptItem.objects.create(receipt=receipt, product=self.product, quantity=quantity)
+        return receipt.id
+
+    def delivery(self, quantity):
+        delivery = DeliveryOrder.objects.create(customer="Bob", warehouse=self.main)
+        DeliveryItem.objects.create(delivery=delivery, product=self.product, quantity=quantity)
+        return delivery.id
+
+    def validate(self, **body):
+        return self.client.post('/api/operations/validate/', body, content_type='application/json')
+
+    def stock(self):
+        return Stock.objects.get(product=self.product, warehouse=self.main).quantity
+
+    def test_receipts_feed_deliveries_in_the_same_batch(self):
+        receipts = [self.receipt(5) for _ in range(10)]
+        deliveries = [self.delivery(4) for _ in range(10)]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.validate(receipts=receipts, deliveries=deliveries)
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(queries), 25)
+        self.assertEqual(self.stock(), 10)
+        self.assertEqual(StockLedger.objects.count(), 20)
+        self.assertEqual(get_kpis(), compute_kpis())
+
+    def test_atomic_batch_rolls_back_on_any_failure(self):
+        receipt = self.receipt(5)
+        response = self.validate(receipts=[receipt], deliveries=[self.delivery(8)])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Receipt.objects.get(pk=receipt).status, Receipt.DRAFT)
+        self.assertFalse(StockLedger.objects.exists())
+
+    def test_partial_batch_reports_failures(self):
+        ok, too_big = self.delivery(3), self.delivery(50)
+        response = self.validate(receipts=[self.receipt(5)], deliveries=[ok, too_big, 999999], partial=True)
+
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['validated']['deliveries'], [ok])
+        self.assertEqual(sorted(error['id'] for error in data['errors']), [too_big, 999999])
+        self.assertEqual(self.stock(), 2)
+        self.assertEqual(get_kpis(), compute_kpis())
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        self.client = Client()
+        self.category = ProductCategory.objects.create(name="Tools")
+        self.product = Product.objects.create(name="Hammer", sku="HAM-1", unit="pcs", category=self.category)
+
+    def test_repeat_reads_are_served_from_cache(self):
+        first = self.client.get('/api/products/').json()
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get('/api/products/').json()
+        self.assertEqual(first, second)
+        self.assertEqual(len(queries), 0)
+
+        caches['default'].clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/products/').json(), first)
+        self.assertEqual(len(queries), 0)
+        stats = self.client.get('/api/cache-stats/').json()['namespaces']['product']
+        self.assertEqual((stats['misses'], stats['local_hits'], stats['shared_hits']), (1, 1, 1))
+
+    def test_writes_invalidate_dependent_responses(self):
+        url = f'/api/products/{self.product.pk}/'
+        self.client.get('/api/products/')
+        self.client.get(url)
+
+        self.client.patch(url, {"name": "Claw Hammer"}, content_type='application/json')
+        self.assertEqual(self.client.get(url).json()['name'], "Claw Hammer")
+
+        self.category.name = "Hand Tools"
+        self.category.save()
+        self.assertEqual(self.client.get('/api/products/').json()[0]['category_name'], "Hand Tools")
+
+        import_products(read_rows(io.StringIO("sku,name,unit\nHAM-2,Mallet,pcs\n"), 'csv'))
+        self.assertEqual(len(self.client.get('/api/products/').json()), 2)
+
+    def test_concurrent_bumps_each_leave_a_new_version(self):
+        def bump(_):
+            bump_version('product')
+            return get_version('product')
+
+        before = get_version('product')
+        with ThreadPoolExecutor(8) as pool:
+            seen = set(pool.map(bump, range(40)))
+        self.assertNotIn(before, seen)
+        self.assertIn(get_version('product'), seen)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        caches['shared'].clear()
+        self.client = Client()
+        self.warehouse = Warehouse.objects.create(name="Main")
+        self.product = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+
+    def test_unchanged_collection_returns_304_without_queries(self):
+        for url in ('/api/stock/', '/api/products/', '/api/dashboard/', f'/api/products/{self.product.pk}/'):
+            etag = self.client.get(url)['ETag']
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(len(queries), 0, url)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_postings_and_edits_change_the_etag(self):
+        stock_etag = self.client.get('/api/stock/')['ETag']
+        dashboard_etag = self.client.get('/api/dashboard/')['ETag']
+        receipt = Receipt.objects.create(supplier="Acme", warehouse=self.warehouse)
+        ReceiptItem.objects.create(receipt=receipt, product=self.product, quantity=5)
+        receipt.validate_receipt()
+
+        response = self.client.get('/api/stock/', HTTP_IF_NONE_MATCH=stock_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['quantity'], 5)
+        self.assertEqual(self.client.get('/api/dashboard/', HTTP_IF_NONE_MATCH=dashboard_etag).status_code, 200)
+
+        # Stock rows show the product name, so renaming it invalidates them too.
+        stock_etag = response['ETag']
+        Product.objects.filter(pk=self.product.pk).first().save()
+        self.assertEqual(self.client.get('/api/stock/', HTTP_IF_NONE_MATCH=stock_etag).status_code, 200)
+
+    def test_etag_varies_with_query_parameters(self):
+        self.assertNotEqual(
+            self.client.get('/api/stock/')['ETag'],
+            self.client.get('/api/stock/', {'warehouse': self.warehouse.pk})['ETag'],
+        )
+
+
+class StockEventFeedTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.backup = Warehouse.objects.create(name="Backup")
+        self.product = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+        user = User.objects.create_user('ann', password='pw-123456')
+        self.auth = {'Authorization': f'Token {issue_token(user).key}'}
+
+    def test_committed_postings_are_broadcast_per_warehouse(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            post_movements([
+                Movement(self.product.pk, self.main.pk, 5, 'Receipt', 1),
+                Movement(self.product.pk, self.backup.pk, 2, 'Receipt', 1),
+            ])
+
+        async def listen():
+            main_only, everything = broker.subscribe({self.main.pk}), broker.subscribe()
+            try:
+                for callback in callbacks:
+                    callback()
+                await asyncio.sleep(0)
+                return (
+                    [main_only.queue.get_nowait() for _ in range(main_only.queue.qsize())],
+                    [everything.queue.get_nowait() for _ in range(everything.queue.qsize())],
+                )
+            finally:
+                broker.unsubscribe(main_only)
+                broker.unsubscribe(everything)
+
+        main_events, all_events = asyncio.run(listen())
+        self.assertEqual([(e['warehouse'], e['change'], e['balance']) for e in main_events], [(self.main.pk, 5, 5)])
+        self.assertEqual(len(all_events), 2)
+        self.assertEqual(len(broker), 0)
+
+    def test_sse_stream_requires_asgi(self):
+        self.assertEqual(Client().get('/api/stock/events/').status_code, 501)
+
+    async def test_sse_stream_filters_by_warehouse(self):
+        self.assertEqual((await AsyncClient().get('/api/stock/events/')).status_code, 401)
+        response = await AsyncClient().get(f'/api/stock/events/?warehouse={self.main.pk}', headers=self.auth)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+
+        broker.publish([
+            {'id': 1, 'warehouse': self.backup.pk, 'product': self.product.pk, 'change': 1, 'balance': 1,
+             'source_type': 'Receipt', 'source_id': 1, 'created_at': None},
+            {'id': 2, 'warehouse': self.main.pk, 'product': self.product.pk, 'change': 3, 'balance': 3,
+             'source_type': 'Receipt', 'source_id': 1, 'created_at': None},
+        ])
+        chunk = (await anext(stream)).decode()
+        self.assertTrue(chunk.startswith('id: 2\nevent: stock\n'))
+        self.assertEqual(json.loads(chunk.split('data: ')[1])['balance'], 3)
+        # The ASGI handler cancels the pending read when the client goes away.
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(len(broker), 0)
+
+
+@override_settings(STOCK_EVENTS_POLL_SECONDS=0.05)
+class StockEventTailTests(TransactionTestCase):
+    """The SSE stream against rows committed on other connections."""
+
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.product = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+        user = User.objects.create_user('ann', password='pw-123456')
+        self.auth = {'Authorization': f'Token {issue_token(user).key}'}
+
+    def write(self, change):
+        # Written straight to the table, as another process would: the broker never hears of it.
+        return StockLedger.objects.acreate(
+            product=self.product, warehouse=self.main, change=change, balance=change, source_type='Receipt', source_id=1,
+        )
+
+    async def test_stream_tails_the_ledger(self):
+        gap = await self.write(1)
+        await StockLedger.objects.filter(pk=gap.pk).adelete()
+
+        stream = (await AsyncClient().get('/api/stock/events/', headers=self.auth)).streaming_content
+        await anext(stream)
+        entry = await self.write(2)
+        self.assertTrue((await anext(stream)).decode().startswith(f'id: {entry.pk}\n'))
+        # A row with a lower id that commits late is still sent, once.
+        await gap.asave(force_insert=True)
+        self.assertTrue((await anext(stream)).decode().startswith(f'id: {gap.pk}\n'))
+
+        url = f'/api/stock/events/?last_event_id={gap.pk - 1}'
+        resumed = (await AsyncClient().get(url, headers=self.auth)).streaming_content
+        await anext(resumed)
+        self.assertEqual([(await anext(resumed)).decode().split('\n')[0] for _ in range(2)],
+                         [f'id: {gap.pk}', f'id: {entry.pk}'])
+        # One tail per process, however many streams are open.
+        self.assertEqual([thread.name for thread in threading.enumerate()].count('ledger-tail'), 1)
+        await resumed.aclose()
+        await stream.aclose()
+
+
+class LowStockAlertTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.backup = Warehouse.objects.create(name="Backup")
+        self.widget = Product.objects.create(name="Widget", sku="W-1", unit="pcs", low_stock_threshold=10)
+
+    def events(self):
+        return list(LowStockEvent.objects.order_by('id').values_list('warehouse_id', 'kind', 'quantity'))
+
+    def test_flags_and_outbox_follow_postings(self):
+        post_movements([
+            Movement(self.widget.pk, self.main.pk, 4, 'Receipt', 1),
+            Movement(self.widget.pk, self.backup.pk, 20, 'Receipt', 1),
+        ])
+        post_movements([Movement(self.widget.pk, self.main.pk, 6, 'Receipt', 2)])
+        post_movements([Movement(self.widget.pk, self.backup.pk, 1, 'Receipt', 3)])  # no crossing
+
+        self.assertEqual(self.events(), [
+            (self.main.pk, LowStockEvent.LOW, 4), (self.main.pk, LowStockEvent.RECOVERED, 10),
+        ])
+        self.assertFalse(Stock.objects.filter(is_low_stock=True).exists())
+
+        self.widget.low_stock_threshold = 25
+        self.widget.save()
+        low = self.client.get('/api/stock/low/').json()
+        self.assertEqual([(row['warehouse'], row['quantity']) for row in low], [(self.main.pk, 10), (self.backup.pk, 21)])
+        self.assertEqual(compute_kpis()['low_stock_items'], 2)
+        self.assertEqual(len(self.client.get(f'/api/stock/low/?warehouse={self.backup.pk}').json()), 1)
+
+    def test_pending_events_can_be_acknowledged(self):
+        post_movements([Movement(self.widget.pk, self.main.pk, 1, 'Receipt', 1)])
+        post_movements([Movement(self.widget.pk, self.backup.pk, 1, 'Receipt', 1)])
+        pending = self.client.get('/api/low-stock-events/?pending=true').json()['results']
+        self.assertEqual(len(pending), 2)
+
+        response = self.client.post(
+            '/api/low-stock-events/acknowledge/', {'up_to': pending[-1]['id']}, content_type='application/json'
+        )
+        self.assertEqual(response.json(), {'acknowledged': 1})
+        self.assertEqual(len(self.client.get('/api/low-stock-events/?pending=true').json()['results']), 1)
+
+
+class ReplenishmentTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.widget = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+        self.gadget = Product.objects.create(name="Gadget", sku="G-1", unit="pcs")
+        self.today = timezone.localdate()
+        post_movements([
+            Movement(self.widget.pk, self.main.pk, 1000, 'Receipt', 1),
+            Movement(self.gadget.pk, self.main.pk, 1000, 'Receipt', 1),
+        ])
+        # Widget: 10/day on days 1-2 ago; gadget: a single 30 on day 3 ago.
+        for days_ago, product, quantity in [(1, self.widget, 10), (2, self.widget, 10), (3, self.gadget, 30)]:
+            entry = post_movements([Movement(product.pk, self.main.pk, -quantity, 'Delivery', days_ago)])[0]
+            midday = timezone.make_aware(datetime.combine(self.today - timedelta(days=days_ago), time(12)))
+            StockLedger.objects.filter(pk=entry.pk).update(created_at=midday)
+        StockLedger.objects.update(created_at=models.F('created_at') - timedelta(minutes=5))
+
+    def test_suggestions_from_consumption(self):
+        self.assertEqual(refresh_suggestions(today=self.today, days=10, lead_time=4, review=10), 2)
+        widget = ReorderSuggestion.objects.get(product=self.widget)
+        gadget = ReorderSuggestion.objects.get(product=self.gadget)
+        self.assertEqual(widget.avg_daily_usage, Decimal('2'))
+        self.assertEqual(gadget.avg_daily_usage, Decimal('3'))
+        # Same mean of 20 over 10 days, but gadget's lumpier demand needs more safety stock.
+        self.assertGreater(gadget.usage_stddev, widget.usage_stddev)
+        self.assertGreater(gadget.reorder_point, widget.reorder_point)
+        self.assertEqual(widget.suggested_quantity, 0)  # 980 on hand
+
+    def test_incremental_refresh_only_touches_changed_pairs(self):
+        refresh_suggestions(today=self.today, days=10, lead_time=4, review=10)
+        self.assertEqual(refresh_suggestions(today=self.today, days=10, lead_time=4, review=10), 0)
+
+        entry = post_movements([Movement(self.widget.pk, self.main.pk, -975, 'Delivery', 9)])[0]
+        StockLedger.objects.filter(pk=entry.pk).update(created_at=models.F('created_at') - timedelta(minutes=5))
+        self.assertEqual(refresh_suggestions(today=self.today, days=10, lead_time=4, review=10), 1)
+
+        widget = ReorderSuggestion.objects.get(product=self.widget)
+        self.assertEqual(widget.on_hand, 5)
+        self.assertEqual(widget.suggested_quantity, widget.reorder_point + 20 - 5)
+        due = self.client.get('/api/reorder-suggestions/').json()
+        self.assertEqual([row['sku'] for row in due], ['W-1'])
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.product = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+        self.receipt = Receipt.objects.create(supplier="Acme", warehouse=self.main)
+        ReceiptItem.objects.create(receipt=self.receipt, product=self.product, quantity=5)
+
+    def test_async_validate_is_idempotent_and_runs_in_a_worker(self):
+        url = f'/api/receipts/{self.receipt.pk}/validate/?async=true'
+        first = self.client.post(url, headers={'Idempotency-Key': 'abc'})
+        again = self.client.post(url, headers={'Idempotency-Key': 'abc'})
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(again.json()['id'], first.json()['id'])
+        self.assertTrue(first['Location'].endswith(f"/api/jobs/{first.json()['id']}/"))
+        self.assertFalse(StockLedger.objects.exists())
+
+        other = self.client.post('/api/operations/validate/', {'receipts': [self.receipt.pk]},
+                                 content_type='application/json', headers={'Idempotency-Key': 'abc', 'Prefer': 'respond-async'})
+        self.assertEqual(other.status_code, 409)
+
+        listing = self.client.get('/api/jobs/')
+        jobs.enqueue('validate', {'receipts': []})
+        self.assertEqual(self.client.get('/api/jobs/', headers={'If-None-Match': listing['ETag']}).status_code, 200)
+        Job.objects.exclude(pk=first.json()['id']).delete()
+
+        self.assertEqual(jobs.run_pending(), 1)
+        job = self.client.get(first['Location']).json()
+        self.assertEqual(job['status'], Job.DONE)
+        self.assertEqual(job['result']['validated']['receipts'], [self.receipt.pk])
+        self.assertEqual(Stock.objects.get(product=self.product).quantity, 5)
+
+    def test_failures_retry_with_backoff(self):
+        calls = []
+
+        @jobs.handler('flaky')
+        def flaky(job):
+            calls.append(job.attempts)
+            raise RuntimeError("database went away")
+
+        try:
+            job = jobs.enqueue('flaky', {}, max_attempts=2)
+            with self.assertLogs('inventory.jobs', 'ERROR'):
+                jobs.run_pending()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+            self.assertGreater(job.run_after, timezone.now())
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            with self.assertLogs('inventory.jobs', 'ERROR'):
+                jobs.run_pending()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, calls), (Job.FAILED, 2, [1, 2]))
+            self.assertIsNotNone(job.finished_at)
+        finally:
+            del jobs.HANDLERS['flaky']
+
+    def test_business_errors_fail_without_retry(self):
+        delivery = DeliveryOrder.objects.create(customer="Bob", warehouse=self.main)
+        DeliveryItem.objects.create(delivery=delivery, product=self.product, quantity=50)
+        response = self.client.post(f'/api/deliveries/{delivery.pk}/validate/?async=true')
+        jobs.run_pending()
+        job = Job.objects.get(pk=response.json()['id'])
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 1))
+        self.assertIn('Insufficient', job.error)
+
+    def test_async_export_download(self):
+        self.receipt.validate_receipt()
+        with tempfile.TemporaryDirectory() as directory, override_settings(JOB_FILES_DIR=Path(directory)):
+            response = self.client.get('/api/stock/export/?file_format=ndjson&async=true')
+            self.assertEqual(response.status_code, 202)
+            location = response['Location']
+            self.assertEqual(self.client.get(location + 'download/').status_code, 404)
+
+            jobs.run_pending()
+            download = self.client.get(location + 'download/')
+            self.assertEqual(download.status_code, 200)
+            rows = [json.loads(line) for line in b''.join(download.streaming_content).decode().splitlines()]
+            self.assertEqual([(row['sku'], row['quantity']) for row in rows], [('W-1', 5)])
+
+            # Expired files are swept; the job then has nothing to download.
+            self.assertEqual(jobs.purge_files(), 0)
+            self.assertEqual(jobs.purge_files(max_age=timedelta(0)), 1)
+            self.assertEqual(self.client.get(location + 'download/').status_code, 404)
+
+    def test_idempotency_keys_are_scoped_per_user(self):
+        url = f'/api/receipts/{self.receipt.pk}/validate/?async=true'
+        alice = {'Authorization': f"Token {issue_token(User.objects.create_user('alice')).key}"}
+        bob = {'Authorization': f"Token {issue_token(User.objects.create_user('bob')).key}"}
+        first = self.client.post(url, headers={**alice, 'Idempotency-Key': 'abc'})
+        again = self.client.post(url, headers={**alice, 'Idempotency-Key': 'abc'})
+        other = self.client.post(url, headers={**bob, 'Idempotency-Key': 'abc'})
+        self.assertEqual(again.json()['id'], first.json()['id'])
+        self.assertEqual(other.status_code, 202)
+        self.assertNotEqual(other.json()['id'], first.json()['id'])
+        self.assertEqual(Job.objects.get(pk=other.json()['id']).created_by.username, 'bob')
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        main = Warehouse.objects.create(name="Main")
+        for n in range(3):
+            product = Product.objects.create(name=f"P{n}", sku=f"P-{n}", unit="pcs")
+            Stock.objects.create(product=product, warehouse=main, quantity=n)
+        staff = User.objects.create_user('ops', password='pw-123456', is_staff=True)
+        self.staff = {'Authorization': f'Token {issue_token(staff).key}'}
+
+    def test_server_timing_and_prometheus_counters(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/stock/')
+        count = len(queries)
+        timing = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        self.assertIn(f'desc="{count} queries"', timing['db'])
+        self.assertIn('serialize', timing)
+
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        body = self.client.get('/metrics', headers=self.staff).content.decode()
+        self.assertIn('inventory_http_requests_total{view="stock-list",method="GET",status="200"} 1', body)
+        self.assertIn(f'inventory_http_db_queries_total{{view="stock-list",method="GET",status="200"}} {count}', body)
+        self.assertIn(f'inventory_http_response_bytes_total{{view="stock-list",method="GET",status="200"}} {len(response.content)}', body)
+        self.assertIn('inventory_http_request_duration_seconds_count{view="stock-list",method="GET"} 1', body)
+
+    def test_slow_requests_keep_their_sql(self):
+        with override_settings(SLOW_REQUEST_MS=0):
+            self.client.get('/api/stock/?warehouse=1')
+        user = User.objects.create_user('ann', password='pw-123456')
+        self.assertEqual(self.client.get('/api/slow-requests/', headers={'Authorization': f'Token {issue_token(user).key}'}).status_code, 403)
+        slow = self.client.get('/api/slow-requests/', headers=self.staff).json()['requests']
+        self.assertEqual(slow[0]['path'], '/api/stock/?warehouse=1')
+        self.assertEqual(len(slow[0]['sql']), slow[0]['queries'])
+        self.assertTrue(any('inventory_stock' in query['sql'] for query in slow[0]['sql']))
+
+
+class BenchmarkTests(TestCase):
+    def test_small_run_stays_within_query_budgets(self):
+        data = benchmark.generate(warehouses=2, products=20, stock=30, ledger=60, documents=3, lines=4)
+        self.assertEqual(StockLedger.objects.count(), 60)
+        self.assertEqual(get_kpis(), compute_kpis())
+
+        results = benchmark.run_scenarios(data, repeat=3)
+        self.assertEqual(set(results), set(benchmark.SCENARIOS))
+        for name, result in results.items():
+            with self.subTest(scenario=name):
+                self.assertEqual(result['errors'], [])
+                self.assertEqual(result['calls'], 3)
+                self.assertTrue(result['within_budget'], result)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.client.post('/api/auth/signup/', {'username': 'ann', 'password': 'pw-123456'}, content_type='application/json')
+        login = self.client.post('/api/auth/login/', {'username': 'ann', 'password': 'pw-123456'}, content_type='application/json')
+        self.key = login.json()['token']
+
+    def get(self, key=None):
+        return self.client.get('/api/cache-stats/', headers={'Authorization': f'Token {key or self.key}'})
+
+    def test_cached_token_costs_no_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(self.get('not-a-token').status_code, 401)
+
+    def test_logout_and_password_change_revoke(self):
+        response = self.client.post('/api/auth/logout/', headers={'Authorization': f'Token {self.key}'})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get().status_code, 401)
+
+        key = self.client.post('/api/auth/login/', {'username': 'ann', 'password': 'pw-123456'}, content_type='application/json').json()['token']
+        self.assertEqual(self.get(key).status_code, 200)
+        user = User.objects.get(username='ann')
+        user.set_password('another-pw-1')
+        user.save()
+        self.assertEqual(self.get(key).status_code, 401)
+
+    def test_expired_tokens_are_refused_and_replaced(self):
+        Token.objects.filter(key=self.key).update(created=timezone.now() - timedelta(days=2))
+        token_cache.clear()
+        with override_settings(AUTH_TOKEN_EXPIRY=timedelta(days=1)):
+            self.assertEqual(self.get().status_code, 401)
+            key = self.client.post('/api/auth/login/', {'username': 'ann', 'password': 'pw-123456'}, content_type='application/json').json()['token']
+            self.assertNotEqual(key, self.key)
+            self.assertEqual(self.get(key).status_code, 200)
+
+
+class LedgerPartitionTests(TestCase):
+    def setUp(self):
+        main = Warehouse.objects.create(name="Main")
+        product = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+        self.entry = post_movements([Movement(product.pk, main.pk, 5, 'Receipt', 1)])[0]
+
+    def partition_of(self, entry):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM inventory_stockledger WHERE id = %s', [entry.pk])
+            return cursor.fetchone()[0]
+
+    def move_to(self, moment):
+        StockLedger.objects.filter(pk=self.entry.pk).update(created_at=moment)
+
+    def test_new_partitions_take_over_rows_from_the_default_partition(self):
+        this_month = timezone.now().date().replace(day=1)
+        self.assertEqual(self.partition_of(self.entry), partitions.partition_name(this_month))
+
+        self.move_to(timezone.make_aware(datetime(2099, 1, 15)))
+        self.assertEqual(self.partition_of(self.entry), partitions.DEFAULT_PARTITION)
+        self.assertEqual(partitions.ensure_partitions(months_ahead=1, today=date(2099, 1, 3)),
+                         ['inventory_stockledger_p2099_01', 'inventory_stockledger_p2099_02'])
+        self.assertEqual(self.partition_of(self.entry), 'inventory_stockledger_p2099_01')
+        self.assertEqual(partitions.ensure_partitions(months_ahead=1, today=date(2099, 1, 3)), [])
+
+    def test_archiving_detaches_old_months_to_files(self):
+        self.move_to(timezone.make_aware(datetime(2001, 5, 2)))
+        partitions.create_partition(date(2001, 5, 1))
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(partitions.archive_partitions(date(2001, 5, 1), directory), [])
+            # Not rolled up into DailyMovement yet.
+            with self.assertLogs('inventory.partitions', 'WARNING'):
+                self.assertEqual(partitions.archive_partitions(date(2001, 6, 1), directory), [])
+            rollups.roll_up()
+            [(name, rows, path)] = partitions.archive_partitions(date(2001, 6, 1), directory)
+            self.assertEqual((name, rows), ('inventory_stockledger_p2001_05', 1))
+            with gzip.open(path, 'rt') as archive:
+                lines = archive.read().splitlines()
+        self.assertEqual(lines[1].split(',')[0], str(self.entry.pk))
+        self.assertFalse(StockLedger.objects.exists())
+        self.assertNotIn(date(2001, 5, 1), partitions.monthly_partitions())
+        self.assertEqual(partitions.archived_before(), datetime(2001, 6, 1, tzinfo=dt_timezone.utc))
+
+
+class MovementRollupTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.widget = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+        self.today = timezone.localdate()
+
+    def post(self, change, source_type, days_ago):
+        entry = post_movements([Movement(self.widget.pk, self.main.pk, change, source_type, 1)])[0]
+        moment = timezone.make_aware(datetime.combine(self.today - timedelta(days=days_ago), time(12)))
+        StockLedger.objects.filter(pk=entry.pk).update(created_at=moment)
+
+    def test_incremental_rollup_in_chunks(self):
+        self.post(10, 'Receipt', 2)
+        self.post(5, 'Receipt', 2)
+        self.post(-3, 'Delivery', 2)
+        self.post(-4, 'Delivery', 1)
+        self.post(6, 'Receipt', 0)
+        self.assertEqual(rollups.roll_up(chunk_size=2), 3)
+        self.assertEqual(rollups.roll_up(), 0)
+
+        receipts = DailyMovement.objects.get(source_type='Receipt', day=self.today - timedelta(days=2))
+        self.assertEqual((receipts.quantity_in, receipts.quantity_out, receipts.entries), (15, 0, 2))
+
+        self.post(-1, 'Delivery', 1)
+        self.assertEqual(rollups.roll_up(), 1)
+        deliveries = DailyMovement.objects.get(source_type='Delivery', day=self.today - timedelta(days=1))
+        self.assertEqual((deliveries.quantity_out, deliveries.entries), (5, 2))
+        # Ledger rows within SAFETY_LAG wait for the next run.
+        post_movements([Movement(self.widget.pk, self.main.pk, 1, 'Receipt', 2)])
+        self.assertEqual(rollups.roll_up(), 0)
+
+    def test_late_commits_are_picked_up(self):
+        first = post_movements([Movement(self.widget.pk, self.main.pk, 4, 'Receipt', 1)])[0]
+        second = post_movements([Movement(self.widget.pk, self.main.pk, 6, 'Receipt', 2)])[0]
+        StockLedger.objects.update(created_at=timezone.now() - rollups.RESCAN_WINDOW / 2)
+        # `first` is still uncommitted when the rollup passes its id ...
+        late = StockLedger.objects.get(pk=first.pk)
+        StockLedger.objects.filter(pk=first.pk).delete()
+        rollups.roll_up()
+        self.assertEqual(DailyMovement.objects.get().quantity_in, 6)
+
+        # ... and commits afterwards.
+        late.save(force_insert=True)
+        rollups.roll_up()
+        self.assertEqual(DailyMovement.objects.get().quantity_in, 10)
+        state = MovementRollupState.objects.get()
+        self.assertEqual(state.last_ledger_id, second.pk)
+        self.assertNotIn(first.pk, [i for lo, hi, _ in state.gaps for i in range(lo, hi + 1)])
+        rollups.roll_up()
+        self.assertEqual(DailyMovement.objects.get().quantity_in, 10)
+
+    def test_rolled_back_ids_are_forgotten(self):
+        post_movements([Movement(self.widget.pk, self.main.pk, 4, 'Receipt', 1)])
+        rolled_back = post_movements([Movement(self.widget.pk, self.main.pk, 5, 'Receipt', 1)])[0]
+        post_movements([Movement(self.widget.pk, self.main.pk, 6, 'Receipt', 1)])
+        StockLedger.objects.update(created_at=timezone.now() - rollups.RESCAN_WINDOW / 2)
+        StockLedger.objects.filter(pk=rolled_back.pk).delete()
+        rollups.roll_up()
+        self.assertIn([rolled_back.pk, rolled_back.pk], [gap[:2] for gap in MovementRollupState.objects.get().gaps])
+
+        noticed = (timezone.now() - rollups.RESCAN_WINDOW).isoformat()
+        MovementRollupState.objects.update(gaps=[[rolled_back.pk, rolled_back.pk, noticed]])
+        rollups.roll_up()
+        self.assertEqual(MovementRollupState.objects.get().gaps, [])
+        self.assertEqual(DailyMovement.objects.get().quantity_in, 10)
+
+    def test_summary_endpoints(self):
+        self.post(10, 'Receipt', 2)
+        self.post(-3, 'Delivery', 2)
+        self.post(-4, 'Delivery', 1)
+        rollups.roll_up()
+
+        start = (self.today - timedelta(days=7)).isoformat()
+        rows = self.client.get(f'/api/movement-summary/?granularity=day&group_by=source_type&start={start}').json()
+        self.assertEqual(
+            [(row['period'], row['source_type'], row['net']) for row in rows],
+            [
+                ((self.today - timedelta(days=2)).isoformat(), 'Delivery', -3),
+                ((self.today - timedelta(days=2)).isoformat(), 'Receipt', 10),
+                ((self.today - timedelta(days=1)).isoformat(), 'Delivery', -4),
+            ],
+        )
+        [top] = self.client.get(f'/api/movement-summary/top/?start={start}').json()
+        self.assertEqual((top['product__sku'], top['quantity_in'], top['quantity_out'], top['entries']), ('W-1', 10, 7, 3))
+        self.assertEqual(self.client.get('/api/movement-summary/?granularity=hour').status_code, 400)
+
+    def test_refresh_endpoint(self):
+        self.post(10, 'Receipt', 2)
+        response = self.client.post('/api/movement-summary/refresh/?async=true')
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(DailyMovement.objects.exists())
+        jobs.run_pending()
+        self.assertEqual(Job.objects.get(pk=response.json()['id']).result, {'chunks': 1})
+        self.assertEqual(DailyMovement.objects.get().quantity_in, 10)
+
+        self.post(-3, 'Delivery', 1)
+        self.assertEqual(self.client.post('/api/movement-summary/refresh/').json(), {'chunks': 1})
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.backup = Warehouse.objects.create(name="Backup")
+        self.widget = Product.objects.create(name="Widget", sku="W-1", unit="pcs")
+        self.gadget = Product.objects.create(name="Gadget", sku="G-1", unit="pcs")
+        post_movements([Movement(self.widget.pk, self.main.pk, 10, 'Receipt', 1)])
+
+    def delivery(self, quantity):
+        delivery = DeliveryOrder.objects.create(customer="Bob", warehouse=self.main)
+        DeliveryItem.objects.create(delivery=delivery, product=self.widget, quantity=quantity)
+        return delivery
+
+    def stock(self):
+        return Stock.objects.get(product=self.widget, warehouse=self.main)
+
+    def test_ready_deliveries_hold_stock_until_validated(self):
+        first = self.delivery(6)
+        response = self.client.post(f'/api/deliveries/{first.id}/reserve/')
+        self.assertEqual((response.status_code, response.json()['status']), (200, DeliveryOrder.READY))
+        self.assertEqual((self.stock().reserved_quantity, self.stock().available), (6, 4))
+
+        # Neither a second reservation nor a draft posting can take the held stock.
+        second = self.delivery(5)
+        self.assertEqual(self.client.post(f'/api/deliveries/{second.id}/reserve/').status_code, 400)
+        with self.assertRaises(ValidationError):
+            second.validate_delivery()
+        self.assertEqual(self.stock().quantity, 10)
+
+        # Lines edited after reserving don't change what gets released.
+        first.items.update(quantity=2)
+        first.validate_delivery()
+        self.assertEqual((self.stock().quantity, self.stock().reserved_quantity), (8, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_release_cancel_and_delete_give_stock_back(self):
+        delivery = self.delivery(4)
+        delivery.reserve()
+        delivery.unreserve()
+        self.assertEqual((delivery.status, self.stock().reserved_quantity), (DeliveryOrder.DRAFT, 0))
+        delivery.reserve()
+        delivery.cancel()
+        self.assertEqual((delivery.status, self.stock().reserved_quantity), (DeliveryOrder.CANCELLED, 0))
+
+        transfer = InternalTransfer.objects.create(from_warehouse=self.main, to_warehouse=self.backup)
+        TransferItem.objects.create(transfer=transfer, product=self.widget, quantity=3)
+        transfer.reserve()
+        self.assertEqual(self.stock().reserved_quantity, 3)
+        self.assertFalse(Stock.objects.filter(warehouse=self.backup).exists())
+        transfer.delete()
+        self.assertEqual(self.stock().reserved_quantity, 0)
+
+    def test_batch_validates_reserved_documents(self):
+        reserved, draft = self.delivery(7), self.delivery(3)
+        reserved.reserve()
+        self.client.get('/api/dashboard/')
+        response = self.client.post(
+            '/api/operations/validate/', {'deliveries': [reserved.id, draft.id]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((self.stock().quantity, self.stock().reserved_quantity), (0, 0))
+        self.assertEqual(get_kpis(), compute_kpis())
+
+    def test_counts_may_undercut_reservations(self):
+        self.delivery(8).reserve()
+        self.client.post('/api/adjustments/', {
+            'warehouse': self.main.id, 'product': self.widget.id, 'counted_quantity': 5,
+        })
+        self.assertEqual((self.stock().quantity, self.stock().available), (5, -3))
+
+    def test_bulk_atp_in_one_query(self):
+        self.delivery(4).reserve()
+        post_movements([Movement(self.widget.pk, self.backup.pk, 2, 'Receipt', 2)])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/stock/atp/', {'skus': ['W-1', 'G-1', 'NOPE']}, content_type='application/json'
+            )
+        self.assertEqual(len([q for q in queries if 'inventory_product' in q['sql']]), 1)
+        data = response.json()
+        widget, gadget = data['results']
+        self.assertEqual((widget['on_hand'], widget['reserved'], widget['available']), (12, 4, 8))
+        self.assertEqual([row['available'] for row in widget['warehouses']], [6, 2])
+        self.assertEqual((gadget['sku'], gadget['warehouses']), ('G-1', []))
+        self.assertEqual(data['unknown_skus'], ['NOPE'])
+
+        response = self.client.get(f'/api/stock/atp/?products={self.widget.id}&warehouse={self.backup.id}')
+        [widget] = response.json()['results']
+        self.assertEqual([(row['warehouse'], row['available']) for row in widget['warehouses']], [(self.backup.id, 2)])
+        self.assertEqual(self.client.get('/api/stock/atp/').status_code, 400)
+
+
+class NestedDocumentTests(TestCase):
+    def setUp(self):
+        self.main = Warehouse.objects.create(name="Main")
+        self.backup = Warehouse.objects.create(name="Backup")
+        self.products = [Product.objects.create(name=f"Product {i}", sku=f"SKU-{i}", unit="pcs") for i in range(30)]
+
+    def create(self, resource, body, query=''):
+        return self.client.post(f'/api/{resource}/{query}', body, content_type='application/json')
+
+    def test_header_and_lines_in_one_request(self):
+        lines = [{'product': product.id, 'quantity': '2.5'} for product in self.products] * 10
+        with CaptureQueriesContext(connection) as queries:
+            response = self.create('receipts', {'supplier': "Acme", 'warehouse': self.main.id, 'items': lines})
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(queries), 15)
+        data = response.json()
+        self.assertEqual(len(data['items']), 300)
+        self.assertEqual((data['items'][0]['product_name'], data['status']), ("Product 0", Receipt.DRAFT))
+        self.assertEqual(ReceiptItem.objects.filter(receipt_id=data['id']).count(), 300)
+
+    def test_bad_lines_create_nothing(self):
+        response = self.create('deliveries', {
+            'customer': "Bob", 'warehouse': self.main.id,
+            'items': [{'product': self.products[0].id, 'quantity': 1}, {'product': 999999, 'quantity': 1}],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("999999", str(response.json()['items']))
+        self.assertFalse(DeliveryOrder.objects.exists())
+
+    def test_validate_on_create_in_the_same_transaction(self):
+        response = self.create('receipts', {
+            'supplier': "Acme", 'warehouse': self.main.id, 'items': [{'product': self.products[0].id, 'quantity': 5}],
+        }, '?validate=true')
+        self.assertEqual((response.status_code, response.json()['status']), (201, Receipt.DONE))
+
+        transfer = {
+            'from_warehouse': self.main.id, 'to_warehouse': self.backup.id,
+            'items': [{'product': self.products[0].id, 'quantity': 8}],
+        }
+        response = self.create('transfers', transfer, '?validate=true')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(InternalTransfer.objects.exists())
+        self.assertFalse(TransferItem.objects.exists())
+
+        transfer['items'][0]['quantity'] = 3
+        self.assertEqual(self.create('transfers', transfer, '?validate=true').status_code, 201)
+        self.assertEqual(Stock.objects.get(product=self.products[0], warehouse=self.backup).quantity, 3)
+        self.assertEqual(get_kpis(), compute_kpis())
+
+    def test_lines_of_drafts_can_be_replaced(self):
+        receipt = self.create('receipts', {
+            'supplier': "Acme", 'warehouse': self.main.id, 'items': [{'product': self.products[0].id, 'quantity': 1}],
+        }).json()
+        response = self.client.patch(
+            f"/api/receipts/{receipt['id']}/", {'items': [{'product': self.products[1].id, 'quantity': 4}]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['product'] for item in response.json()['items']], [self.products[1].id])
+
+        self.client.post(f"/api/receipts/{receipt['id']}/validate/")
+        response = self.client.patch(
+            f"/api/receipts/{receipt['id']}/", {'items': []}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ReceiptItem.objects.filter(receipt_id=receipt['id']).count(), 1)
+
+    def test_receipt_status_only_changes_through_actions(self):
+        receipt = self.create('receipts', {
+            'supplier': "Acme", 'warehouse': self.main.id, 'items': [{'product': self.products[0].id, 'quantity': 5}],
+        }).json()
+        url = f"/api/receipts/{receipt['id']}/"
+        response = self.client.patch(url, {'status': Receipt.DONE}, content_type='application/json')
+        self.assertEqual((response.status_code, response.json()['status']), (200, Receipt.DRAFT))
+        self.assertFalse(Stock.objects.exists())
+
+        self.assertEqual(self.client.post(f'{url}cancel/').json()['status'], Receipt.CANCELLED)
+        self.assertEqual(self.client.post(f'{url}validate/').status_code, 400)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        tools = ProductCategory.objects.create(name="Power Tools")
+        Product.objects.create(name="Blue Widget", sku="WID-100", unit="pcs")
+        Product.objects.create(name="Widget Stand", sku="STD-1", unit="pcs")
+        Product.objects.create(name="Cordless Drill", sku="DRL-7", unit="pcs", category=tools)
+        Product.objects.create(name="Hammer", sku="WID-1", unit="pcs")
+        for i in range(30):
+            Product.objects.create(name=f"Bolt {i}", sku=f"BLT-{i:03}", unit="pcs")
+
+    def search(self, query):
+        return self.client.get(f'/api/products/search/?{query}').json()
+
+    def skus(self, query):
+        return [row['sku'] for row in self.search(query)['results']]
+
+    def test_ranks_exact_sku_then_prefix_then_text(self):
+        self.assertEqual(self.skus('q=wid-1'), ['WID-1', 'WID-100'])
+        # Both SKU prefixes outrank a name-only match.
+        self.assertEqual(self.skus('q=WID')[2:], ['STD-1'])
+        self.assertEqual(self.skus('q=widget blu'), ['WID-100'])
+        self.assertEqual(self.skus('q=power'), ['DRL-7'])
+        # Short terms are SKU prefixes only.
+        self.assertEqual(self.skus('q=dr'), ['DRL-7'])
+
+    def test_pages_without_counting(self):
+        first = self.search('q=blt&limit=20')
+        self.assertEqual(len(first['results']), 20)
+        second = self.client.get(first['next']).json()
+        self.assertEqual((len(second['results']), second['next']), (10, None))
+        self.assertEqual(self.client.get('/api/products/search/').status_code, 400)
+
+    def test_uses_the_search_indexes(self):
+        with connection.cursor() as cursor:
+            # The test catalog is tiny; make the planner show which indexes it can use.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = search_products('blue widget').explain()
+        self.assertIn('product_search_idx', plan)
+        self.assertIn('product_sku_prefix_idx', plan)
+        self.assertIn('product_sku_prefix_idx', search_products('WI').explain())
@@ -5,9 +5,12 @@ from .views import (
     ReceiptViewSet, ReceiptItemViewSet,
     DeliveryOrderViewSet, DeliveryItemViewSet,
     InternalTransferViewSet, TransferItemViewSet,
-    StockAdjustmentViewSet, StockLedgerViewSet, DashboardStatsViewSet
+    StockAdjustmentViewSet, StockLedgerViewSet, DashboardStatsViewSet,
+    OperationBatchViewSet, LowStockEventViewSet, ReorderSuggestionViewSet, JobViewSet, MovementSummaryViewSet, cache_stats,
+    slow_requests
 )
-from .auth_views import signup, login
+from .auth_views import signup, login, logout
+from .event_views import stock_events
 
 router = DefaultRouter()
 router.register(r'warehouses', WarehouseViewSet)
@@ -24,11 +27,21 @@ router.register(r'transfers', InternalTransferViewSet)
 router.register(r'transfer-items', TransferItemViewSet)
 router.register(r'adjustments', StockAdjustmentViewSet)
 router.register(r'ledger', StockLedgerViewSet)
+router.register(r'low-stock-events', LowStockEventViewSet)
+router.register(r'reorder-suggestions', ReorderSuggestionViewSet)
+router.register(r'jobs', JobViewSet)
+router.register(r'operations', OperationBatchViewSet, basename='operations')
 router.register(r'dashboard', DashboardStatsViewSet, basename='dashboard')
+router.register(r'movement-summary', MovementSummaryViewSet, basename='movement-summary')
 
 
 urlpatterns = [
+    # Listed ahead of the router so 'events' isn't taken for a stock id.
+    path('stock/events/', stock_events),
     path('', include(router.urls)),
     path('auth/signup/', signup),
     path('auth/login/', login),
+    path('auth/logout/', logout),
+    path('cache-stats/', cache_stats),
+    path('slow-requests/', slow_requests),
 ]
\ No newline at end of file
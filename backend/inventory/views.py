@@ -1,259 +1,791 @@
-from rest_framework import viewsets, status
-from rest_framework.decorators import action
+import hashlib
+import os
+from django.conf import settings
+from rest_framework import viewsets, status, serializers
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
 from django.db import transaction, models  # <--- Added 'models' here
-from django.db.models import Sum
-from datetime import timedelta
+from django.http import FileResponse, Http404
+from django.db.models import Count, Sum, Prefetch
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek, TruncYear
+from django.core.exceptions import ValidationError
+from datetime import datetime, time, timedelta
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags, quote_etag
 from .models import (
     Warehouse, ProductCategory, Product, Stock,
     Receipt, ReceiptItem, DeliveryOrder, DeliveryItem,
-    InternalTransfer, TransferItem, StockAdjustment, StockLedger
+    InternalTransfer, TransferItem, StockAdjustment, StockLedger, LowStockEvent,
+    ReorderSuggestion, Job, DailyMovement
 )
 from .serializers import (
     WarehouseSerializer, ProductCategorySerializer, ProductSerializer, StockSerializer,
     ReceiptSerializer, ReceiptItemSerializer, DeliveryOrderSerializer, DeliveryItemSerializer,
-    InternalTransferSerializer, TransferItemSerializer, StockAdjustmentSerializer, StockLedgerSerializer
+    InternalTransferSerializer, TransferItemSerializer, StockAdjustmentSerializer, StockLedgerSerializer,
+    BatchValidationSerializer, LowStockEventSerializer, ReorderSuggestionSerializer, JobSerializer,
+    AvailabilityQuerySerializer
 )
+from .posting import post_adjustment, validate_batch
+from .pagination import KeysetPagination
+from .kpis import get_kpis
+from .snapshots import stock_as_of
+from .replenishment import refresh_suggestions
+from .rollups import roll_up
+from .reservations import available_to_promise
+from .search import search_products
+from .jobs import JobConflict, enqueue
+from .metrics import TimedSerializerMixin, registry as metrics_registry
+from .bulk import detect_format, import_products, import_stock, read_rows
+from .exports import EXPORT_FORMATS, export_response
+from .cache import bump_tables, cache_stats as get_cache_stats, get_or_compute, get_versions, table_namespace
+
+
+def parse_date_param(params, name, end_of_day=False):
+    """
+    Reads an ISO date or datetime query parameter as an aware datetime. A plain
+    date used as an exclusive upper bound covers the whole day.
+    """
+    value = params[name]
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value) if value else None
+        if day is None:
+            raise serializers.ValidationError({name: "Enter a valid ISO date or datetime."})
+        if end_of_day:
+            day += timedelta(days=1)
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+def wants_async(request):
+    """?async=true or a `Prefer: respond-async` header asks for a background job."""
+    return (
+        request.query_params.get('async') in ('1', 'true')
+        or 'respond-async' in request.headers.get('Prefer', '')
+    )
+
+
+def accepted(request, kind, payload):
+    """Queues a job (honouring an Idempotency-Key header) and answers 202 pointing at it."""
+    try:
+        job = enqueue(
+            kind, payload, idempotency_key=request.headers.get('Idempotency-Key'),
+            user=request.user if request.user.is_authenticated else None,
+        )
+    except JobConflict as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+    location = reverse('job-detail', args=[job.pk], request=request)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+class ConditionalGetMixin:
+    """
+    ETags for list and detail responses. The tag is derived from the version
+    stamps of the tables in `depends_on` (see inventory/cache.py) rather than
+    from the data, so a request whose If-None-Match still matches gets a 304
+    without touching the database or running a serializer.
+    """
+    depends_on = ()
+
+    def get_etag(self, request):
+        versions = get_versions(table_namespace(model) for model in self.depends_on)
+        params = sorted(request.query_params.lists())
+        key = f"{request.path}|{params}|{request.accepted_renderer.format}|{sorted(versions.items())}"
+        return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    def conditional(self, request, render):
+        etag = self.get_etag(request)
+        sent = {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}
+        if etag in sent or '*' in sent:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = render()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
+
+class CachedCatalogMixin:
+    """
+    Serves list/retrieve from the two-tier catalog cache (inventory/cache.py),
+    keyed by the versions of the tables in `depends_on`.
+    """
+    def cached(self, request, render):
+        params = sorted(request.query_params.lists())
+        key = f"{self.basename}:{self.action}:{self.kwargs.get(self.lookup_field, '')}:{params}"
+        namespaces = [table_namespace(model) for model in self.depends_on]
+        return Response(get_or_compute(namespaces, key, lambda: render().data))
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(request, lambda: super(CachedCatalogMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(request, lambda: super(CachedCatalogMixin, self).retrieve(request, *args, **kwargs))
+
+@api_view(['GET'])
+def cache_stats(request):
+    """Catalog cache hit/miss counters for this worker process."""
+    return Response({"pid": os.getpid(), "namespaces": get_cache_stats()})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def slow_requests(request):
+    """The slowest recent requests of this worker process, with their SQL."""
+    return Response({"pid": os.getpid(), "threshold_ms": settings.SLOW_REQUEST_MS, "requests": list(metrics_registry.slow)})
 
 # Standard CRUD Views
-class WarehouseViewSet(viewsets.ModelViewSet):
+# Each viewset's queryset is its query plan: it pulls in every relation its
+# serializer follows, so list endpoints run a fixed number of queries.
+class WarehouseViewSet(TimedSerializerMixin, ConditionalGetMixin, CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = Warehouse.objects.all()
     serializer_class = WarehouseSerializer
+    depends_on = (Warehouse,)
 
-class ProductCategoryViewSet(viewsets.ModelViewSet):
+class ProductCategoryViewSet(TimedSerializerMixin, ConditionalGetMixin, CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = ProductCategory.objects.all()
     serializer_class = ProductCategorySerializer
+    depends_on = (ProductCategory,)
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class BulkImportMixin:
+    """
+    Adds POST <resource>/bulk-import/ taking a multipart `file` in CSV or JSONL
+    (by extension, or an explicit `file_format` field). The file is streamed in
+    chunks; the response has the counts and the first rejected rows.
+    """
+    import_function = None
+    max_reported_errors = 1000
+
+    @action(detail=False, methods=['post'], url_path='bulk-import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise serializers.ValidationError({"file": "Upload a CSV or JSONL file."})
+        file_format = request.data.get('file_format') or detect_format(upload.name)
+        if file_format not in ('csv', 'jsonl'):
+            raise serializers.ValidationError({"file_format": "Use csv or jsonl."})
+
+        errors = []
+        def collect(error):
+            if len(errors) < self.max_reported_errors:
+                errors.append(error)
+
+        report = self.import_function(read_rows(upload, file_format), on_error=collect)
+        return Response({**report.as_dict(), "error_rows": errors}, status=status.HTTP_200_OK)
+
+class ExportMixin:
+    """
+    Adds GET <resource>/export/?file_format=csv|ndjson, streamed straight from
+    a server-side cursor. `export_columns` lists (output_name, orm_lookup)
+    pairs; `export_filters` are query params passed through as filters.
+    """
+    export_columns = ()
+    export_filters = ()
+
+    def get_export_queryset(self):
+        queryset = self.get_queryset().prefetch_related(None)
+        for field in self.export_filters:
+            if self.request.query_params.get(field):
+                queryset = queryset.filter(**{field: self.request.query_params[field]})
+        return queryset.order_by('pk')
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            raise serializers.ValidationError({"file_format": "Use csv or ndjson."})
+        if wants_async(request):
+            params = {key: value for key, value in request.query_params.items() if key != 'async'}
+            return accepted(request, 'export', {'resource': self.basename, 'file_format': file_format, 'params': params})
+        return export_response(self.get_export_queryset(), self.export_columns, file_format, self.basename)
+
+class DocumentCreateMixin:
+    """
+    Documents are created with their lines in one request (see
+    DocumentLinesMixin). With ?validate=true the new document is also posted,
+    in the same transaction, so a failed posting leaves nothing behind.
+    """
+    validate_document = None
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic():
+                document = serializer.save()
+                if request.query_params.get('validate') in ('1', 'true'):
+                    self.validate_document(document)
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        # Re-read through the viewset queryset so the lines come prefetched.
+        document = self.get_queryset().get(pk=document.pk)
+        data = self.get_serializer(document).data
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+class TransitionMixin:
+    """Document status actions that go through a model method (reserve, release, cancel)."""
+
+    def transition(self, request, change):
+        document = self.get_object()
+        try:
+            change(document)
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=400)
+        return Response(self.get_serializer(document).data)
+
+class ProductViewSet(TimedSerializerMixin, ConditionalGetMixin, CachedCatalogMixin, BulkImportMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.select_related('category')
     serializer_class = ProductSerializer
-
-class StockViewSet(viewsets.ModelViewSet):
-    queryset = Stock.objects.all()
+    depends_on = (Product, ProductCategory)
+    import_function = staticmethod(import_products)
+    search_page_size = 20
+    search_max_page_size = 100
+    search_max_offset = 1000
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked product search over SKU, name and category (inventory/search.py).
+        ?q= is required; ?limit= (max 100) and ?offset= page through the
+        results without counting them, `next` is null on the last page.
+        """
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            raise serializers.ValidationError({"q": "This parameter is required."})
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', self.search_page_size)), self.search_max_page_size))
+            offset = max(0, min(int(request.query_params.get('offset', 0)), self.search_max_offset))
+        except ValueError:
+            raise serializers.ValidationError({"limit": "limit and offset must be integers."})
+
+        def render():
+            # One row past the page tells whether there is a next one.
+            rows = list(search_products(term, self.get_queryset())[offset:offset + limit + 1])
+            next_url = None
+            if len(rows) > limit:
+                next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + limit)
+            return Response({"next": next_url, "results": self.get_serializer(rows[:limit], many=True).data})
+        return self.cached(request, render)
+
+class StockViewSet(TimedSerializerMixin, ConditionalGetMixin, BulkImportMixin, ExportMixin, viewsets.ModelViewSet):
+    queryset = Stock.objects.select_related('product', 'warehouse')
     serializer_class = StockSerializer
+    depends_on = (Stock, Product, Warehouse)
+    import_function = staticmethod(import_stock)
+    export_filters = ('warehouse', 'product')
+    export_columns = (
+        ('id', 'id'), ('product', 'product_id'), ('sku', 'product__sku'), ('product_name', 'product__name'),
+        ('warehouse', 'warehouse_id'), ('warehouse_name', 'warehouse__name'),
+        ('quantity', 'quantity'), ('reserved_quantity', 'reserved_quantity'), ('updated_at', 'updated_at'),
+    )
     filterset_fields = ['warehouse', 'product']
 
+    @action(detail=False, methods=['get', 'post'])
+    def atp(self, request):
+        """
+        Available to promise (on hand minus reserved) for up to 1000 products,
+        per warehouse and in total, from one query. GET takes comma separated
+        ?skus= / ?products= (and ?warehouse=); POST takes the same as a JSON
+        body for long lists.
+        """
+        if request.method == 'GET':
+            params = request.query_params
+            data = {
+                key: [value for value in params[key].split(',') if value]
+                for key in ('skus', 'products') if params.get(key)
+            }
+            if params.get('warehouse'):
+                data['warehouse'] = params['warehouse']
+        else:
+            data = request.data
+        serializer = AvailabilityQuerySerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data
+
+        def render():
+            found = available_to_promise(query['skus'], query['products'], query.get('warehouse'))
+            results = []
+            for product_id, (sku, name, pairs) in found.items():
+                warehouses = [
+                    {"warehouse": warehouse_id, "on_hand": quantity, "reserved": reserved, "available": quantity - reserved}
+                    for warehouse_id, quantity, reserved in pairs
+                ]
+                results.append({
+                    "product": product_id,
+                    "sku": sku,
+                    "product_name": name,
+                    "on_hand": sum(row["on_hand"] for row in warehouses),
+                    "reserved": sum(row["reserved"] for row in warehouses),
+                    "available": sum(row["available"] for row in warehouses),
+                    "warehouses": warehouses,
+                })
+            skus = {sku for sku, _, _ in found.values()}
+            return Response({
+                "results": results,
+                "unknown_skus": [sku for sku in dict.fromkeys(query['skus']) if sku not in skus],
+                "unknown_products": [pk for pk in dict.fromkeys(query['products']) if pk not in found],
+            })
+        if request.method == 'GET':
+            return self.conditional(request, render)
+        return render()
+
+    @action(detail=False, methods=['get'])
+    def low(self, request):
+        """Stock rows below their product's threshold (?warehouse= to narrow), from the partial index."""
+        def render():
+            queryset = self.get_queryset().filter(is_low_stock=True).order_by('warehouse_id', 'product_id')
+            if request.query_params.get('warehouse'):
+                queryset = queryset.filter(warehouse=request.query_params['warehouse'])
+            return Response(self.get_serializer(queryset, many=True).data)
+        return self.conditional(request, render)
+
+    @action(detail=False, methods=['get'], url_path='as-of')
+    def as_of(self, request):
+        """
+        Stock per product and warehouse at a past date (?date=, plus optional
+        product/warehouse), answered from the nearest snapshot plus the ledger
+        movements in between. A plain date means the end of that day.
+        """
+        if not request.query_params.get('date'):
+            raise serializers.ValidationError({"date": "This parameter is required."})
+        moment = parse_date_param(request.query_params, 'date', end_of_day=True)
+        try:
+            quantities, snapshot = stock_as_of(
+                moment,
+                product=request.query_params.get('product'),
+                warehouse=request.query_params.get('warehouse'),
+            )
+        except ValidationError as e:
+            raise serializers.ValidationError({"date": e.messages[0]})
+
+        products = {
+            pk: (name, sku) for pk, name, sku in
+            Product.objects.filter(pk__in={key[0] for key in quantities}).values_list('id', 'name', 'sku')
+        }
+        warehouses = dict(
+            Warehouse.objects.filter(pk__in={key[1] for key in quantities}).values_list('id', 'name')
+        )
+        results = [
+            {
+                "product": product_id,
+                "product_name": products[product_id][0],
+                "sku": products[product_id][1],
+                "warehouse": warehouse_id,
+                "warehouse_name": warehouses[warehouse_id],
+                "quantity": quantity,
+            }
+            for (product_id, warehouse_id), quantity in sorted(quantities.items())
+            if product_id in products and warehouse_id in warehouses
+        ]
+        return Response({
+            "as_of": moment,
+            "snapshot": snapshot.id if snapshot else None,
+            "snapshot_taken_at": snapshot.taken_at if snapshot else None,
+            "results": results,
+        })
+
 # --- OPERATIONS WITH BUSINESS LOGIC ---
 
-class ReceiptViewSet(viewsets.ModelViewSet):
-    queryset = Receipt.objects.all()
+class ReceiptViewSet(TimedSerializerMixin, ConditionalGetMixin, ExportMixin, DocumentCreateMixin, TransitionMixin, viewsets.ModelViewSet):
+    queryset = Receipt.objects.select_related('warehouse').prefetch_related(
+        Prefetch('items', queryset=ReceiptItem.objects.select_related('product'))
+    )
     serializer_class = ReceiptSerializer
+    depends_on = (Receipt, ReceiptItem, Product, Warehouse)
+    validate_document = staticmethod(Receipt.validate_receipt)
+    # Exports are one row per document line.
+    export_columns = (
+        ('receipt', 'receipt_id'), ('created_at', 'receipt__created_at'), ('status', 'receipt__status'),
+        ('supplier', 'receipt__supplier'), ('warehouse', 'receipt__warehouse__name'),
+        ('sku', 'product__sku'), ('product_name', 'product__name'), ('quantity', 'quantity'),
+    )
+
+    def get_export_queryset(self):
+        queryset = ReceiptItem.objects.all()
+        if self.request.query_params.get('status'):
+            queryset = queryset.filter(receipt__status=self.request.query_params['status'])
+        return queryset.order_by('receipt_id', 'id')
 
     @action(detail=True, methods=['post'])
     def validate(self, request, pk=None):
         receipt = self.get_object()
-        if receipt.status != Receipt.DRAFT:
-            return Response({"error": "Only draft receipts can be validated"}, status=400)
-
-        with transaction.atomic():
-            # 1. Update Status
-            receipt.status = Receipt.DONE
-            receipt.save()
-
-            # 2. Update Stock & Ledger
-            for item in receipt.items.all():
-                stock, created = Stock.objects.get_or_create(
-                    product=item.product, 
-                    warehouse=receipt.warehouse
-                )
-                stock.quantity += item.quantity
-                stock.save()
-
-                # Log to Ledger
-                StockLedger.objects.create(
-                    product=item.product,
-                    warehouse=receipt.warehouse,
-                    change=item.quantity,
-                    balance=stock.quantity,
-                    source_type='Receipt',
-                    source_id=receipt.id
-                )
+        if wants_async(request):
+            return accepted(request, 'validate', {'receipts': [receipt.pk]})
+        try:
+            receipt.validate_receipt()
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=400)
 
         return Response({"status": "Receipt Validated", "new_status": receipt.status})
 
-class ReceiptItemViewSet(viewsets.ModelViewSet):
-    queryset = ReceiptItem.objects.all()
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        return self.transition(request, Receipt.cancel)
+
+class ReceiptItemViewSet(TimedSerializerMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = ReceiptItem.objects.select_related('product')
     serializer_class = ReceiptItemSerializer
+    depends_on = (ReceiptItem, Product)
 
-class DeliveryOrderViewSet(viewsets.ModelViewSet):
-    queryset = DeliveryOrder.objects.all()
+class DeliveryOrderViewSet(TimedSerializerMixin, ConditionalGetMixin, ExportMixin, DocumentCreateMixin, TransitionMixin, viewsets.ModelViewSet):
+    queryset = DeliveryOrder.objects.select_related('warehouse').prefetch_related(
+        Prefetch('items', queryset=DeliveryItem.objects.select_related('product'))
+    )
     serializer_class = DeliveryOrderSerializer
+    depends_on = (DeliveryOrder, DeliveryItem, Product, Warehouse)
+    validate_document = staticmethod(DeliveryOrder.validate_delivery)
+    # Exports are one row per document line.
+    export_columns = (
+        ('delivery', 'delivery_id'), ('created_at', 'delivery__created_at'), ('status', 'delivery__status'),
+        ('customer', 'delivery__customer'), ('warehouse', 'delivery__warehouse__name'),
+        ('sku', 'product__sku'), ('product_name', 'product__name'), ('quantity', 'quantity'),
+    )
+
+    def get_export_queryset(self):
+        queryset = DeliveryItem.objects.all()
+        if self.request.query_params.get('status'):
+            queryset = queryset.filter(delivery__status=self.request.query_params['status'])
+        return queryset.order_by('delivery_id', 'id')
 
     @action(detail=True, methods=['post'])
     def validate(self, request, pk=None):
         delivery = self.get_object()
-        if delivery.status != DeliveryOrder.DRAFT:
-            return Response({"error": "Only draft deliveries can be validated"}, status=400)
-
-        with transaction.atomic():
-            # Check availability first
-            for item in delivery.items.all():
-                stock = Stock.objects.filter(product=item.product, warehouse=delivery.warehouse).first()
-                if not stock or stock.quantity < item.quantity:
-                    return Response(
-                        {"error": f"Insufficient stock for {item.product.name}"}, 
-                        status=400
-                    )
-
-            # Process Delivery
-            delivery.status = DeliveryOrder.DONE
-            delivery.save()
-
-            for item in delivery.items.all():
-                stock = Stock.objects.get(product=item.product, warehouse=delivery.warehouse)
-                stock.quantity -= item.quantity
-                stock.save()
-
-                StockLedger.objects.create(
-                    product=item.product,
-                    warehouse=delivery.warehouse,
-                    change=-item.quantity,
-                    balance=stock.quantity,
-                    source_type='Delivery',
-                    source_id=delivery.id
-                )
+        if wants_async(request):
+            return accepted(request, 'validate', {'deliveries': [delivery.pk]})
+        try:
+            delivery.validate_delivery()
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=400)
 
         return Response({"status": "Delivery Validated"})
 
-class DeliveryItemViewSet(viewsets.ModelViewSet):
-    queryset = DeliveryItem.objects.all()
+    @action(detail=True, methods=['post'])
+    def reserve(self, request, pk=None):
+        """Draft -> ready: reserves the delivery's lines, or fails if stock isn't available."""
+        return self.transition(request, DeliveryOrder.reserve)
+
+    @action(detail=True, methods=['post'])
+    def release(self, request, pk=None):
+        """Ready -> draft: gives the reserved stock back."""
+        return self.transition(request, DeliveryOrder.unreserve)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        return self.transition(request, DeliveryOrder.cancel)
+
+class DeliveryItemViewSet(TimedSerializerMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = DeliveryItem.objects.select_related('product')
     serializer_class = DeliveryItemSerializer
+    depends_on = (DeliveryItem, Product)
 
-class InternalTransferViewSet(viewsets.ModelViewSet):
-    queryset = InternalTransfer.objects.all()
+class InternalTransferViewSet(TimedSerializerMixin, ConditionalGetMixin, ExportMixin, DocumentCreateMixin, TransitionMixin, viewsets.ModelViewSet):
+    queryset = InternalTransfer.objects.select_related('from_warehouse', 'to_warehouse').prefetch_related(
+        Prefetch('items', queryset=TransferItem.objects.select_related('product'))
+    )
     serializer_class = InternalTransferSerializer
+    depends_on = (InternalTransfer, TransferItem, Product, Warehouse)
+    validate_document = staticmethod(InternalTransfer.validate_transfer)
+    # Exports are one row per document line.
+    export_columns = (
+        ('transfer', 'transfer_id'), ('created_at', 'transfer__created_at'), ('status', 'transfer__status'),
+        ('from_warehouse', 'transfer__from_warehouse__name'), ('to_warehouse', 'transfer__to_warehouse__name'),
+        ('sku', 'product__sku'), ('product_name', 'product__name'), ('quantity', 'quantity'),
+    )
+
+    def get_export_queryset(self):
+        queryset = TransferItem.objects.all()
+        if self.request.query_params.get('status'):
+            queryset = queryset.filter(transfer__status=self.request.query_params['status'])
+        return queryset.order_by('transfer_id', 'id')
 
     @action(detail=True, methods=['post'])
     def validate(self, request, pk=None):
         transfer = self.get_object()
-        if transfer.status != InternalTransfer.DRAFT:
-            return Response({"error": "Only draft transfers can be validated"}, status=400)
-
-        with transaction.atomic():
-            transfer.status = InternalTransfer.DONE
-            transfer.save()
-
-            for item in transfer.items.all():
-                # Decrease Source
-                source_stock, _ = Stock.objects.get_or_create(product=item.product, warehouse=transfer.from_warehouse)
-                if source_stock.quantity < item.quantity:
-                    return Response({"error": f"Insufficient stock in source for {item.product.name}"}, status=400)
-                
-                source_stock.quantity -= item.quantity
-                source_stock.save()
-                
-                StockLedger.objects.create(
-                    product=item.product, warehouse=transfer.from_warehouse,
-                    change=-item.quantity, balance=source_stock.quantity,
-                    source_type='Transfer Out', source_id=transfer.id
-                )
-
-                # Increase Dest
-                dest_stock, _ = Stock.objects.get_or_create(product=item.product, warehouse=transfer.to_warehouse)
-                dest_stock.quantity += item.quantity
-                dest_stock.save()
-
-                StockLedger.objects.create(
-                    product=item.product, warehouse=transfer.to_warehouse,
-                    change=item.quantity, balance=dest_stock.quantity,
-                    source_type='Transfer In', source_id=transfer.id
-                )
+        if wants_async(request):
+            return accepted(request, 'validate', {'transfers': [transfer.pk]})
+        try:
+            transfer.validate_transfer()
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=400)
 
         return Response({"status": "Transfer Validated"})
 
-class TransferItemViewSet(viewsets.ModelViewSet):
-    queryset = TransferItem.objects.all()
+    @action(detail=True, methods=['post'])
+    def reserve(self, request, pk=None):
+        """Draft -> waiting: reserves the transfer's lines at the source warehouse."""
+        return self.transition(request, InternalTransfer.reserve)
+
+    @action(detail=True, methods=['post'])
+    def release(self, request, pk=None):
+        """Waiting -> draft: gives the reserved stock back."""
+        return self.transition(request, InternalTransfer.unreserve)
+
+class TransferItemViewSet(TimedSerializerMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = TransferItem.objects.select_related('product')
     serializer_class = TransferItemSerializer
+    depends_on = (TransferItem, Product)
 
-class StockAdjustmentViewSet(viewsets.ModelViewSet):
-    queryset = StockAdjustment.objects.all()
+class StockAdjustmentViewSet(TimedSerializerMixin, ConditionalGetMixin, ExportMixin, viewsets.ModelViewSet):
+    queryset = StockAdjustment.objects.select_related('product', 'warehouse')
     serializer_class = StockAdjustmentSerializer
+    depends_on = (StockAdjustment, Product, Warehouse)
+    export_filters = ('warehouse', 'product')
+    export_columns = (
+        ('id', 'id'), ('created_at', 'created_at'), ('sku', 'product__sku'), ('product_name', 'product__name'),
+        ('warehouse', 'warehouse__name'), ('counted_quantity', 'counted_quantity'), ('reason', 'reason'),
+    )
     
     def perform_create(self, serializer):
         with transaction.atomic():
             adj = serializer.save()
-            stock, _ = Stock.objects.get_or_create(product=adj.product, warehouse=adj.warehouse)
-            
-            diff = adj.counted_quantity - stock.quantity
-            stock.quantity = adj.counted_quantity
-            stock.save()
-
-            StockLedger.objects.create(
-                product=adj.product, warehouse=adj.warehouse,
-                change=diff, balance=stock.quantity,
-                source_type='Adjustment', source_id=adj.id
-            )
+            post_adjustment(adj.product_id, adj.warehouse_id, adj.counted_quantity, adj.id)
 
-class StockLedgerViewSet(viewsets.ModelViewSet):
-    queryset = StockLedger.objects.all().order_by('-created_at')
+class StockLedgerViewSet(TimedSerializerMixin, ConditionalGetMixin, ExportMixin, viewsets.ModelViewSet):
+    queryset = StockLedger.objects.select_related('product', 'warehouse').order_by('-created_at', '-id')
     serializer_class = StockLedgerSerializer
+    depends_on = (StockLedger, Product, Warehouse)
+    pagination_class = KeysetPagination
+    export_columns = (
+        ('id', 'id'), ('created_at', 'created_at'), ('product', 'product_id'), ('sku', 'product__sku'),
+        ('product_name', 'product__name'), ('warehouse', 'warehouse_id'), ('warehouse_name', 'warehouse__name'),
+        ('change', 'change'), ('balance', 'balance'), ('source_type', 'source_type'), ('source_id', 'source_id'),
+    )
+
+    def get_queryset(self):
+        # Every filter lines up with a (column, created_at, id) index so the
+        # keyset pages stay index-only scans.
+        queryset = super().get_queryset()
+        params = self.request.query_params
+
+        for field in ('product', 'warehouse', 'source_type'):
+            if params.get(field):
+                queryset = queryset.filter(**{field: params[field]})
+        if params.get('start'):
+            queryset = queryset.filter(created_at__gte=parse_date_param(params, 'start'))
+        if params.get('end'):
+            queryset = queryset.filter(created_at__lt=parse_date_param(params, 'end', end_of_day=True))
+        return queryset
+
+class LowStockEventViewSet(TimedSerializerMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Outbox of low stock threshold crossings, newest first. ?pending=true lists
+    only events nobody has acknowledged yet; POST acknowledge/ marks them.
+    """
+    queryset = LowStockEvent.objects.select_related('product', 'warehouse').order_by('-created_at', '-id')
+    serializer_class = LowStockEventSerializer
+    pagination_class = KeysetPagination
+    depends_on = (LowStockEvent, Product, Warehouse)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        if params.get('pending') in ('1', 'true'):
+            queryset = queryset.filter(processed_at__isnull=True)
+        for field in ('product', 'warehouse', 'kind'):
+            if params.get(field):
+                queryset = queryset.filter(**{field: params[field]})
+        return queryset
+
+    @action(detail=False, methods=['post'])
+    def acknowledge(self, request):
+        """Marks events processed. Body: {"ids": [...]} or {"up_to": <id>}."""
+        ids, up_to = request.data.get('ids'), request.data.get('up_to')
+        pending = LowStockEvent.objects.filter(processed_at__isnull=True)
+        try:
+            if ids:
+                pending = pending.filter(pk__in=[int(pk) for pk in ids])
+            elif up_to:
+                pending = pending.filter(pk__lte=int(up_to))
+            else:
+                return Response({"error": "Provide ids or up_to."}, status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError):
+            return Response({"error": "ids and up_to must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        count = pending.update(processed_at=timezone.now())
+        bump_tables(LowStockEvent)
+        return Response({"acknowledged": count})
+
+class ReorderSuggestionViewSet(TimedSerializerMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Replenishment suggestions per product and warehouse. Only pairs that need
+    ordering are listed unless ?all=true; filter with ?warehouse= / ?product=.
+    """
+    queryset = ReorderSuggestion.objects.select_related('product', 'warehouse').order_by('warehouse_id', 'product_id')
+    serializer_class = ReorderSuggestionSerializer
+    depends_on = (ReorderSuggestion, Product, Warehouse)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        if self.action == 'list' and params.get('all') not in ('1', 'true'):
+            queryset = queryset.filter(suggested_quantity__gt=0)
+        for field in ('product', 'warehouse'):
+            if params.get(field):
+                queryset = queryset.filter(**{field: params[field]})
+        return queryset
+
+    @action(detail=False, methods=['post'])
+    def refresh(self, request):
+        """Recomputes the pairs with new ledger activity (?full=true for all)."""
+        full = request.query_params.get('full') in ('1', 'true')
+        if wants_async(request):
+            return accepted(request, 'refresh_reorder_suggestions', {'full': full})
+        return Response({"recomputed": refresh_suggestions(full=full)})
+
+class JobViewSet(TimedSerializerMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Background jobs queued by ?async=true requests, newest first (?status=
+    and ?kind= filter). Poll a job until it is DONE or FAILED.
+    """
+    queryset = Job.objects.order_by('-created_at', '-id')
+    serializer_class = JobSerializer
+    pagination_class = KeysetPagination
+    depends_on = (Job,)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for field in ('status', 'kind'):
+            if self.request.query_params.get(field):
+                queryset = queryset.filter(**{field: self.request.query_params[field]})
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """The file written by a finished export job."""
+        job = self.get_object()
+        name = (job.result or {}).get('file') if job.status == Job.DONE else None
+        path = settings.JOB_FILES_DIR / name if name else None
+        if path is None or not path.exists():
+            raise Http404("This job has no file to download.")
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
+
+class OperationBatchViewSet(viewsets.ViewSet):
+    """
+    Batch operations across receipts, deliveries and transfers.
+    """
+    @action(detail=False, methods=['post'])
+    def validate(self, request):
+        """
+        Validates many documents in one transaction. Body:
+        {"receipts": [...], "deliveries": [...], "transfers": [...], "partial": false}
+        Without `partial` nothing is posted unless every document succeeds.
+        """
+        serializer = BatchValidationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if wants_async(request):
+            return accepted(request, 'validate', data)
+
+        validated, errors = validate_batch(
+            {kind: data[kind] for kind in ('receipts', 'deliveries', 'transfers')},
+            partial=data['partial'],
+        )
+        failed = bool(errors) and not data['partial']
+        return Response(
+            {"validated": validated, "errors": errors},
+            status=status.HTTP_400_BAD_REQUEST if failed else status.HTTP_200_OK,
+        )
 
 # --- DASHBOARD API ---
 
-class DashboardStatsViewSet(viewsets.ViewSet):
+def add_months(day, months):
+    month = day.month - 1 + months
+    return day.replace(year=day.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def bucket_start(day, granularity):
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def next_bucket(day, granularity):
+    if granularity == 'month':
+        return add_months(day, 1)
+    return day + timedelta(days=7 if granularity == 'week' else 1)
+
+class DashboardStatsViewSet(ConditionalGetMixin, viewsets.ViewSet):
     """
     Returns KPIs for the Dashboard
     """
-    def list(self, request):
-        # 1. Total Products
-        total_products = Product.objects.count()
-
-        # 2. Low Stock Count
-        # models.F allows us to compare columns within the same database query
-        low_stock_count = Stock.objects.filter(
-            quantity__lt=models.F('product__low_stock_threshold')
-        ).count()
+    depends_on = (Product, Stock, Receipt, DeliveryOrder, InternalTransfer)
 
-        # 3. Pending Operations
-        pending_receipts = Receipt.objects.filter(status=Receipt.DRAFT).count()
-        pending_deliveries = DeliveryOrder.objects.filter(status=DeliveryOrder.DRAFT).count()
-        pending_transfers = InternalTransfer.objects.filter(status=InternalTransfer.DRAFT).count()
-
-        return Response({
-            "total_products": total_products,
-            "low_stock_items": low_stock_count,
-            "pending_receipts": pending_receipts,
-            "pending_deliveries": pending_deliveries,
-            "pending_transfers": pending_transfers
-        })
+    def list(self, request):
+        # Served from the DashboardSummary row that postings and status
+        # changes keep up to date (see inventory/kpis.py).
+        return self.conditional(request, lambda: Response(get_kpis()))
+
+    # granularity -> (database truncation, label format)
+    OVERVIEW_GRANULARITIES = {
+        'day': (TruncDay, "%d %b %Y"),
+        'week': (TruncWeek, "%d %b %Y"),
+        'month': (TruncMonth, "%b %Y"),
+    }
+    OVERVIEW_MAX_BUCKETS = 3660
 
     @action(detail=False, methods=['get'], url_path='operations-overview')
     def operations_overview(self, request):
         """
-        Returns monthly operations data for the last 6 months
+        Returns done receipts and deliveries per calendar day, week or month.
+
+        Query params: granularity (day|week|month, default month), start and
+        end (ISO dates, default the last 6 calendar months) and warehouse.
+        Each document type is counted in one grouped query.
         """
-        # Get receipts and deliveries by month
-        operations_data = []
-        
-        for i in range(6):
-            # Calculate the start and end of each month
-            month_start = timezone.now() - timedelta(days=30 * (5-i))
-            month_end = timezone.now() - timedelta(days=30 * (4-i))
-            
-            # Count receipts and deliveries for this month
-            receipts_count = Receipt.objects.filter(
-                created_at__gte=month_start,
-                created_at__lt=month_end,
-                status=Receipt.DONE
-            ).count()
-            
-            deliveries_count = DeliveryOrder.objects.filter(
-                created_at__gte=month_start,
-                created_at__lt=month_end,
-                status=DeliveryOrder.DONE
-            ).count()
-            
-            # Format month name
-            month_name = month_start.strftime("%b %Y")
-            
-            operations_data.append({
-                "period": month_name,
-                "receipts": receipts_count,
-                "deliveries": deliveries_count
-            })
-        
-        return Response(operations_data)
+        params = request.query_params
+        granularity = params.get('granularity', 'month')
+        if granularity not in self.OVERVIEW_GRANULARITIES:
+            raise serializers.ValidationError({"granularity": "Use day, week or month."})
+        trunc, label_format = self.OVERVIEW_GRANULARITIES[granularity]
+
+        today = timezone.localdate()
+        end = parse_date_param(params, 'end', end_of_day=True) if params.get('end') else timezone.now()
+        if params.get('start'):
+            start = parse_date_param(params, 'start')
+        else:
+            start = timezone.make_aware(datetime.combine(add_months(today.replace(day=1), -5), time.min))
+        if start >= end:
+            raise serializers.ValidationError({"start": "start must be before end."})
+
+        buckets = []
+        bucket = bucket_start(timezone.localtime(start).date(), granularity)
+        while timezone.make_aware(datetime.combine(bucket, time.min)) < end:
+            buckets.append(bucket)
+            bucket = next_bucket(bucket, granularity)
+            if len(buckets) > self.OVERVIEW_MAX_BUCKETS:
+                raise serializers.ValidationError({"granularity": "Range too large for this granularity."})
+
+        def counts(model):
+            queryset = model.objects.filter(status=model.DONE, created_at__gte=start, created_at__lt=end)
+            if params.get('warehouse'):
+                queryset = queryset.filter(warehouse=params['warehouse'])
+            rows = queryset.annotate(period=trunc('created_at')).values('period').annotate(total=Count('id'))
+            return {timezone.localtime(row['period']).date(): row['total'] for row in rows}
+
+        receipts = counts(Receipt)
+        deliveries = counts(DeliveryOrder)
+
+        return Response([
+            {
+                "period": bucket.strftime(label_format),
+                "start": bucket.isoformat(),
+                "receipts": receipts.get(bucket, 0),
+                "deliveries": deliveries.get(bucket, 0),
+            }
+            for bucket in buckets
+        ])
 
     @action(detail=False, methods=['get'], url_path='inventory-composition')
     def inventory_composition(self, request):
@@ -278,4 +810,88 @@ class DashboardStatsViewSet(viewsets.ViewSet):
                 "value": item['total_quantity']
             })
         
-        return Response(formatted_data)
\ No newline at end of file
+        return Response(formatted_data)
+
+
+class MovementSummaryViewSet(ConditionalGetMixin, viewsets.ViewSet):
+    """
+    Stock movement reports read from the DailyMovement rollup
+    (inventory/rollups.py) instead of the raw ledger. They trail the ledger
+    by however long ago `manage.py rollup_movements` (or POST refresh/) last
+    ran.
+
+    Query params: start and end (ISO dates, inclusive; default the last 12
+    calendar months), product, warehouse and source_type filters, and
+    group_by (product, warehouse or source_type) to split each row further.
+    """
+    depends_on = (DailyMovement,)
+
+    GRANULARITIES = {'day': None, 'week': TruncWeek, 'month': TruncMonth, 'year': TruncYear}
+    GROUPS = {
+        'product': ('product_id', 'product__sku', 'product__name'),
+        'warehouse': ('warehouse_id', 'warehouse__name'),
+        'source_type': ('source_type',),
+    }
+
+    def summary_queryset(self, request):
+        params = request.query_params
+        today = timezone.localdate()
+        try:
+            end = parse_date(params['end']) if params.get('end') else today
+            start = parse_date(params['start']) if params.get('start') else add_months(today.replace(day=1), -11)
+        except ValueError:
+            start = end = None
+        if start is None or end is None:
+            raise serializers.ValidationError({"start": "Enter valid ISO dates for start and end."})
+        if start > end:
+            raise serializers.ValidationError({"start": "start must not be after end."})
+
+        queryset = DailyMovement.objects.filter(day__gte=start, day__lte=end)
+        for field in ('product', 'warehouse', 'source_type'):
+            if params.get(field):
+                queryset = queryset.filter(**{field: params[field]})
+
+        group_by = params.get('group_by')
+        if group_by and group_by not in self.GROUPS:
+            raise serializers.ValidationError({"group_by": "Use product, warehouse or source_type."})
+        return queryset, self.GROUPS.get(group_by, ())
+
+    @staticmethod
+    def with_totals(rows):
+        return rows.annotate(quantity_in=Sum('quantity_in'), quantity_out=Sum('quantity_out'), entries=Sum('entries'))
+
+    @staticmethod
+    def with_net(rows):
+        return [{**row, 'net': row['quantity_in'] - row['quantity_out']} for row in rows]
+
+    def list(self, request):
+        """Movement per day, week, month or year (?granularity=, default month)."""
+        def render():
+            granularity = request.query_params.get('granularity', 'month')
+            if granularity not in self.GRANULARITIES:
+                raise serializers.ValidationError({"granularity": "Use day, week, month or year."})
+            queryset, group = self.summary_queryset(request)
+            trunc = self.GRANULARITIES[granularity]
+            rows = queryset.annotate(period=trunc('day') if trunc else models.F('day')).values('period', *group)
+            return Response(self.with_net(self.with_totals(rows).order_by('period', *group)))
+        return self.conditional(request, render)
+
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        """Totals over the range per group_by (default product), largest outflow first (?limit=, default 50)."""
+        def render():
+            try:
+                limit = max(1, min(int(request.query_params.get('limit', 50)), 1000))
+            except ValueError:
+                raise serializers.ValidationError({"limit": "Enter a whole number."})
+            queryset, group = self.summary_queryset(request)
+            rows = self.with_totals(queryset.values(*(group or self.GROUPS['product'])))
+            return Response(self.with_net(rows.order_by('-quantity_out', *(group or self.GROUPS['product']))[:limit]))
+        return self.conditional(request, render)
+
+    @action(detail=False, methods=['post'])
+    def refresh(self, request):
+        """Folds the ledger rows since the last run into the rollup."""
+        if wants_async(request):
+            return accepted(request, 'roll_up_movements', {})
+        return Response({"chunks": roll_up()})
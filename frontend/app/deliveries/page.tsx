@@ -87,26 +87,19 @@ export default function DeliveriesPage() {
       const token = localStorage.getItem("token")
       const headers = { "Content-Type": "application/json", Authorization: `Token ${token}` }
 
-      // A. Header
-      const res = await fetch("http://127.0.0.1:8000/api/deliveries/", {
+      // Header, lines and validation in one request (one transaction).
+      const res = await fetch("http://127.0.0.1:8000/api/deliveries/?validate=true", {
         method: "POST", headers,
-        body: JSON.stringify({ customer, warehouse, status: "draft" })
-      })
-      if (!res.ok) throw new Error("Failed header")
-      const delivery = await res.json()
-
-      // B. Items
-      for (const line of lines) {
-        await fetch("http://127.0.0.1:8000/api/delivery-items/", {
-          method: "POST", headers,
-          body: JSON.stringify({ delivery: delivery.id, product: line.product, quantity: line.quantity })
+        body: JSON.stringify({
+          customer, warehouse,
+          items: lines.map(line => ({ product: line.product, quantity: line.quantity })),
         })
-      }
-
-      // C. Validate
-      await fetch(`http://127.0.0.1:8000/api/deliveries/${delivery.id}/validate/`, {
-        method: "POST", headers: { Authorization: `Token ${token}` }
       })
+      if (!res.ok) {
+        const err = await res.json()
+        alert("Delivery Failed: " + (err.error || JSON.stringify(err)))
+        return
+      }
 
       alert("Delivery Created & Validated!")
       window.location.reload()
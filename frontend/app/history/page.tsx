@@ -27,7 +27,8 @@ export default function HistoryPage() {
         })
 
         if (response.ok) {
-          setLogs(await response.json())
+          const data = await response.json()
+          setLogs(data.results)
         }
       } catch (error) {
         console.error("Failed to fetch ledger", error)
@@ -82,26 +82,19 @@ export default function ReceiptsPage() {
       const token = localStorage.getItem("token")
       const headers = { "Content-Type": "application/json", Authorization: `Token ${token}` }
 
-      // 1. Header
-      const res = await fetch("http://127.0.0.1:8000/api/receipts/", {
+      // Header, lines and validation in one request (one transaction).
+      const res = await fetch("http://127.0.0.1:8000/api/receipts/?validate=true", {
         method: "POST", headers,
-        body: JSON.stringify({ supplier, warehouse, status: "draft" })
-      })
-      if (!res.ok) throw new Error("Failed header")
-      const newReceipt = await res.json()
-
-      // 2. Items
-      for (const line of lines) {
-        await fetch("http://127.0.0.1:8000/api/receipt-items/", {
-          method: "POST", headers,
-          body: JSON.stringify({ receipt: newReceipt.id, product: line.product, quantity: line.quantity })
+        body: JSON.stringify({
+          supplier, warehouse,
+          items: lines.map(line => ({ product: line.product, quantity: line.quantity })),
         })
-      }
-
-      // 3. Validate (Auto)
-      await fetch(`http://127.0.0.1:8000/api/receipts/${newReceipt.id}/validate/`, {
-          method: "POST", headers: { Authorization: `Token ${token}` }
       })
+      if (!res.ok) {
+        const err = await res.json()
+        alert("Receipt Failed: " + (err.error || JSON.stringify(err)))
+        return
+      }
 
       alert("Receipt Created & Validated!")
       window.location.reload()
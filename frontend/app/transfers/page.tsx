@@ -97,48 +97,25 @@ export default function TransfersPage() {
         Authorization: `Token ${token}` 
       }
 
-      // A. Create Header
-      const res = await fetch("http://127.0.0.1:8000/api/transfers/", {
+      // Header, lines and validation in one request (one transaction):
+      // if the stock can't be moved, nothing is saved.
+      const res = await fetch("http://127.0.0.1:8000/api/transfers/?validate=true", {
         method: "POST",
         headers,
-        body: JSON.stringify({ 
-            from_warehouse: fromWarehouse, 
-            to_warehouse: toWarehouse, 
-            status: "draft" 
+        body: JSON.stringify({
+            from_warehouse: fromWarehouse,
+            to_warehouse: toWarehouse,
+            items: lines.map(line => ({ product: line.product, quantity: line.quantity }))
         })
       })
 
-      if (!res.ok) throw new Error("Failed to create transfer header")
-      const transfer = await res.json()
-
-      // B. Create Items
-      for (const line of lines) {
-        await fetch("http://127.0.0.1:8000/api/transfer-items/", {
-          method: "POST",
-          headers,
-          body: JSON.stringify({
-            transfer: transfer.id,
-            product: line.product,
-            quantity: line.quantity
-          })
-        })
-      }
-
-      // C. Validate
-      const validateRes = await fetch(`http://127.0.0.1:8000/api/transfers/${transfer.id}/validate/`, {
-        method: "POST",
-        headers: { Authorization: `Token ${token}` }
-      })
-
-      if (validateRes.ok) {
+      if (res.ok) {
         alert("Transfer Created & Validated! Stock Moved.")
         setIsModalOpen(false)
         window.location.reload()
       } else {
-        const err = await validateRes.json()
-        alert("Created Draft, but Validation Failed: " + (err.error || "Unknown error"))
-        setIsModalOpen(false)
-        window.location.reload()
+        const err = await res.json()
+        alert("Transfer Failed: " + (err.error || JSON.stringify(err)))
       }
 
     } catch (error) {
@@ -119,6 +119,14 @@ export function Sidebar() {
 
   const handleLogout = () => {
     // 2. Implement your actual sign-out logic here (e.g., calling yourAuthHook.signOut())
+    const token = localStorage.getItem("token")
+    if (token) {
+      // Revoke the token server-side; the local sign-out doesn't wait for it.
+      fetch("http://127.0.0.1:8000/api/auth/logout/", {
+        method: "POST",
+        headers: { Authorization: `Token ${token}` },
+      }).catch(() => {})
+    }
     localStorage.removeItem("quicktrace_user") // Clear stored user data
     localStorage.removeItem("token")
     setCurrentUser(null) // Clear user state in the UI